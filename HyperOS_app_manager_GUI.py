@@ -1,180 +1,164 @@
-# Add this print statement at the very beginning of the file
-print("--- Script Loading Started ---")
-
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
-import subprocess
+from tkinter import ttk, scrolledtext
+import json
+import logging
+import os
 import sys
-import time
 import threading
+import time
 import traceback # Import traceback for detailed error printing
 
-# --- Internal Database of Known Bloatware/Removable Apps ---
-# This dictionary maps package names to a tuple: (Description, Safety Level, Category)
-# Safety Levels:
-#   SAFE: Generally safe to remove/disable without impacting core functions.
-#   CAUTION: May affect specific features, check if you use them.
-#   RISKY: Removing can cause instability, broken core functions, or bootloops. Proceed with extreme caution.
-# Categories:
-#   Android_System: Core Android OS components (can be risky)
-#   Google: Apps/Services from Google (some are core GMS, some are optional)
-#   Xiaomi: Apps/Services from Xiaomi/MIUI/HyperOS (mix of bloat and core)
-#   Facebook: Facebook suite of apps
-#   Other_ThirdParty: Other pre-installed non-Google, non-Xiaomi apps
-#   Manufacturer_Test: Factory/Carrier test apps
-#   Game: Pre-installed games or game-related services
-#
-# This list is based on common knowledge and previous user-provided lists.
-# It is NOT exhaustive of ALL possible bloatware or ALL Xiaomi apps.
-known_bloatware_db = {
-    # Android System Components (Often safe to remove if not used, but be aware)
-    "com.android.bluetoothmidiservice": ("Bluetooth MIDI Service", "SAFE", "Android_System"),
-    "com.android.calllogbackup": ("Android Call Log Backup Service", "SAFE", "Android_System"),
-    "com.android.cellbroadcastreceiver": ("Android Cell Broadcast Receiver (Emergency Alerts)", "CAUTION", "Android_System"), # Keep if you need emergency alerts
-    "com.android.cellbroadcastreceiver.overlay.common": ("Overlay for Cell Broadcast Receiver", "CAUTION", "Android_System"), # Keep if you need emergency alerts
-    "com.android.dreams.basic": ("Basic Screensaver", "SAFE", "Android_System"),
-    "com.android.dreams.phototable": ("Photo Table Screensaver", "SAFE", "Android_System"),
-    "com.android.managedprovisioning": ("Work Profile/Device Provisioning", "SAFE", "Android_System"), # Only if you don't use work profiles
-    "com.android.ons": ("OMA Notification Service (Carrier)", "CAUTION", "Android_System"), # Carrier specific, hard to judge universally
-    "com.android.providers.calendar": ("Android Calendar Storage", "RISKY", "Android_System"), # Essential for calendar apps
-    "com.android.providers.partnerbookmarks": ("Partner Bookmarks Provider", "SAFE", "Android_System"),
-    "com.android.providers.userdictionary": ("User Dictionary Storage", "SAFE", "Android_System"),
-    "com.android.sharedstoragebackup": ("Shared Storage Backup Service", "SAFE", "Android_System"),
-    "com.android.smspush": ("SMS Push Service (Carrier/Messaging)", "CAUTION", "Android_System"),
-    "com.android.theme.font.notoserifsource": ("Noto Serif Font", "SAFE", "Android_System"),
-    "com.android.traceur": ("System Tracing Tool (Developer)", "SAFE", "Android_System"),
-    "com.android.wallpaperbackup": ("Wallpaper Backup Service", "SAFE", "Android_System"),
-
-    # Facebook Apps (Common Third-Party Bloat)
-    "com.facebook.appmanager": ("Facebook App Manager", "SAFE", "Facebook"),
-    "com.facebook.katana": ("Facebook App", "SAFE", "Facebook"),
-    "com.facebook.services": ("Facebook Services", "SAFE", "Facebook"),
-    "com.facebook.system": ("Facebook System", "SAFE", "Facebook"),
-
-    # Other Third-Party Apps (Common Bloat)
-    "com.netflix.mediaclient": ("Netflix App", "SAFE", "Other_ThirdParty"),
-    "com.spotify.music": ("Spotify App", "SAFE", "Other_ThirdParty"), # Package name might vary
-    "com.ss.android.ugc.trill": ("TikTok App (Global)", "SAFE", "Other_ThirdParty"),
-    "org.ifaa.aidl.manager": ("IFAA Service (Payment/Authentication)", "SAFE", "Other_ThirdParty"),
-
-    # Manufacturer/Carrier Test Apps (Often Safe)
-    "com.fido.asm": ("FIDO ASM (Authentication)", "SAFE", "Manufacturer_Test"),
-    "com.goodix.gftest": ("Goodix Fingerprint Test", "SAFE", "Manufacturer_Test"),
-    "com.quicinc.voice.activation": ("Qualcomm Voice Activation", "SAFE", "Manufacturer_Test"), # If you don't use voice wake-up
-    "com.longcheertel.AutoTest": ("Longcheer Auto Test (Factory)", "SAFE", "Manufacturer_Test"),
-    "com.longcheertel.cit": ("Longcheer CIT (Factory Test)", "SAFE", "Manufacturer_Test"),
-    "com.longcheertel.sarauth": ("Longcheer SAR Auth (Factory)", "SAFE", "Manufacturer_Test"),
-
-    # Google Apps (Can be Bloat depending on usage, but core to Android/GMS)
-    "com.google.android.apps.photos": ("Google Photos App", "SAFE", "Google"), # If you use another gallery
-    "com.google.android.apps.restore": ("Google Restore", "SAFE", "Google"), # After initial setup
-    "com.google.android.apps.subscriptions.red": ("Google Subscriptions (YouTube Premium)", "SAFE", "Google"), # If you don't manage subs here
-    "com.google.android.apps.tachyon": ("Google Duo (Meet)", "SAFE", "Google"), # If you don't use Duo/Meet
-    "com.google.android.apps.turbo": ("Device Health Services / Adaptive Battery", "RISKY", "Google"), # Can impact battery management
-    "com.google.android.apps.wellbeing": ("Digital Wellbeing", "SAFE", "Google"),
-    "com.google.android.apps.youtube.music": ("YouTube Music App", "SAFE", "Google"), # If you use another music app
-    "com.google.android.as": ("Android System Intelligence", "CAUTION", "Google"), # Provides smart features like Live Caption
-    "com.google.android.as.oss": ("Android System Intelligence OSS", "CAUTION", "Google"), # Related to AS
-    "com.google.android.cellbroadcastreceiver": ("Google Cell Broadcast Receiver", "CAUTION", "Google"), # Emergency Alerts
-    "com.google.android.cellbroadcastservice": ("Google Cell Broadcast Service", "CAUTION", "Google"), # Emergency Alerts
-    "com.google.android.feedback": ("Google Feedback Service", "SAFE", "Google"),
-    "com.google.android.gms.location.history": ("Google Location History", "SAFE", "Google"), # If you don't use it
-    "com.google.android.gms.supervision": ("Google Family Link (Supervision)", "SAFE", "Google"), # If you don't use Family Link
-    "com.google.android.googlequicksearchbox": ("Google App / Search / Assistant", "CAUTION", "Google"), # Core Google features
-    "com.google.android.ims": ("IMS Service (VoLTE/VoWiFi)", "RISKY", "Google"), # Can break calls
-    "com.google.android.marvin.talkback": ("TalkBack (Accessibility)", "SAFE", "Google"), # Unless you need it
-    "com.google.android.onetimeinitializer": ("One Time Initializer", "SAFE", "Google"), # After setup
-    "com.google.android.partnersetup": ("Partner Setup", "SAFE", "Google"), # After setup
-    "com.google.android.printservice.recommendation": ("Print Service Recommendation", "SAFE", "Google"),
-    "com.google.android.projection.gearhead": ("Android Auto", "SAFE", "Google"), # If you don't use Android Auto
-    "com.google.android.syncadapters.calendar": ("Google Calendar Sync", "CAUTION", "Google"), # Breaks Google Calendar sync
-    "com.google.android.tts": ("Google Text-to-speech", "SAFE", "Google"), # If you use another TTS engine or none
-    "com.google.android.videos": ("Google TV (Play Movies)", "SAFE", "Google"), # If you don't use Google TV
-    "com.google.android.youtube": ("YouTube App", "SAFE", "Google"), # If you use browser or another app
-
-    # Xiaomi/MIUI/HyperOS Apps (Mix of Bloat and Core Components)
-    "android.autoinstalls.config.Xiaomi.model": ("Xiaomi Auto Installs Config", "SAFE", "Xiaomi"), # After initial setup
-    "com.mi.globalbrowser": ("Mi Browser (Global)", "SAFE", "Xiaomi"), # If you use another browser
-    "com.mi.globalminusscreen": ("App Vault", "SAFE", "Xiaomi"), # If you don't use App Vault
-    "com.miui.analytics": ("MIUI/HyperOS Analytics", "SAFE", "Xiaomi"), # Stops sending usage data
-    "com.miui.audioeffect": ("MIUI/HyperOS Audio Effects", "SAFE", "Xiaomi"), # If you don't use them
-    "com.miui.audiomonitor": ("MIUI/HyperOS Audio Monitor", "SAFE", "Xiaomi"), # If you don't use voice features
-    "com.miui.backup": ("MIUI/HyperOS Backup", "SAFE", "Xiaomi"), # If you use other backup methods
-    "com.miui.bugreport": ("MIUI/HyperOS Bug Report", "SAFE", "Xiaomi"),
-    "com.miui.cleaner": ("MIUI/HyperOS Cleaner", "SAFE", "Xiaomi"),
-    "com.miui.cloudbackup": ("Mi Cloud Backup", "SAFE", "Xiaomi"), # If you use other backup methods
-    "com.miui.cloudservice": ("Mi Cloud Services", "SAFE", "Xiaomi"), # If you don't use Mi Cloud
-    "com.miui.daemon": ("MIUI/HyperOS Daemon", "RISKY", "Xiaomi"), # Can cause instability
-    "com.miui.global.packageinstaller": ("MIUI/HyperOS Package Installer", "RISKY", "Xiaomi"), # ESSENTIAL - DO NOT REMOVE
-    "com.miui.micloudsync": ("Mi Cloud Sync", "SAFE", "Xiaomi"), # If you don't use Mi Cloud sync
-    "com.miui.miservice": ("Mi Service / Xiaomi Service", "SAFE", "Xiaomi"), # Often not critical
-    "com.miui.msa.global": ("MSA (MIUI System Ads - Global)", "SAFE", "Xiaomi"), # Major source of ads - Highly Recommended
-    "com.miui.phrase": ("Quick Phrases / Smart Assistant", "SAFE", "Xiaomi"), # If you don't use these features
-    "com.miui.yellowpage": ("Yellow Pages / Dialer Features", "SAFE", "Xiaomi"), # If you don't use these features
-    "com.xiaomi.calendar": ("Xiaomi Calendar App", "SAFE", "Xiaomi"), # If you use another calendar
-    "com.xiaomi.glgm": ("Xiaomi Game Center / Service", "GAME", "Xiaomi"), # Game related service - Marked as GAME category
-    "com.xiaomi.mipicks": ("GetApps (Xiaomi App Store)", "SAFE", "Xiaomi"), # If you use Google Play Store
-    "com.xiaomi.mircs": ("Mi RCS Service", "CAUTION", "Xiaomi"), # May affect Xiaomi messaging features
-    "com.xiaomi.mtb": ("Mi Telephony/Messaging Component", "CAUTION", "Xiaomi"), # Related to basic phone functions
-    "com.xiaomi.payment": ("Xiaomi Payment / Mi Pay", "SAFE", "Xiaomi"), # If you don't use this service
-    "com.xiaomi.simactivate.service": ("SIM Activation Service", "SAFE", "Xiaomi"), # After SIM activated
-    "com.xiaomi.xmsf": ("Xiaomi Messaging Framework (Core)", "RISKY", "Xiaomi"), # Breaks Mi Account, push notifications
-    "com.xiaomi.xmsfkeeper": ("Xiaomi Messaging Framework Keeper", "RISKY", "Xiaomi"), # Related to XMSF
-
-    # Add potential game package names you find here, with description, safety, and category ("Game")
-    # Use a package name viewer app or adb shell pm list packages on your phone
-    # "com.example.preinstalled_game1": ("Example Preinstalled Game 1", "SAFE", "Game"),
-    # "com.example.preinstalled_game2": ("Example Preinstalled Game 2", "SAFE", "Game"),
-}
-
-# Add print to confirm database is loaded
-print("--- Database loaded ---")
-
-# --- Helper function to run ADB commands ---
-# This function now returns a dict indicating success or failure,
-# including stdout/stderr and returncode on success, or error details on failure.
-def run_adb_command(command, package_name="N/A", step_desc="execute command"):
-    """Runs an ADB command and returns a dict indicating success or failure."""
+# The bloatware database, ADB helpers and scan/plan/apply logic live in hyperos_engine.py,
+# so they can also be used without a GUI (see hyperos_cli.py). This file is only the Tkinter front-end.
+# Importing this file has no side effects: hyperos_engine (and through it the catalog) is only
+# imported once the window is on screen (see _finish_startup and the engine property), and the
+# dialogs (messagebox, filedialog) when they are first shown.
+from hyperos_jobs import JobCancelled, JobController
+
+# Console diagnostics go through logging; the level is set with --log-level or HYPEROS_LOG_LEVEL (default WARNING)
+log = logging.getLogger("hyperos_app_manager.gui")
+
+
+# --- Buffered Status Log ---
+# Updating the ScrolledText for every single message (enable, insert, scroll, disable,
+# update_idletasks) stalls the UI when worker threads report dozens of lines per package.
+# Messages are instead collected in a thread-safe buffer and written to the widget in one
+# batch on a fixed timer. The widget only keeps the last max_lines lines (ring buffer);
+# the complete log is appended to a file on disk.
+STATUS_LOG_MAX_LINES = 2000 # Lines kept in the status widget
+STATUS_FLUSH_INTERVAL_MS = 100 # How often buffered messages are written to the widget
+# The logs folder of hyperos_engine.APP_DATA_DIR, resolved the same way here so that the first
+# flush does not have to import the engine
+STATUS_LOG_DIR = os.path.join(os.environ.get("HYPEROS_APP_MANAGER_HOME") or os.path.join(os.path.expanduser("~"), ".hyperos_app_manager"), "logs")
+
+class BufferedStatusLog:
+    """Thread-safe, batched, size-capped sink for the status ScrolledText."""
+
+    def __init__(self, master, widget, log_dir, max_lines=STATUS_LOG_MAX_LINES, flush_interval_ms=STATUS_FLUSH_INTERVAL_MS):
+        self.master = master
+        self.widget = widget
+        self.max_lines = max_lines
+        self.flush_interval_ms = flush_interval_ms
+        self._pending = []
+        self._lock = threading.Lock()
+        self._line_count = 1 # A Tk Text widget always contains one (empty) line
+        self.log_dir = log_dir # Where the complete log is written (one file per session)
+        self.log_path = None
+        self._log_file = None
+        self._log_file_opened = False # The file is opened on the first flush, not during startup
+        self.master.after(self.flush_interval_ms, self._flush_periodically)
+
+    def _open_log_file(self):
+        self._log_file_opened = True
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.log_path = os.path.join(self.log_dir, time.strftime("status_%Y%m%d_%H%M%S.log"))
+            self._log_file = open(self.log_path, "a", encoding="utf-8")
+        except OSError as e:
+            log.warning("Could not open status log file: %s", e) # The GUI log still works without it
+
+    def write(self, message):
+        """Queues a message. Safe to call from any thread."""
+        with self._lock:
+            self._pending.append(message + "\n")
+
+    def _flush_periodically(self):
+        try:
+            self.flush()
+        finally:
+            self.master.after(self.flush_interval_ms, self._flush_periodically)
+
+    def flush(self):
+        """Writes all queued messages to the widget and the log file (run in main GUI thread)."""
+        with self._lock:
+            if not self._pending:
+                return
+            text = "".join(self._pending)
+            self._pending = []
+
+        if not self._log_file_opened:
+            self._open_log_file()
+        if self._log_file:
+            try:
+                self._log_file.write(text)
+                self._log_file.flush()
+            except OSError:
+                pass
+
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, text)
+        self._line_count += text.count("\n")
+        excess = self._line_count - self.max_lines
+        if excess > 0:
+            # Drop the oldest lines in one delete call
+            self.widget.delete("1.0", f"{excess + 1}.0")
+            self._line_count -= excess
+        self.widget.see(tk.END) # Auto-scroll to the bottom
+        self.widget.config(state=tk.DISABLED)
+
+    def close(self):
+        self.flush()
+        if self._log_file:
+            self._log_file.close()
+            self._log_file = None
+
+
+STATS_REFRESH_INTERVAL_MS = 1000 # How often the open ADB command stats panel is redrawn
+SEARCH_DEBOUNCE_MS = 150 # The list is re-filtered this long after the last keystroke in the search box
+
+
+# --- Startup Time ---
+# The time from process start to the first frame on screen is measured on every start and
+# compared with a budget (HYPEROS_STARTUP_BUDGET_MS, default 1500 ms, sized for the slower
+# bench PCs running the frozen .exe). 'HyperOS_app_manager_GUI.py --startup-check' opens the
+# window, prints the measurement as JSON and exits with code 1 when over budget.
+_MODULE_LOADED_AT = time.time()
+
+def _startup_budget_ms():
+    try:
+        return int(os.environ.get("HYPEROS_STARTUP_BUDGET_MS") or 1500)
+    except ValueError:
+        return 1500
+
+STARTUP_BUDGET_MS = _startup_budget_ms()
+
+def process_start_time():
+    """time.time() at which this process was created; falls back to when this module was loaded."""
     try:
-        # print(f"  Executing: {' '.join(command)}") # Uncomment for verbose ADB commands
-        # Use Popen to manage the process. CREATE_NO_WINDOW prevents a console window from flashing.
-        # stderr is directed to stdout so we capture all command output in stdout.
-        # Added creationflags for Windows
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-
-        # Use communicate with timeout to avoid deadlocks and handle timeout
-        stdout, _ = process.communicate(timeout=60)
-        returncode = process.returncode
-
-        # Command completed without Python exception or timeout.
-        return {"error": False, "returncode": returncode, "stdout": stdout, "stderr": ""} # Return stderr as empty string as it's captured in stdout
-
-    except FileNotFoundError:
-        # This error happens if the 'adb' executable itself is not found
-        return {"error": True, "type": "ADB_NOT_FOUND", "message": f"\nError: ADB command 'adb' not found. Ensure ADB is in your system's PATH.\n"}
-    except subprocess.TimeoutExpired:
-        # This error happens if the command times out
-        try: # Try to terminate gracefully first
-            process.terminate()
-            stdout, _ = process.communicate(timeout=5) # Read any remaining output
-        except: # If terminate fails, kill
-            process.kill()
-            stdout, _ = process.communicate(timeout=5) # Read any remaining output
-
-        return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": stdout} # Include partial output
-
-    except Exception as e:
-        # Catch any other unexpected Python-level errors during subprocess creation/communication
-        return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error during subprocess for {step_desc} {package_name}: {e}\nTraceback:\n{traceback.format_exc()}\n"}
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+            kernel32 = ctypes.windll.kernel32
+            if kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)):
+                ticks = (creation.dwHighDateTime << 32) | creation.dwLowDateTime # 100 ns units since 1601-01-01
+                return ticks / 1e7 - 11644473600
+        elif sys.platform.startswith("linux"):
+            with open("/proc/self/stat") as f:
+                start_ticks = int(f.read().rsplit(")", 1)[1].split()[19]) # Field 22: start time after boot, in clock ticks
+            with open("/proc/uptime") as f:
+                uptime = float(f.read().split()[0])
+            return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        pass
+    return _MODULE_LOADED_AT
 
 
 # --- GUI Application Class ---
 class HyperOSAppManagerGUI:
-    def __init__(self, master):
-        # Add a print to confirm we enter __init__
-        print("--- Entering HyperOSAppManagerGUI __init__ ---")
+    def __init__(self, master, exit_after_startup=False, engine_options=None):
+        log.debug("Building the main window")
         self.master = master
-        master.title("HyperOS App Manager")
+        self.exit_after_startup = exit_after_startup # --startup-check: close once the first frame is drawn
+        self.startup_ms = None # Process start -> first frame, set by _finish_startup
+        # Extra AppManagerEngine arguments: record / replay / time_scale from the command line
+        self.engine_options = engine_options or {}
+        title = "HyperOS App Manager"
+        if self.engine_options.get("replay") is not None:
+            title += f" - replaying {os.path.basename(self.engine_options['replay'].path or 'transcript')} (offline, no phone is changed)"
+        elif self.engine_options.get("record"):
+            title += f" - recording to {os.path.basename(self.engine_options['record'])}"
+        master.title(title)
         # Set minimum window size (optional)
         master.minsize(800, 600)
 
@@ -214,33 +198,73 @@ class HyperOSAppManagerGUI:
         # --- Selection Buttons ---
         self.select_all_button = ttk.Button(self.controls_frame, text="Select All", command=self.select_all_apps, state=tk.DISABLED)
         self.select_all_button.grid(row=0, column=2, padx=5, pady=5)
-        print("--- select_all_button created ---") # Added print
 
         self.select_none_button = ttk.Button(self.controls_frame, text="Select None", command=self.select_none_apps, state=tk.DISABLED)
         self.select_none_button.grid(row=0, column=3, padx=5, pady=5)
-        print("--- select_none_button created ---") # Added print
 
         self.select_safe_button = ttk.Button(self.controls_frame, text="Select Safe", command=lambda: self.select_by_safety("SAFE"), state=tk.DISABLED)
         self.select_safe_button.grid(row=0, column=4, padx=5, pady=5)
-        print("--- select_safe_button created ---") # Added print
 
 
         self.select_caution_button = ttk.Button(self.controls_frame, text="Select Caution", command=lambda: self.select_by_safety("CAUTION"), state=tk.DISABLED)
         self.select_caution_button.grid(row=0, column=5, padx=5, pady=5)
-        print("--- select_caution_button created ---") # Added print
 
         self.select_risky_button = ttk.Button(self.controls_frame, text="Select Risky", command=lambda: self.select_by_safety("RISKY"), state=tk.DISABLED)
         self.select_risky_button.grid(row=0, column=6, padx=5, pady=5)
-        print("--- select_risky_button created ---") # Added print
 
-
-        # Add category selection combobox/buttons if desired (more complex layout)
-        # self.category_label = ttk.Label(self.filter_frame, text="Select Category:")
-        # self.category_label.grid(row=1, column=0, padx=5, pady=5)
-        # categories = sorted(list(set(info[2] for info in known_bloatware_db.values())))
-        # self.category_combobox = ttk.Combobox(self.filter_frame, values=categories, state="readonly", width=15)
-        # self.category_combobox.grid(row=1, column=1, padx=5, pady=5)
-        # self.category_combobox.bind("<<ComboboxSelected>>", lambda event: self._apply_filters())
+        # Batch mode: run the whole selection as one device-side script (one round-trip)
+        self.batch_mode_var = tk.BooleanVar(value=True)
+        self.batch_mode_check = ttk.Checkbutton(self.controls_frame, text="Batch mode", variable=self.batch_mode_var)
+        self.batch_mode_check.grid(row=0, column=7, padx=5, pady=5)
+
+        # Save/load a selection (e.g. to repeat the same choice on the next phone)
+        self.export_selection_button = ttk.Button(self.controls_frame, text="Export Selection...", command=self.export_selection, state=tk.DISABLED)
+        self.export_selection_button.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.import_selection_button = ttk.Button(self.controls_frame, text="Import Selection...", command=self.import_selection, state=tk.DISABLED)
+        self.import_selection_button.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+        # Full rescan: ignore the per-device scan cache and fetch every package list again
+        self.full_rescan_var = tk.BooleanVar(value=False)
+        self.full_rescan_check = ttk.Checkbutton(self.controls_frame, text="Full rescan", variable=self.full_rescan_var)
+        self.full_rescan_check.grid(row=1, column=2, padx=5, pady=5)
+
+        # Job control: pause/resume or cancel the running scan/process job
+        self.pause_button = ttk.Button(self.controls_frame, text="Pause", command=self.toggle_pause_job, state=tk.DISABLED)
+        self.pause_button.grid(row=1, column=3, padx=5, pady=5)
+        self.cancel_button = ttk.Button(self.controls_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.grid(row=1, column=4, padx=5, pady=5)
+
+        # Undo journaled uninstalls/disables (selected apps, or everything on the target devices)
+        self.restore_button = ttk.Button(self.controls_frame, text="Restore...", command=self.start_restore)
+        self.restore_button.grid(row=1, column=5, padx=5, pady=5)
+
+        # Per-command ADB latency/error counters (see hyperos_metrics.py)
+        self.stats_button = ttk.Button(self.controls_frame, text="Stats", command=self.show_stats_window)
+        self.stats_button.grid(row=1, column=6, padx=5, pady=5)
+
+        # Debloat profiles: named selections stored as files, resolved against each scanned device (see hyperos_profiles.py)
+        self.profile_label = ttk.Label(self.controls_frame, text="Profile:")
+        self.profile_label.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        # The list is read from disk when the dropdown opens, not at startup
+        self.profile_combobox = ttk.Combobox(self.controls_frame, values=[], state="readonly", width=22, postcommand=self._refresh_profile_list)
+        self.profile_combobox.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        self.apply_profile_button = ttk.Button(self.controls_frame, text="Apply Profile...", command=self.start_profile, state=tk.DISABLED)
+        self.apply_profile_button.grid(row=2, column=2, padx=5, pady=5)
+        self.save_profile_button = ttk.Button(self.controls_frame, text="Save as Profile...", command=self.save_selection_as_profile, state=tk.DISABLED)
+        self.save_profile_button.grid(row=2, column=3, padx=5, pady=5)
+
+        # Compare the saved per-device scan snapshots: who still has an app, device diffs, drift (see hyperos_fleet.py)
+        self.fleet_button = ttk.Button(self.controls_frame, text="Fleet...", command=self.show_fleet_window)
+        self.fleet_button.grid(row=2, column=4, padx=5, pady=5)
+
+
+        # Category selection combobox: selects every listed app of the chosen category
+        self.category_label = ttk.Label(self.filter_frame, text="Select Category:")
+        self.category_label.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        # Categories will be populated after scan
+        self.category_combobox = ttk.Combobox(self.filter_frame, values=[], state="readonly", width=15)
+        self.category_combobox.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        self.category_combobox.bind("<<ComboboxSelected>>", lambda event: self.select_by_category(self.category_combobox.get()))
 
 
         # --- Filter Controls ---
@@ -261,13 +285,35 @@ class HyperOSAppManagerGUI:
         self.category_filter_combobox.grid(row=0, column=3, padx=5, pady=5, sticky="w")
         self.category_filter_combobox.bind("<<ComboboxSelected>>", lambda event: self._apply_filters())
 
+        self.filter_device_label = ttk.Label(self.filter_frame, text="Filter Device:")
+        self.filter_device_label.grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        # Device serials will be populated after scan ("All" = every connected device)
+        self.device_filter_options = ["All"]
+        self.device_filter_combobox = ttk.Combobox(self.filter_frame, values=self.device_filter_options, state="readonly", width=18)
+        self.device_filter_combobox.set("All")
+        self.device_filter_combobox.grid(row=0, column=5, padx=5, pady=5, sticky="w")
+        self.device_filter_combobox.bind("<<ComboboxSelected>>", lambda event: self._apply_filters())
+
+        # Search box: filters as you type over package name, description and category (see hyperos_search.py)
+        self.search_label = ttk.Label(self.filter_frame, text="Search:")
+        self.search_label.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.filter_frame, textvariable=self.search_var)
+        self.search_entry.grid(row=1, column=1, columnspan=5, padx=5, pady=5, sticky="ew")
+        self.search_var.trace_add("write", self._on_search_changed)
+        self.search_entry.bind("<Return>", lambda event: self._apply_search()) # No need to wait for the debounce
+        self.search_entry.bind("<Escape>", lambda event: self.search_var.set(""))
+        self.search_index = None # SearchIndex over all_installed_bloatware, built by the scan job
+        self._search_after_id = None # Pending debounced re-filter
+
         # Allow filter frame columns to expand slightly
         self.filter_frame.grid_columnconfigure(1, weight=1)
         self.filter_frame.grid_columnconfigure(3, weight=1)
+        self.filter_frame.grid_columnconfigure(5, weight=1)
 
 
         # --- App List (Treeview) ---
-        self.tree = ttk.Treeview(self.list_frame, columns=("Package", "Safety", "Category", "Description"), show="headings")
+        self.tree = ttk.Treeview(self.list_frame, columns=("Package", "Safety", "Category", "State", "Devices", "Description"), show="headings")
         self.tree.grid(row=0, column=0, sticky="nsew")
 
         # Define columns and headings
@@ -275,12 +321,16 @@ class HyperOSAppManagerGUI:
         self.tree.heading("Package", text="Package Name", anchor=tk.W)
         self.tree.heading("Safety", text="Safety", anchor=tk.W)
         self.tree.heading("Category", text="Category", anchor=tk.W)
+        self.tree.heading("State", text="State", anchor=tk.W) # Enabled / Disabled / Uninstalled for user 0 ("Mixed" across devices)
+        self.tree.heading("Devices", text="Devices", anchor=tk.W) # "found on / scanned" device count
         self.tree.heading("Description", text="Description", anchor=tk.W)
 
         # Define column widths (adjust as needed)
         self.tree.column("Package", width=250, stretch=tk.YES)
         self.tree.column("Safety", width=80, stretch=tk.NO)
         self.tree.column("Category", width=100, stretch=tk.NO)
+        self.tree.column("State", width=85, stretch=tk.NO)
+        self.tree.column("Devices", width=60, stretch=tk.NO)
         self.tree.column("Description", width=300, stretch=tk.YES) # Description can take more space
 
         # Scrollbar
@@ -292,8 +342,30 @@ class HyperOSAppManagerGUI:
         self.list_frame.grid_rowconfigure(0, weight=1)
 
         # Store package names mapped to Treeview item IDs
+        # Rows are created once per scan with the package name as item ID; filtering only
+        # detaches/reattaches them (see _populate_tree and _apply_filters).
         self._item_packages = {} # Maps Treeview item ID to package name
-        self.all_installed_bloatware = {} # Store the full list after scan
+        self._sorted_packages = [] # All scanned packages, sorted once per scan
+        self._visible_packages = [] # Packages currently attached to the Treeview, in display order
+
+        # Selection model: the selected package names live in Python, not in Treeview tags.
+        # Indexes per safety level / category are built once per scan, so bulk selection is
+        # plain set arithmetic followed by one batched tag refresh (_refresh_selection_tags).
+        self.selected_packages = set()
+        self._tagged_selected = set() # Packages currently carrying the 'selected' tag in the widget
+        self._packages_by_safety = {} # Maps safety level to a set of package names
+        self._packages_by_category = {} # Maps category to a set of package names
+        self.all_installed_bloatware = {} # Store the full list after scan (union over all devices)
+        self.device_bloatware = {} # Maps device serial to the set of known bloatware packages found on it
+        self.device_states = {} # Maps device serial to {package: "ENABLED"/"DISABLED"/"UNINSTALLED"}
+
+        # Headless engine doing the actual ADB work; it reports back through _device_status.
+        # Created on first use (see the engine property), after the window is up.
+        self._engine = None
+        # Scans and process runs are queued as jobs so they can be paused and cancelled
+        self.jobs = JobController()
+        self.current_job = None
+        self.stats_window = None # ADB command stats panel, while open
 
         # Bind click event to toggle selection state (visual feedback needed)
         self.tree.bind("<ButtonRelease-1>", self._on_item_click)
@@ -307,13 +379,69 @@ class HyperOSAppManagerGUI:
         self.status_log = scrolledtext.ScrolledText(self.status_frame, height=8, state=tk.DISABLED, wrap=tk.WORD, font=('Courier New', 9)) # Using Courier New for better alignment
         self.status_log.grid(row=0, column=0, sticky="ew")
         self.status_frame.grid_columnconfigure(0, weight=1)
+        # All messages go through this buffered sink (see BufferedStatusLog)
+        self.status_sink = BufferedStatusLog(master, self.status_log, STATUS_LOG_DIR)
+
+        # Aggregate progress across all devices (scan: devices done, process: packages done)
+        self.progress_frame = ttk.Frame(self.status_frame)
+        self.progress_frame.grid(row=1, column=0, sticky="ew", pady=(5, 0))
+        self.progress_frame.grid_columnconfigure(0, weight=1)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, orient="horizontal", mode="determinate")
+        self.progress_bar.grid(row=0, column=0, sticky="ew")
+        self.progress_label = ttk.Label(self.progress_frame, text="Idle", width=40)
+        self.progress_label.grid(row=0, column=1, padx=5, sticky="e")
+        self._progress_text = ""
 
         # Initial state
         self.print_status("HyperOS App Manager GUI ready.\nConnect your phone, enable USB debugging, authorize your computer, and click 'Connect & Scan Apps'.")
         self.print_status("Ensure ADB is installed and in your system PATH.")
         self.print_status("Click on a row to select/deselect it (highlighted in blue). Use filter options above.")
-        # Add print to confirm __init__ finished
-        print("--- HyperOS_AppManagerGUI __init__ finished ---")
+        # Everything the first frame does not need is loaded once it is on screen
+        self._first_frame_binding = master.bind("<Expose>", self._on_first_expose, add="+")
+        log.debug("Main window built")
+
+
+    # --- Deferred Startup ---
+    @property
+    def engine(self):
+        """The AppManagerEngine; hyperos_engine is imported when it is first needed."""
+        if self._engine is None:
+            from hyperos_engine import AppManagerEngine
+            self._engine = AppManagerEngine(on_status=self._device_status, **self.engine_options)
+        return self._engine
+
+    def _on_first_expose(self, event):
+        if self._first_frame_binding is None:
+            return
+        self.master.unbind("<Expose>", self._first_frame_binding)
+        self._first_frame_binding = None
+        self.master.after_idle(self._finish_startup) # After the pending redraws
+
+    def _finish_startup(self):
+        """Runs once the first frame is drawn: records the startup time, then loads the catalog in the background."""
+        self.startup_ms = (time.time() - process_start_time()) * 1000
+        log.info("First frame drawn %.0f ms after process start (budget %d ms)", self.startup_ms, STARTUP_BUDGET_MS)
+        if self.startup_ms > STARTUP_BUDGET_MS:
+            log.warning("Startup took %.0f ms, over the %d ms budget", self.startup_ms, STARTUP_BUDGET_MS)
+        if self.exit_after_startup:
+            self.master.after(0, self.master.destroy)
+            return
+        threading.Thread(target=self._load_catalog_task, daemon=True).start()
+
+    def _load_catalog_task(self):
+        """Loads the catalog in a worker thread so the first scan does not have to wait for it."""
+        try:
+            from hyperos_engine import get_catalog
+            catalog, info = get_catalog()
+        except Exception:
+            log.exception("Could not load the catalog")
+            return
+        log.debug("Catalog %s loaded: %d entries", info["version"], len(catalog))
+        self.master.after(0, self._on_catalog_loaded, info)
+
+    def _on_catalog_loaded(self, info):
+        for warning in info["warnings"]: # Problems found in the catalog files (see hyperos_catalog.py)
+            self.print_status("Catalog warning: " + warning)
 
 
     def _configure_tree_tags(self):
@@ -321,147 +449,148 @@ class HyperOSAppManagerGUI:
         if not self.tree_tags_configured:
             self.tree.tag_configure('risky_tag', foreground='red')
             self.tree.tag_configure('caution_tag', foreground='orange')
+            self.tree.tag_configure('handled_tag', foreground='gray') # Already uninstalled/disabled everywhere
             self.tree.tag_configure('selected', background='lightblue') # Keep selection highlight
             self.tree_tags_configured = True
 
 
     # --- Status Logging Helper ---
     def print_status(self, message):
-        self.status_log.config(state=tk.NORMAL)
-        self.status_log.insert(tk.END, message + "\n")
-        self.status_log.see(tk.END) # Auto-scroll to the bottom
-        self.status_log.config(state=tk.DISABLED)
-        self.master.update_idletasks() # Update GUI immediately # Ensure GUI updates
-
-
-    # --- ADB Command Runner (Threaded) ---
-    # This function now returns a dict indicating success or failure,
-    # including stdout/stderr and returncode on success, or error details on failure.
-    def run_adb_command(self, command, package_name="N/A", step_desc="execute command"):
-        """Runs an ADB command and returns a dict indicating success or failure."""
-        try:
-            # print(f"  Executing: {' '.join(command)}") # Uncomment for verbose ADB commands
-            # Use Popen to manage the process. CREATE_NO_WINDOW prevents a console window from flashing.
-            # stderr is directed to stdout so we capture all command output in stdout.
-            # Added creationflags for Windows
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-
-            # Use communicate with timeout to avoid deadlocks and handle timeout
-            stdout, _ = process.communicate(timeout=60)
-            returncode = process.returncode
-
-            # Command completed without Python exception or timeout.
-            return {"error": False, "returncode": returncode, "stdout": stdout, "stderr": ""} # Return stderr as empty string as it's captured in stdout
-
-        except FileNotFoundError:
-            # This error happens if the 'adb' executable itself is not found
-            return {"error": True, "type": "ADB_NOT_FOUND", "message": f"\nError: ADB command 'adb' not found. Ensure ADB is in your system's PATH.\n"}
-        except subprocess.TimeoutExpired:
-            # This error happens if the command times out
-            try: # Try to terminate gracefully first
-                process.terminate()
-                stdout, _ = process.communicate(timeout=5) # Read any remaining output
-            except: # If terminate fails, kill
-                process.kill()
-                stdout, _ = process.communicate(timeout=5) # Read any remaining output
-
-            return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": stdout} # Include partial output
-
-        except Exception as e:
-            # Catch any other unexpected Python-level errors during subprocess creation/communication
-            return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error during subprocess for {step_desc} {package_name}: {e}\nTraceback:\n{traceback.format_exc()}\n"}
+        """Queues a status line; it appears with the next batched flush. Safe to call from any thread."""
+        self.status_sink.write(message)
+
+
+    def _device_status(self, serial, message):
+        """Engine status callback (may run in a worker thread), prefixed with the device serial when several are connected."""
+        if serial is not None and len(self.engine.sessions) > 1:
+            # Prefix every line of multi-line messages so interleaved device output stays readable
+            message = "\n".join(f"[{serial}] {line}" if line else line for line in message.split("\n"))
+        self.print_status(message) # The buffered sink is thread-safe, no need to go through master.after
+
+
+    # --- Aggregate Progress ---
+    def _reset_progress(self, text):
+        """Resets the progress bar (run in main GUI thread)."""
+        self._progress_text = text
+        self.progress_bar.config(maximum=1, value=0)
+        self.progress_label.config(text=f"{text}: 0/0")
+
+    def _set_progress(self, done, total):
+        """Updates the progress bar (run in main GUI thread)."""
+        self.progress_bar.config(maximum=max(total, 1), value=done)
+        self.progress_label.config(text=f"{self._progress_text}: {done}/{total}")
+
+    def _on_engine_progress(self, done, total):
+        """Engine progress callback (may run in a worker thread)."""
+        self.master.after(0, self._set_progress, done, total)
+
+
+    # --- Job Control ---
+    def _start_job(self, name, func, *args):
+        """Queues func(job, *args) on the job controller and enables Pause/Cancel (run in main GUI thread)."""
+        def on_done(job):
+            # Keep the exported metrics files current for monitoring. Written here, on the job's worker
+            # thread, so a slow disk or network share does not freeze the window.
+            self.engine.export_metrics()
+            self.master.after(0, self._on_job_done, job)
+
+        job = self.jobs.submit(name, func, *args, on_done=on_done)
+        self.current_job = job
+        self.pause_button.config(state=tk.NORMAL, text="Pause")
+        self.cancel_button.config(state=tk.NORMAL)
+        return job
+
+    def _on_job_done(self, job):
+        """Disables Pause/Cancel once a job has ended (run in main GUI thread)."""
+        if job is self.current_job:
+            self.current_job = None
+            self.pause_button.config(state=tk.DISABLED, text="Pause")
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def cancel_job(self):
+        """Cancels the running job; in-flight ADB commands are killed right away."""
+        if self.current_job:
+            self.print_status("\nCancelling... (apps already processed stay processed)")
+            self.current_job.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.pause_button.config(state=tk.DISABLED, text="Pause")
+
+    def toggle_pause_job(self):
+        """Pauses the running job at its next checkpoint (between devices/packages), or resumes it."""
+        job = self.current_job
+        if not job:
+            return
+        if job.paused:
+            job.resume()
+            self.pause_button.config(text="Pause")
+            self.print_status("Resumed.")
+        else:
+            job.pause()
+            self.pause_button.config(text="Resume")
+            self.print_status("Pausing after the commands currently running...")
 
 
     # --- Scan Process ---
     def start_scan(self):
-        # Add a print here to see if the method is entered
-        print("--- Button 'Connect & Scan' Clicked ---") # Console print
+        log.debug("'Connect & Scan' clicked")
         self.set_buttons_state(tk.DISABLED)
         self.process_button.config(state=tk.DISABLED) # Disable process button until scan is complete
 
         self.print_status("\n--- Starting Scan Process ---")
         self.print_status("Checking ADB connection...")
-        # Clear previous results
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self._item_packages.clear()
+        # Clear previous results (including rows currently detached by a filter)
+        self._clear_tree()
         self.all_installed_bloatware.clear() # Clear previous scan data
+        self.device_bloatware.clear()
+        self.device_states.clear()
+        # Phones may have been swapped or reconnected, so start with fresh shell sessions
+        self.engine.close()
+        self._reset_progress("Devices scanned")
 
-        # Run scan in a separate thread to keep GUI responsive
-        print("--- Starting scan thread ---") # Console print
-        scan_thread = threading.Thread(target=self._perform_scan_task, daemon=True) # daemon=True allows thread to exit with GUI
-        scan_thread.start()
-        print("--- Scan thread started ---") # Console print
+        # Run scan as a job on the controller's worker thread to keep GUI responsive
+        self._start_job("Scan", self._perform_scan_task, not self.full_rescan_var.get())
+        log.debug("Scan job queued")
 
 
-    def _perform_scan_task(self):
-        """Task run in a separate thread for scanning."""
-        print("--- Inside _perform_scan_task thread ---") # Console print
+    def _perform_scan_task(self, job, use_cache=True):
+        """Job task run in a worker thread for scanning all connected devices."""
+        log.debug("Scan job started")
         try:
-            # Check ADB connection first
-            adb_check_command = ["adb", "devices"]
-            check_result = self.run_adb_command(adb_check_command, step_desc="check connection")
-
-            # Handle command execution errors (FileNotFoundError, Timeout, Python error)
-            if check_result.get("error"):
-                 self.master.after(0, self.print_status, check_result["message"])
-                 if check_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
-                      self.master.after(0, self.print_status, "Partial Output:\n" + check_result["stdout_on_timeout"].strip())
+            # The engine checks 'adb devices', scans every ready device in parallel and reports errors itself
+            scan_result = self.engine.scan(on_progress=self._on_engine_progress, use_cache=use_cache, job=job)
+            if scan_result.get("error"):
                  self.master.after(0, self.set_buttons_state, tk.NORMAL) # Update GUI state back
-                 print("--- Scan thread finished (execution error) ---") # Console print
+                 log.debug("Scan job finished (%s)", scan_result.get("type"))
                  return
 
-            # Now check the result of the ADB command itself (returncode, stdout)
-            # For 'adb devices', non-zero returncode is an error, but "unauthorized" or "no devices"
-            # messages are in stdout/stderr even with returncode 0.
-            # Check if stdout contains a device entry and not an error message
-            if check_result["returncode"] != 0 or "List of devices attached" not in check_result["stdout"] or "device" not in check_result["stdout"] or "unauthorized" in check_result["stdout"] or "error" in check_result["stdout"].lower():
-                 self.master.after(0, self.print_status, "Error: ADB device not found or unauthorized.")
-                 self.master.after(0, self.print_status, "Please ensure your phone is connected, USB Debugging is ON, and authorized.")
-                 self.master.after(0, self.print_status, "ADB Output (stdout):\n" + check_result["stdout"].strip())
-                 self.master.after(0, self.set_buttons_state, tk.NORMAL) # Update GUI state back
-                 print("--- Scan thread finished (device error) ---") # Console print
-                 return
-
-            self.master.after(0, self.print_status, "ADB connection successful.")
-
-            # Get installed packages for user 0
-            installed_packages = self.get_installed_packages()
-
-            if installed_packages is None or (isinstance(installed_packages, dict) and installed_packages.get("error")):
-                 self.master.after(0, self.print_status, "Failed to get package list.")
-                 # Error message is printed by get_installed_packages
-                 self.master.after(0, self.set_buttons_state, tk.NORMAL)
-                 print("--- Scan thread finished (package list error) ---") # Console print
-                 return
-            # installed_packages is a set if successful
-
-
-            # Compare installed packages against the known bloatware database
-            installed_bloatware = {}
-            all_categories = set()
-            for package, info in known_bloatware_db.items():
-                if package in installed_packages:
-                    installed_bloatware[package] = info # Store info including safety and category
-                    all_categories.add(info[2]) # Add category to the set
-
-            self.all_installed_bloatware = installed_bloatware # Store the full list
+            # The search index is built here, off the GUI thread, before the list is shown
+            from hyperos_search import SearchIndex
+            search_index = SearchIndex(scan_result["bloatware"])
+            self.device_bloatware = scan_result["devices"]
+            self.device_states = scan_result["states"]
+            self.all_installed_bloatware = scan_result["bloatware"] # Store the full list
+            self.search_index = search_index
+            if self.engine.replay is None: # A replayed scan says nothing about the fleet today
+                try:
+                    self.engine.export_snapshots(scan_result)
+                except OSError as e:
+                    self.master.after(0, self.print_status, f"Could not save the device snapshots: {e}")
 
             if not self.all_installed_bloatware:
-                 self.master.after(0, self.print_status, "\nNo known bloatware apps from the database found installed on your device for user 0.")
+                 self.master.after(0, self.print_status, "\nNo known bloatware apps from the database found installed on your device(s) for user 0.")
             else:
-                 self.master.after(0, self.print_status, f"\nFound {len(self.all_installed_bloatware)} known bloatware/removable apps installed (for User 0).")
+                 self.master.after(0, self.print_status, f"\nFound {len(self.all_installed_bloatware)} known bloatware/removable apps installed (for User 0) across {len(self.device_bloatware)} device(s).")
                  # Update category filter options and set default
-                 sorted_categories = sorted(list(all_categories))
+                 sorted_categories = sorted(set(info[2] for info in self.all_installed_bloatware.values()))
                  self.master.after(0, self._update_filter_options, sorted_categories)
                  # Apply initial filter (which is 'All' by default)
-                 # master.after is used because _apply_filters updates the Treeview
-                 self.master.after(0, self._apply_filters)
+                 # master.after is used because _populate_tree updates the Treeview
+                 self.master.after(0, self._populate_tree)
 
 
             self.master.after(0, self.set_buttons_state, tk.NORMAL) # Update GUI state back
             # Process button state is managed within _apply_filters
-            print("--- Scan thread finished successfully ---") # Console print
+            log.debug("Scan job finished successfully")
 
         except Exception as e:
             # Catch any unexpected errors within the thread task itself
@@ -469,36 +598,7 @@ class HyperOSAppManagerGUI:
             self.master.after(0, self.print_status, "Traceback:\n" + traceback.format_exc()) # Print traceback
             self.master.after(0, self.set_buttons_state, tk.NORMAL) # Ensure buttons are re-enabled
             self.master.after(0, self.process_button.config, {"state": tk.NORMAL}) # Re-enable process button
-            print("--- Scan thread finished (UNCAUGHT EXCEPTION) ---") # Console print
-
-
-    def get_installed_packages(self):
-        """Fetches a list of all installed package names for user 0."""
-        self.master.after(0, self.print_status, "Fetching list of installed packages from the device for user 0...")
-        # Command to explicitly list packages for user 0
-        command = ["adb", "shell", "pm", "list", "packages", "--user", "0"]
-        result = self.run_adb_command(command, "N/A", "list packages")
-
-        # Handle command execution errors (FileNotFoundError, Timeout, Python error)
-        if result.get("error"):
-             self.master.after(0, self.print_status, result["message"])
-             if result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
-                  self.master.after(0, self.print_status, "Partial Output:\n" + result["stdout_on_timeout"].strip())
-             return {"error": True, "message": "Failed to run pm list packages command."} # Return a consistent error indicator
-
-
-        # Now check the result of the ADB command itself (returncode, stdout)
-        # pm list packages usually returns 0 on success, errors go to stdout
-        if result["returncode"] != 0 or "Error:" in result["stdout"] or "Exception:" in result["stdout"] or "SecurityException" in result["stdout"] :
-            self.master.after(0, self.print_status, "Failed to get package list from device (ADB Command Error).")
-            self.master.after(0, self.print_status, "ADB Output (stdout):\n" + result["stdout"].strip())
-            # No stderr with STDOUT redirected to STDOUT
-            return {"error": True, "message": "pm list packages returned an error."} # Return a consistent error indicator
-
-        # Parse the output: each line is "package:com.package.name"
-        packages = [line.strip().replace("package:", "") for line in result["stdout"].splitlines() if line.strip() and line.startswith("package:")]
-        # print(f"Found {len(packages)} packages for user 0 on the device.") # Too verbose for GUI log
-        return set(packages) # Use a set for faster lookup
+            log.exception("Scan job failed")
 
     def _update_filter_options(self, categories):
         """Updates filter combobox options (run in main GUI thread)."""
@@ -509,60 +609,117 @@ class HyperOSAppManagerGUI:
         self.safety_filter_combobox['values'] = self.safety_filter_options
         self.safety_filter_combobox.set("All") # Reset to default
 
+        self.device_filter_options = ["All"] + sorted(self.device_bloatware)
+        self.device_filter_combobox['values'] = self.device_filter_options
+        self.device_filter_combobox.set("All") # Reset to default
 
-    def _apply_filters(self):
-        """Applies filters and populates the Treeview with matching apps."""
-        if not self.all_installed_bloatware:
-            # Clear the tree if no data is loaded
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            self._item_packages.clear()
-            self.process_button.config(state=tk.DISABLED)
-            return # No data to filter
-
-        self.master.after(0, self.print_status, "Applying filters...")
+        self.category_combobox['values'] = categories
+        self.category_combobox.set("")
 
-        selected_safety = self.safety_filter_combobox.get()
-        selected_category = self.category_filter_combobox.get()
 
-        # Clear current list and selections
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self._item_packages.clear() # Clear mapping
+    def _clear_tree(self):
+        """Deletes every row, attached or detached (run in main GUI thread)."""
+        if self._item_packages:
+            self.tree.delete(*self._item_packages)
+        self._item_packages.clear()
+        self._sorted_packages = []
+        self._visible_packages = []
+        self.selected_packages = set()
+        self._tagged_selected = set()
+        self._packages_by_safety = {}
+        self._packages_by_category = {}
 
-        # Sort the bloatware list alphabetically by package name
-        sorted_bloatware_items = sorted(self.all_installed_bloatware.items())
 
+    def _populate_tree(self):
+        """Creates one Treeview row per scanned package, once per scan, then applies the filters."""
+        self._clear_tree()
         if not self.tree_tags_configured:
              self._configure_tree_tags() # Ensure tags are configured if not already
 
+        # Sort the bloatware list alphabetically by package name (once per scan, not per filter change)
+        self._sorted_packages = sorted(self.all_installed_bloatware)
+        device_count = len(self.device_bloatware)
+        for package in self._sorted_packages:
+            description, safety, category = self.all_installed_bloatware[package]
+            # Number of scanned devices that have this package installed
+            found_on = sum(1 for found in self.device_bloatware.values() if package in found)
+            # State for user 0; "Mixed" when the devices disagree
+            states = {device_states[package] for device_states in self.device_states.values() if package in device_states}
+            handled = bool(states) and states <= {"UNINSTALLED", "DISABLED"} # Would be skipped on every device
+            state = states.pop().capitalize() if len(states) == 1 else "Mixed"
+
+            # Apply safety color tag and selectable tag
+            tags = ['selectable_item'] # Add a generic tag for click handling
+            if safety == "RISKY":
+                 tags.append('risky_tag')
+            elif safety == "CAUTION":
+                 tags.append('caution_tag')
+            if handled:
+                 tags.append('handled_tag')
+            # Package names are unique, so they are used directly as item IDs; tags are set in the same call
+            self.tree.insert("", "end", iid=package, values=(package, safety, category, state, f"{found_on}/{device_count}", description), tags=tags)
+            self._item_packages[package] = package
+            self._packages_by_safety.setdefault(safety, set()).add(package)
+            self._packages_by_category.setdefault(category, set()).add(package)
+        self._visible_packages = list(self._sorted_packages)
+        self._apply_filters()
+
+
+    def _on_search_changed(self, *args):
+        """Called on every change of the search box; re-filters once typing pauses."""
+        if self._search_after_id is not None:
+            self.master.after_cancel(self._search_after_id)
+        self._search_after_id = self.master.after(SEARCH_DEBOUNCE_MS, self._apply_search)
+
+    def _apply_search(self):
+        if self._search_after_id is not None:
+            self.master.after_cancel(self._search_after_id)
+            self._search_after_id = None
+        self._apply_filters(announce=False) # The list itself is the feedback; no status line per keystroke
+
+    def _apply_filters(self, announce=True):
+        """Shows only the rows matching the filters by detaching/reattaching existing rows."""
+        if not self.all_installed_bloatware:
+            # Clear the tree if no data is loaded
+            self._clear_tree()
+            self.process_button.config(state=tk.DISABLED)
+            return # No data to filter
+
+        if announce:
+            self.master.after(0, self.print_status, "Applying filters...")
 
-        # Populate Treeview with filtered items
-        items_displayed = 0
-        for package, info in sorted_bloatware_items:
-            description, safety, category = info
+        selected_safety = self.safety_filter_combobox.get()
+        selected_category = self.category_filter_combobox.get()
+        selected_device = self.device_filter_combobox.get()
+        device_packages = self.device_bloatware.get(selected_device, ())
+        # Search results come best match first; without a search the order computed at scan time is kept
+        ranked = self.search_index.search(self.search_var.get()) if self.search_index else None
+
+        # Matching packages, in display order
+        visible = []
+        for package in (self._sorted_packages if ranked is None else ranked):
+            if package not in self._item_packages: # Index of a newer scan whose rows are not created yet
+                continue
+            description, safety, category = self.all_installed_bloatware[package]
             # Check if item matches the filters
-            safety_match = (selected_safety == "All" or safety == selected_safety)
-            category_match = (selected_category == "All" or category == selected_category)
-
-            if safety_match and category_match:
-                # Insert item into the treeview
-                item_id = self.tree.insert("", "end",
-                                           values=(package, safety, category, description))
-
-                # Store item ID mapped to package name
-                self._item_packages[item_id] = package
-
-                # Apply safety color tag and selectable tag
-                tags = ['selectable_item'] # Add a generic tag for click handling
-                if safety == "RISKY":
-                     tags.append('risky_tag')
-                elif safety == "CAUTION":
-                     tags.append('caution_tag')
-                self.tree.item(item_id, tags=tags) # Apply tags
-                items_displayed += 1
-
-        self.master.after(0, self.print_status, f"Filter applied. Displaying {items_displayed} items.")
+            if selected_safety != "All" and safety != selected_safety:
+                continue
+            if selected_category != "All" and category != selected_category:
+                continue
+            if selected_device != "All" and package not in device_packages:
+                continue
+            visible.append(package)
+
+        # Only touch the widget when the visible set actually changed. set_children detaches the
+        # rows not listed and reattaches/reorders the listed ones in a single Tcl call; rows keep
+        # their tags, so the user's 'selected' state survives filter changes.
+        if visible != self._visible_packages:
+            self.tree.set_children("", *visible)
+            self._visible_packages = visible
+        items_displayed = len(visible)
+
+        if announce:
+            self.master.after(0, self.print_status, f"Filter applied. Displaying {items_displayed} items.")
         # Ensure process button is enabled if there are items displayed
         if items_displayed > 0:
              self.master.after(0, self.process_button.config, {"state": tk.NORMAL})
@@ -575,76 +732,120 @@ class HyperOSAppManagerGUI:
         """Handles clicks on Treeview items to toggle selection."""
         # Get the item ID from the click coordinates
         item_id = self.tree.identify_row(event.y)
-        if not item_id or 'selectable_item' not in self.tree.item(item_id, 'tags'): # Ensure it's a selectable item row
+        if not item_id or item_id not in self._item_packages: # Ensure it's a selectable item row
             return
 
-        # Toggle the 'selected' tag
-        tags = list(self.tree.item(item_id, 'tags'))
-
-        if 'selected' in tags:
-            tags.remove('selected')
+        # Toggle the package in the selection model
+        package = self._item_packages[item_id]
+        if package in self.selected_packages:
+            self.selected_packages.discard(package)
         else:
-            tags.append('selected')
-
-        self.tree.item(item_id, tags=tags)
+            self.selected_packages.add(package)
+        self._refresh_selection_tags()
+
+    def _refresh_selection_tags(self):
+        """Brings the 'selected' tag in line with the selection model in at most two Tcl calls."""
+        to_tag = self.selected_packages - self._tagged_selected
+        to_untag = self._tagged_selected - self.selected_packages
+        # ttk::treeview 'tag add/remove' take a whole list of items (Tk 8.6); the Python wrapper has no method for it
+        if to_untag:
+            self.tree.tk.call(self.tree, "tag", "remove", "selected", list(to_untag))
+        if to_tag:
+            self.tree.tk.call(self.tree, "tag", "add", "selected", list(to_tag))
+        self._tagged_selected = set(self.selected_packages)
 
     def _on_item_double_click(self, event):
         """Optional: Show full description on double click."""
         item_id = self.tree.identify_row(event.y)
         if not item_id:
             return
-        # Get values: ("Package", "Safety", "Category", "Description")
+        # Get values: ("Package", "Safety", "Category", "State", "Devices", "Description")
         item_values = self.tree.item(item_id, 'values')
-        if item_values and len(item_values) > 3:
+        if item_values and len(item_values) > 5:
             package = item_values[0]
-            description = item_values[3]
-            messagebox.showinfo(f"Details: {package}", f"Package: {package}\n\nDescription:\n{description}")
+            description = item_values[5]
+            devices = sorted(f"{serial} ({self.device_states.get(serial, {}).get(package, '?').lower()})" for serial, found in self.device_bloatware.items() if package in found)
+            from tkinter import messagebox
+            messagebox.showinfo(f"Details: {package}", f"Package: {package}\n\nDescription:\n{description}\n\nInstalled on: {', '.join(devices)}")
 
 
     def get_selected_item_ids(self):
         """Gets the list of item IDs that are currently selected."""
-        selected_ids = []
-        # Iterate only through the currently visible items
-        for item_id in self.tree.get_children():
-            tags = self.tree.item(item_id, 'tags')
-            if 'selected' in tags:
-                 selected_ids.append(item_id)
-        return selected_ids
+        # Only the currently visible (filtered) items are processed
+        return [package for package in self._visible_packages if package in self.selected_packages]
 
     def select_all_apps(self):
         """Selects all currently filtered items in the Treeview."""
-        for item_id in self.tree.get_children():
-            tags = list(self.tree.item(item_id, 'tags'))
-            if 'selected' not in tags:
-                tags.append('selected')
-                self.tree.item(item_id, tags=tags)
+        self.selected_packages |= set(self._visible_packages)
+        self._refresh_selection_tags()
 
     def select_none_apps(self):
         """Deselects all currently filtered items in the Treeview."""
-        for item_id in self.tree.get_children():
-            tags = list(self.tree.item(item_id, 'tags'))
-            if 'selected' in tags:
-                tags.remove('selected')
-                self.tree.item(item_id, tags=tags)
+        self.selected_packages -= set(self._visible_packages)
+        self._refresh_selection_tags()
 
     def select_by_safety(self, safety_level):
         """Selects apps based on safety level among the currently filtered items."""
         # Clear current selection before selecting by category/level among filtered items
-        self.select_none_apps() # Clear current selection
-        for item_id in self.tree.get_children():
-            # Get safety from item values, not from the main DB, as the item is what's displayed
-            package, safety, category, description = self.tree.item(item_id, 'values')
-            tags = list(self.tree.item(item_id, 'tags'))
-            if safety.upper() == safety_level.upper():
-                 if 'selected' not in tags:
-                     tags.append('selected')
-            self.tree.item(item_id, tags=tags) # Apply changes
+        visible = set(self._visible_packages)
+        self.selected_packages -= visible
+        self.selected_packages |= visible & self._packages_by_safety.get(safety_level.upper(), set())
+        self._refresh_selection_tags()
+
+    def select_by_category(self, category):
+        """Adds every currently filtered app of a category to the selection."""
+        self.selected_packages |= set(self._visible_packages) & self._packages_by_category.get(category, set())
+        self._refresh_selection_tags()
+
+    # --- Selection Export / Import ---
+    def export_selection(self):
+        """Saves the selected package names to a JSON file."""
+        from tkinter import filedialog, messagebox
+        if not self.selected_packages:
+            messagebox.showwarning("No Selection", "Please select at least one app to export.")
+            return
+        path = filedialog.asksaveasfilename(title="Export Selection", defaultextension=".json", filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"packages": sorted(self.selected_packages)}, f, indent=2)
+        except OSError as e:
+            messagebox.showerror("Export Failed", f"Could not write {path}:\n{e}")
+            return
+        self.print_status(f"Exported {len(self.selected_packages)} selected apps to {path}.")
 
-    # Add methods like select_by_category_button if needed, similar to select_by_safety
+    def import_selection(self):
+        """Loads package names from a JSON file (or a text file with one name per line) and selects them."""
+        from tkinter import filedialog, messagebox
+        path = filedialog.askopenfilename(title="Import Selection", filetypes=[("JSON files", "*.json"), ("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+            try:
+                packages = json.loads(content)["packages"]
+            except (ValueError, KeyError, TypeError):
+                packages = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            messagebox.showerror("Import Failed", f"Could not read {path}:\n{e}")
+            return
 
+        # Only packages found by the last scan can be selected
+        packages = set(packages)
+        known = packages & self._item_packages.keys()
+        self.selected_packages = known
+        self._refresh_selection_tags()
+        self.print_status(f"Imported selection from {path}: {len(known)} apps selected, {len(packages) - len(known)} not found in the current scan.")
+        hidden = len(known - set(self._visible_packages))
+        if hidden:
+            self.print_status(f"Note: {hidden} of the selected apps are hidden by the current filters and will not be processed until shown.")
 
     # --- Process Selected Apps ---
     def start_process(self):
+        from tkinter import messagebox
+        from hyperos_engine import get_catalog
         selected_item_ids = self.get_selected_item_ids()
         if not selected_item_ids:
             messagebox.showwarning("No Selection", "Please select at least one app to process.")
@@ -652,9 +853,10 @@ class HyperOSAppManagerGUI:
 
         # Get package names and full details for selected items
         selected_packages_details = []
+        known_bloatware_db = get_catalog()[0]
         for item_id in selected_item_ids:
              package = self._item_packages[item_id] # Get package name from stored mapping
-             details = known_bloatware_db.get(package) # Get full details from the main DB
+             details = known_bloatware_db.lookup(package) # Get full details from the main DB (exact entry or pattern)
              if details: # Should always be found if it was in the list
                  selected_packages_details.append((package, details[0], details[1], details[2])) # package, description, safety, category
 
@@ -666,7 +868,7 @@ class HyperOSAppManagerGUI:
         """Creates and displays a window to review selected apps before processing."""
         review_window = tk.Toplevel(self.master)
         review_window.title("Review Selected Apps")
-        review_window.geometry("600x450") # Set a slightly larger default size
+        review_window.geometry("900x480") # Room for the impact column
         review_window.transient(self.master) # Keep review window on top of main window
         review_window.grab_set() # Modal - block interaction with other windows
 
@@ -674,16 +876,18 @@ class HyperOSAppManagerGUI:
         review_list_frame = ttk.Frame(review_window, padding="10")
         review_list_frame.pack(expand=True, fill=tk.BOTH)
 
-        review_tree = ttk.Treeview(review_list_frame, columns=("Package", "Safety", "Category"), show="headings")
+        review_tree = ttk.Treeview(review_list_frame, columns=("Package", "Safety", "Category", "Impact"), show="headings")
         review_tree.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
 
         review_tree.heading("Package", text="Package Name", anchor=tk.W)
         review_tree.heading("Safety", text="Safety", anchor=tk.W)
         review_tree.heading("Category", text="Category", anchor=tk.W)
+        review_tree.heading("Impact", text="Impact on the device(s)", anchor=tk.W) # Filled in by the impact analysis
 
         review_tree.column("Package", width=250, stretch=tk.YES)
         review_tree.column("Safety", width=80, stretch=tk.NO)
         review_tree.column("Category", width=100, stretch=tk.NO)
+        review_tree.column("Impact", width=380, stretch=tk.YES)
 
         review_scroll = ttk.Scrollbar(review_list_frame, orient="vertical", command=review_tree.yview)
         review_tree.configure(yscrollcommand=review_scroll.set)
@@ -691,7 +895,7 @@ class HyperOSAppManagerGUI:
 
         # Populate review tree
         for package, description, safety, category in selected_apps_details:
-            item_id = review_tree.insert("", "end", values=(package, safety, category))
+            item_id = review_tree.insert("", "end", iid=package, values=(package, safety, category, "Analyzing..."))
             # Apply safety color tag in review window too
             if safety == "RISKY":
                  review_tree.item(item_id, tags=('risky_tag',))
@@ -701,10 +905,14 @@ class HyperOSAppManagerGUI:
         # Configure tags for colors in the review tree (needs to match main window tags)
         review_tree.tag_configure('risky_tag', foreground='red')
         review_tree.tag_configure('caution_tag', foreground='orange')
+        review_tree.tag_configure('impact_high', background='#ffd6d6') # Provides something in use on a target device
+        review_tree.tag_configure('impact_medium', background='#fff1cc')
 
 
         # --- Warning/Summary Text ---
         warning_text = "Review the list below carefully. This action cannot be easily undone."
+        target_serials = self._target_serials()
+        warning_text += f"\nTarget device(s): {len(target_serials)} ({', '.join(target_serials)})"
         risky_selected = any(safety == "RISKY" for _, _, safety, _ in selected_apps_details)
         caution_selected = any(safety == "CAUTION" for _, _, safety, _ in selected_apps_details)
 
@@ -721,6 +929,43 @@ class HyperOSAppManagerGUI:
 
         warning_label.pack(pady=10)
 
+        # Impact analysis: what the selected apps provide on each target device (dumpsys package, see hyperos_dumpsys.py).
+        # It runs as a job in the background; the user does not have to wait for it to confirm. Jobs run
+        # one at a time, so a confirmed process run waits until the analysis is done or cancelled.
+        impact_label = ttk.Label(review_window, text="Analyzing what the selected apps provide on the target device(s)...", wraplength=860, justify=tk.CENTER)
+        impact_label.pack(pady=(0, 5))
+        impact_details = {} # package -> full impact text, shown on double-click
+        scan_result = {"devices": self.device_bloatware, "states": self.device_states}
+        impact_plan = self.engine.plan(scan_result, packages={package for package, _, _, _ in selected_apps_details},
+                                       serials=self._target_serials(), include_handled=True)
+
+        def show_impact(results):
+            if not review_window.winfo_exists():
+                return
+            self._fill_review_impact(review_tree, impact_label, impact_details, results)
+
+        def analyze(job):
+            try:
+                results = self.engine.analyze_impact(impact_plan, job=job)
+            except JobCancelled:
+                raise # Ends the job as cancelled
+            except Exception as e:
+                log.exception("Impact analysis failed")
+                results = {serial: None for serial in impact_plan}
+                self.master.after(0, self.print_status, f"Impact analysis failed: {e}")
+            if not job.cancelled:
+                self.master.after(0, show_impact, results)
+
+        impact_job = self._start_job("Impact analysis", analyze)
+
+        def on_review_double_click(event):
+            package = review_tree.identify_row(event.y)
+            if package in impact_details:
+                from tkinter import messagebox
+                messagebox.showinfo(f"Impact: {package}", impact_details[package], parent=review_window)
+
+        review_tree.bind("<Double-1>", on_review_double_click)
+
 
         # --- Control Buttons ---
         button_frame = ttk.Frame(review_window, padding="0 0 10 10") # Padding bottom/right
@@ -753,6 +998,53 @@ class HyperOSAppManagerGUI:
         review_window.transient(self.master)
         review_window.grab_set()
         self.master.wait_window(review_window)
+        # The results are only shown in this window: stop a still running analysis so it does not hold up processing
+        impact_job.cancel()
+
+
+    def _fill_review_impact(self, review_tree, impact_label, impact_details, results):
+        """Shows the impact analysis results ({serial: {package: flags} or None}) in the review window."""
+        flags_by_package = {}
+        unreadable = sorted(serial for serial, device_result in results.items() if device_result is None)
+        for serial, device_result in sorted(results.items()):
+            for package, flags in (device_result or {}).items():
+                for level, message in flags:
+                    flags_by_package.setdefault(package, []).append((level, message, serial))
+
+        levels = {"HIGH": 0, "MEDIUM": 1, "INFO": 2}
+        high = medium = 0
+        for package in review_tree.get_children():
+            flags = sorted(flags_by_package.get(package, []), key=lambda flag: levels[flag[0]])
+            if not flags:
+                review_tree.set(package, "Impact", "-" if not unreadable else "?")
+                continue
+            # One line per distinct finding, with the devices it applies to
+            devices_by_message = {}
+            for level, message, serial in flags:
+                devices_by_message.setdefault((level, message), []).append(serial)
+            summary = "; ".join(f"{level}: {message}" for level, message in devices_by_message if level != "INFO") or "; ".join(message for _, message in devices_by_message)
+            review_tree.set(package, "Impact", summary)
+            impact_details[package] = "\n\n".join(f"{level}: {message}\nOn: {', '.join(serials)}" for (level, message), serials in devices_by_message.items())
+            tags = list(review_tree.item(package, "tags"))
+            if flags[0][0] == "HIGH":
+                tags.append('impact_high')
+                high += 1
+            elif flags[0][0] == "MEDIUM":
+                tags.append('impact_medium')
+                medium += 1
+            review_tree.item(package, tags=tags)
+
+        text = f"Impact analysis: {high} app(s) provide something in use (red), {medium} share data or a UID with other apps (yellow). Double-click an app for details."
+        if unreadable:
+            text += f"\nCould not read 'dumpsys package' on: {', '.join(unreadable)}."
+        impact_label.config(text=text, foreground='red' if high else '')
+
+    def _target_serials(self):
+        """Devices the next process run targets: the one chosen in the device filter, or all scanned devices."""
+        selected_device = self.device_filter_combobox.get()
+        if selected_device != "All" and selected_device in self.device_bloatware:
+            return [selected_device]
+        return sorted(self.device_bloatware)
 
 
     def _start_processing_thread(self):
@@ -761,82 +1053,57 @@ class HyperOSAppManagerGUI:
              self.print_status("No apps selected for processing.")
              return # Should not happen if review window was shown
 
+         # Build the per-device plan: each device only gets the selected packages it actually has installed
+         # Apps already uninstalled/disabled on a device are left out for that device
+         scan_result = {"devices": self.device_bloatware, "states": self.device_states}
+         selected = set(self._packages_to_process_in_thread)
+         device_plan = self.engine.plan(scan_result, packages=selected, serials=self._target_serials())
+         full_plan = self.engine.plan(scan_result, packages=selected, serials=self._target_serials(), include_handled=True)
+         already_handled = sum(len(packages) for packages in full_plan.values()) - sum(len(packages) for packages in device_plan.values())
+         if already_handled:
+             self.print_status(f"Skipping {already_handled} app/device pair(s) already uninstalled or disabled for user 0.")
+         if not device_plan:
+             self.print_status("None of the selected apps still need processing on the target device(s).")
+             self._packages_to_process_in_thread = []
+             return
+
+         # Use the plan built from the review window selection
+         self._run_plan(device_plan)
+         self._packages_to_process_in_thread = [] # Clear the list once thread is started
+
+
+    def _run_plan(self, device_plan):
+         """Processes a {serial: [packages]} plan as a job (from the review window or a profile)."""
          self.set_buttons_state(tk.DISABLED)
          self.process_button.config(state=tk.DISABLED) # Disable process button
          self.print_status("\n--- Starting Removal/Disabling Process ---")
+         self._reset_progress("Packages processed")
 
-         # Run process in a separate thread
-         print("--- Starting process thread ---") # Console print
-         # Use the list stored from the review window
-         process_thread = threading.Thread(target=self._perform_process_task, args=(self._packages_to_process_in_thread,), daemon=True)
-         process_thread.start()
-         print("--- Process thread started ---") # Console print
-         self._packages_to_process_in_thread = [] # Clear the list once thread is started
+         # Run process as a job on the controller's worker thread
+         self._start_job("Process", self._perform_process_task, device_plan, self.batch_mode_var.get())
+         log.debug("Process job queued")
 
 
-    def _perform_process_task(self, selected_packages):
-        """Task run in a separate thread for processing apps."""
-        print("--- Inside _perform_process_task thread ---") # Console print
+    def _perform_process_task(self, job, device_plan, batch_mode):
+        """Job task run in a worker thread: the engine processes every device in parallel."""
+        log.debug("Process job started")
         try:
-            for package in selected_packages:
-                self.master.after(0, self.print_status, f"\nProcessing package: {package}")
-
-                # --- Attempt 1: Uninstall for User 0 ---
-                uninstall_command = ["adb", "shell", "pm", "uninstall", "-k", "--user", "0", package]
-                uninstall_result = self.run_adb_command(uninstall_command, package, "uninstall")
-
-                # Handle command execution errors or ADB command failure
-                if uninstall_result.get("error"):
-                     self.master.after(0, self.print_status, uninstall_result["message"])
-                     if uninstall_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
-                         self.master.after(0, self.print_status, "Partial Output:\n" + uninstall_result["stdout_on_timeout"].strip())
-                     self.master.after(0, self.print_status, f"  Failed to process {package} due to execution error.")
-                     continue # Move to next package
-
-
-                # Now check the result of the ADB command itself
-                # pm uninstall usually returns 0 on success, errors go to stdout
-                if "Success" in uninstall_result["stdout"]:
-                    self.master.after(0, self.print_status, f"  Status: Successfully UNINSTALLED {package} for user 0.")
-                else:
-                    # Uninstall failed, now try to disable
-                    self.master.after(0, self.print_status, f"  Uninstall failed for {package}. Trying to disable instead.")
-                    # Optional: Print failure output if needed for debugging
-                    self.master.after(0, self.print_status, "  Uninstall ADB Output (stdout):\n" + uninstall_result["stdout"].strip())
-
-
-                    # --- Attempt 2: Disable for User 0 ---
-                    disable_command = ["adb", "shell", "pm", "disable-user", "--user", "0", package]
-                    disable_result = self.run_adb_command(disable_command, package, "disable")
-
-                    # Handle command execution errors or ADB command failure
-                    if disable_result.get("error"):
-                        self.master.after(0, self.print_status, disable_result["message"])
-                        if disable_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
-                            self.master.after(0, self.print_status, "Partial Output:\n" + disable_result["stdout_on_timeout"].strip())
-                        self.master.after(0, self.print_status, f"  Failed to process {package} due to execution error.")
-                        continue # Move to next package
-
-                    # Check the result of the ADB command itself
-                    # pm disable-user usually returns 0 on success, output indicates new state
-                    if "new state: disabled-user" in disable_result["stdout"] or "new state: disabled" in disable_result["stdout"]:
-                        self.master.after(0, self.print_status, f"  Status: Successfully DISABLED {package} for user 0.")
-                    else:
-                        self.master.after(0, self.print_status, f"  Status: Failed to UNINSTALL AND DISABLE {package}.")
-                        self.master.after(0, self.print_status, "  Disable ADB Output (stdout):\n" + disable_result["stdout"].strip())
-
+            results = self.engine.apply(device_plan, batch=batch_mode, on_progress=self._on_engine_progress, job=job)
 
-                # Add a small visual delay between items if processing many
-                # self.master.after(0, time.sleep, 0.1) # Cannot use blocking sleep in thread, needs timer or loop with breaks
-
-
-            self.master.after(0, self.print_status, "\n--- Process finished ---")
-            self.master.after(0, self.print_status, "Review the status messages above.")
-            self.master.after(0, self.print_status, "Apps reported as 'UNINSTALLED' or 'DISABLED' should no longer appear in your app drawer.")
-            self.master.after(0, self.print_status, "Consider restarting your phone.")
+            if job.cancelled:
+                self.master.after(0, self.print_status, "\n--- Process cancelled ---")
+                self.master.after(0, self.print_status, "Apps not reached are reported as cancelled. Rescan to see the current state.")
+            else:
+                self.master.after(0, self.print_status, "\n--- Process finished ---")
+                self.master.after(0, self.print_status, "Review the status messages above.")
+                self.master.after(0, self.print_status, "Each phone's package states were read again after processing; see the verification table.")
+                if self.engine.report:
+                    self.master.after(0, self.print_status, f"One record per app was also written to the run report {self.engine.report.path}.")
+                self.master.after(0, self.print_status, "Consider restarting your phone.")
+                self.master.after(0, self._show_verification_window, results)
             self.master.after(0, self.set_buttons_state, tk.NORMAL) # Update GUI state back
             self.master.after(0, self.process_button.config, {"state": tk.NORMAL}) # Re-enable process button
-            print("--- Process thread finished successfully ---") # Console print
+            log.debug("Process job finished successfully")
 
         except Exception as e:
             # Catch any unexpected errors within the thread task itself
@@ -844,7 +1111,392 @@ class HyperOSAppManagerGUI:
             self.master.after(0, self.print_status, "Traceback:\n" + traceback.format_exc()) # Print traceback
             self.master.after(0, self.set_buttons_state, tk.NORMAL) # Ensure buttons are re-enabled
             self.master.after(0, self.process_button.config, {"state": tk.NORMAL})
-            print("--- Process thread finished (UNCAUGHT EXCEPTION) ---") # Console print
+            log.exception("Process job failed")
+
+
+    def _show_verification_window(self, results):
+        """Per-package outcome of a run as verified on each device (see "Post-run Verification" in hyperos_engine.py)."""
+        rows = [(serial, package, result) for serial, device_results in sorted(results.items()) for package, result in sorted(device_results.items())]
+        order = {"MISMATCH": 0, "UNVERIFIED": 1, "CORRECTED": 2, "UNCHANGED": 3, "VERIFIED": 4}
+        rows.sort(key=lambda row: order.get(row[2].get("verification"), 1)) # Problems first
+        mismatched = {}
+        for serial, package, result in rows:
+            if result.get("verification") == "MISMATCH":
+                mismatched.setdefault(serial, []).append(package)
+
+        window = tk.Toplevel(self.master)
+        window.title("Verification")
+        window.geometry("860x420")
+
+        list_frame = ttk.Frame(window, padding="10")
+        list_frame.pack(expand=True, fill=tk.BOTH)
+        columns = ("Device", "Package", "Result", "State on Device", "Verification", "Retries")
+        verify_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        verify_tree.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+        for column, width, stretch in zip(columns, (120, 260, 100, 110, 100, 60), (tk.NO, tk.YES, tk.NO, tk.NO, tk.NO, tk.NO)):
+            verify_tree.heading(column, text=column, anchor=tk.W)
+            verify_tree.column(column, width=width, stretch=stretch)
+        verify_scroll = ttk.Scrollbar(list_frame, orient="vertical", command=verify_tree.yview)
+        verify_tree.configure(yscrollcommand=verify_scroll.set)
+        verify_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        verify_tree.tag_configure('mismatch_tag', foreground='red')
+        verify_tree.tag_configure('corrected_tag', foreground='orange') # The device disagreed with the pm output
+        verify_tree.tag_configure('unverified_tag', foreground='gray')
+
+        tags = {"MISMATCH": ('mismatch_tag',), "CORRECTED": ('corrected_tag',), "UNCHANGED": ('unverified_tag',), "UNVERIFIED": ('unverified_tag',)}
+        for serial, package, result in rows:
+            verification = result.get("verification", "UNVERIFIED")
+            verify_tree.insert("", "end", values=(serial, package, result["status"].capitalize(), result.get("device_state", "?").capitalize(),
+                                                  verification.capitalize(), result.get("retries", 0)), tags=tags.get(verification, ()))
+
+        counts = {}
+        for _, _, result in rows:
+            verification = result.get("verification", "UNVERIFIED")
+            counts[verification] = counts.get(verification, 0) + 1
+        summary = (f"{counts.get('VERIFIED', 0)} verified, {counts.get('CORRECTED', 0)} corrected to the state shown by the device, "
+                   f"{counts.get('UNCHANGED', 0)} already in that state before the run, {counts.get('MISMATCH', 0)} still enabled, "
+                   f"{counts.get('UNVERIFIED', 0)} unverified.")
+        ttk.Label(window, text=summary, wraplength=840, justify=tk.CENTER).pack(pady=5)
+
+        button_frame = ttk.Frame(window, padding="0 0 10 10")
+        button_frame.pack(fill=tk.X, anchor=tk.S)
+
+        def on_retry():
+            window.destroy()
+            self.print_status(f"Retrying {sum(len(packages) for packages in mismatched.values())} app(s) that are still enabled.")
+            self._run_plan(mismatched)
+
+        ttk.Button(button_frame, text="Retry Still Enabled", command=on_retry, state=tk.NORMAL if mismatched else tk.DISABLED).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Close", command=window.destroy).pack(side=tk.RIGHT)
+
+    # --- Debloat Profiles ---
+    def _refresh_profile_list(self):
+        from hyperos_engine import APP_DATA_DIR
+        from hyperos_profiles import list_profiles
+        self.profile_combobox['values'] = sorted(list_profiles(APP_DATA_DIR))
+
+    def start_profile(self):
+        """Resolves the chosen profile against the last scan and shows what it would change on each target device."""
+        from tkinter import messagebox
+        from hyperos_engine import APP_DATA_DIR
+        from hyperos_profiles import load_profile, ProfileError
+        name = self.profile_combobox.get()
+        if not name:
+            messagebox.showwarning("No Profile", "Please choose a profile first.")
+            return
+        if not self.device_bloatware:
+            messagebox.showwarning("No Scan", "Please scan the device(s) first; the profile is resolved against each device's scan.")
+            return
+        try:
+            profile = load_profile(name, APP_DATA_DIR)
+        except ProfileError as e:
+            messagebox.showerror("Invalid Profile", str(e))
+            return
+        scan_result = {"devices": self.device_bloatware, "states": self.device_states}
+        resolution = self.engine.plan_profiles(scan_result, [profile], serials=self._target_serials())
+        self._show_profile_diff_window(profile, resolution, scan_result)
+
+    def _show_profile_diff_window(self, profile, resolution, scan_result):
+        """Dry run of a profile: every matched app per device with its current state and what would happen to it."""
+        from hyperos_engine import get_catalog
+        from hyperos_profiles import plan_diff
+        diff = plan_diff(resolution, scan_result, get_catalog()[0])
+        plan = resolution["plan"]
+
+        window = tk.Toplevel(self.master)
+        window.title(f"Profile: {profile.name}")
+        window.geometry("760x480")
+        window.transient(self.master)
+
+        list_frame = ttk.Frame(window, padding="10")
+        list_frame.pack(expand=True, fill=tk.BOTH)
+        columns = ("Device", "Package", "Safety", "Category", "State", "Change")
+        diff_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        diff_tree.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
+        for column, width, stretch in zip(columns, (120, 250, 70, 110, 85, 120), (tk.NO, tk.YES, tk.NO, tk.NO, tk.NO, tk.NO)):
+            diff_tree.heading(column, text=column, anchor=tk.W)
+            diff_tree.column(column, width=width, stretch=stretch)
+        diff_scroll = ttk.Scrollbar(list_frame, orient="vertical", command=diff_tree.yview)
+        diff_tree.configure(yscrollcommand=diff_scroll.set)
+        diff_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        diff_tree.tag_configure('risky_tag', foreground='red')
+        diff_tree.tag_configure('caution_tag', foreground='orange')
+        diff_tree.tag_configure('handled_tag', foreground='gray') # Nothing to do on that device
+
+        for serial, rows in diff.items():
+            for row in rows:
+                if row["change"] != "uninstall":
+                    tags = ('handled_tag',)
+                elif row["safety"] == "RISKY":
+                    tags = ('risky_tag',)
+                elif row["safety"] == "CAUTION":
+                    tags = ('caution_tag',)
+                else:
+                    tags = ()
+                diff_tree.insert("", "end", values=(serial, row["package"], row["safety"], row["category"], (row["state"] or "?").capitalize(), row["change"]), tags=tags)
+
+        changes = sum(len(packages) for packages in plan.values())
+        handled = sum(len(packages) for packages in resolution["already_handled"].values())
+        missing = sum(len(packages) for packages in resolution["not_installed"].values())
+        summary = f"{profile.description}\n\n" if profile.description else ""
+        summary += (f"{changes} app(s) to uninstall (or disable) on {len(plan)} device(s); "
+                    f"{handled} already uninstalled/disabled, {missing} listed by the profile but not installed.")
+        if any(row["safety"] == "RISKY" and row["change"] == "uninstall" for rows in diff.values() for row in rows):
+            summary += "\n\nWARNING: Apps marked RISKY are included. This may cause significant system issues or bootloops."
+        ttk.Label(window, text=summary, wraplength=740, justify=tk.CENTER, font=('TkDefaultFont', 9, 'bold')).pack(pady=10)
+
+        button_frame = ttk.Frame(window, padding="0 0 10 10")
+        button_frame.pack(fill=tk.X, anchor=tk.S)
+
+        def on_confirm():
+            window.destroy()
+            self.print_status(f"Applying profile '{profile.name}' ({profile.path}).")
+            self.master.after(0, self._run_plan, plan)
+
+        confirm_button = ttk.Button(button_frame, text="Apply Profile", command=on_confirm, state=tk.NORMAL if plan else tk.DISABLED)
+        confirm_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Close", command=window.destroy).pack(side=tk.RIGHT)
+
+        window.grab_set()
+        self.master.wait_window(window)
+
+    def save_selection_as_profile(self):
+        """Stores the selected apps as a profile in the app data folder, for use on other phones."""
+        from tkinter import messagebox, simpledialog
+        from hyperos_engine import APP_DATA_DIR
+        from hyperos_profiles import Profile, save_profile
+        if not self.selected_packages:
+            messagebox.showwarning("No Selection", "Please select at least one app to save as a profile.")
+            return
+        name = simpledialog.askstring("Save as Profile", "Profile name:", parent=self.master)
+        if not name or not name.strip():
+            return
+        profile = Profile(name.strip(), [{"packages": set(self.selected_packages)}], description=f"{len(self.selected_packages)} apps saved from a selection.")
+        try:
+            path = save_profile(profile, APP_DATA_DIR)
+        except OSError as e:
+            messagebox.showerror("Save Failed", f"Could not write the profile:\n{e}")
+            return
+        self.profile_combobox.set(os.path.splitext(os.path.basename(path))[0]) # Profiles are listed by file name
+        self.print_status(f"Saved {len(self.selected_packages)} selected apps as profile '{profile.name}' to {path}.")
+
+
+    # --- Restore From Journal ---
+    def start_restore(self):
+        """Restores the selected apps (or all journaled ones) on the target devices, after confirmation."""
+        from tkinter import messagebox
+        # Before any scan there are no target devices: then every device in the journal is covered
+        serials = self._target_serials() or None
+        selected = self.get_selected_item_ids()
+        plan = self.engine.restore_plan(serials=serials, packages=set(selected) if selected else None)
+        if not plan:
+            messagebox.showinfo("Nothing to Restore", "The action journal has no uninstalled or disabled apps to restore for this selection.")
+            return
+        count = sum(len(steps) for steps in plan.values())
+        scope = f"{len(selected)} selected app(s)" if selected else "every app this tool uninstalled or disabled"
+        if not messagebox.askyesno("Restore Apps", f"Restore {scope}: {count} action(s) to undo on {len(plan)} device(s) ({', '.join(sorted(plan))}).\n\nContinue?"):
+            return
+
+        self.set_buttons_state(tk.DISABLED)
+        self.process_button.config(state=tk.DISABLED)
+        self.print_status("\n--- Starting Restore ---")
+        self._reset_progress("Packages restored")
+        self._start_job("Restore", self._perform_restore_task, plan)
+
+    def _perform_restore_task(self, job, plan):
+        """Job task run in a worker thread: one batched restore run per device."""
+        try:
+            results = self.engine.restore(plan, on_progress=self._on_engine_progress, job=job)
+            statuses = [result["status"] for device_results in results.values() for result in device_results.values()]
+            restored = statuses.count("RESTORED")
+            self.master.after(0, self.print_status, f"\n--- Restore {'cancelled' if job.cancelled else 'finished'}: {restored} restored, {len(statuses) - restored} not restored ---")
+            self.master.after(0, self.print_status, "Scan again to refresh the app list.")
+        except Exception as e:
+            self.master.after(0, self.print_status, f"\nAn unexpected error occurred in the restore task: {e}")
+            self.master.after(0, self.print_status, "Traceback:\n" + traceback.format_exc())
+        self.master.after(0, self.set_buttons_state, tk.NORMAL)
+        self.master.after(0, self.process_button.config, {"state": tk.NORMAL})
+
+
+    # --- ADB Command Stats ---
+    def show_stats_window(self):
+        """Opens (or raises) a small panel with per-command ADB latency stats, refreshed every second."""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        window = tk.Toplevel(self.master)
+        window.title("ADB Command Stats")
+        from hyperos_engine import METRICS_DIR
+        window.grid_columnconfigure(0, weight=1)
+        window.grid_rowconfigure(0, weight=1)
+
+        columns = ("Command", "Devices", "Calls", "Errors", "Failed", "Mean", "p50", "p95", "Max", "Output")
+        self.stats_tree = ttk.Treeview(window, columns=columns, show="headings", height=8)
+        for column, width in zip(columns, (90, 60, 60, 60, 60, 70, 70, 70, 70, 80)):
+            self.stats_tree.heading(column, text=column, anchor=tk.W)
+            self.stats_tree.column(column, width=width, stretch=tk.NO)
+        self.stats_tree.grid(row=0, column=0, sticky="nsew", padx=10, pady=(10, 5))
+        # Errors: timeouts, dead sessions, cancellations. Failed: commands that exited non-zero.
+        ttk.Label(window, text=f"Errors = did not complete (timeout, session died...), Failed = non-zero exit code.\nExported to {METRICS_DIR} after every job.").grid(row=1, column=0, sticky="w", padx=10)
+
+        buttons_frame = ttk.Frame(window)
+        buttons_frame.grid(row=2, column=0, sticky="e", padx=10, pady=10)
+        ttk.Button(buttons_frame, text="Export Now", command=self._export_stats).grid(row=0, column=0, padx=5)
+        ttk.Button(buttons_frame, text="Reset", command=self._reset_stats).grid(row=0, column=1, padx=5)
+        ttk.Button(buttons_frame, text="Close", command=window.destroy).grid(row=0, column=2, padx=5)
+
+        self.stats_window = window
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        """Redraws the stats panel and schedules the next refresh while it is open. Started once, by show_stats_window."""
+        if self._redraw_stats():
+            self.stats_window.after(STATS_REFRESH_INTERVAL_MS, self._refresh_stats)
+
+    def _redraw_stats(self):
+        """Fills the stats panel from the current metrics. Returns False if the panel is closed."""
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            self.stats_window = None
+            return False
+        def ms(seconds):
+            return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for row in (self.engine.metrics.summary() if self.engine.metrics else []):
+            self.stats_tree.insert("", "end", values=(row["command"], row["devices"], row["calls"], row["errors"], row["failed"],
+                                                      ms(row["mean_seconds"]), ms(row["p50_seconds"]), ms(row["p95_seconds"]),
+                                                      ms(row["max_seconds"]), f"{row['output_bytes'] / 1024:.1f} KB"))
+        return True
+
+    def _export_stats(self):
+        paths = self.engine.export_metrics()
+        if paths:
+            self.print_status("Metrics exported to " + " and ".join(paths))
+        else:
+            from hyperos_engine import METRICS_DIR
+            self.print_status(f"Could not write the metrics files to {METRICS_DIR}.")
+
+    def _reset_stats(self):
+        if self.engine.metrics:
+            self.engine.metrics.reset()
+        self._redraw_stats() # The running refresh loop keeps going; starting another would double it
+
+    # --- Fleet Snapshots ---
+    def show_fleet_window(self):
+        """Opens a window over the saved device snapshots: one row per device with its drift, plus package queries and diffs."""
+        from hyperos_engine import SNAPSHOT_DIR
+        window = tk.Toplevel(self.master)
+        window.title("Fleet Snapshots")
+        window.geometry("900x560")
+        window.grid_columnconfigure(0, weight=1)
+        window.grid_rowconfigure(0, weight=1)
+        window.grid_rowconfigure(3, weight=1)
+
+        columns = ("Device", "Last Scan", "Build", "Apps", "Bloat Enabled", "Since Previous Scan")
+        devices_tree = ttk.Treeview(window, columns=columns, show="headings", height=8)
+        for column, width, stretch in zip(columns, (130, 130, 220, 50, 90, 260), (tk.NO, tk.NO, tk.YES, tk.NO, tk.NO, tk.YES)):
+            devices_tree.heading(column, text=column, anchor=tk.W)
+            devices_tree.column(column, width=width, stretch=stretch)
+        devices_tree.grid(row=0, column=0, sticky="nsew", padx=10, pady=(10, 5))
+        devices_tree.tag_configure('drift_tag', foreground='red') # Catalog apps came back, or the build changed
+
+        query_frame = ttk.Frame(window)
+        query_frame.grid(row=1, column=0, sticky="ew", padx=10)
+        ttk.Label(query_frame, text="Which devices have (globs like com.miui.* work):").pack(side=tk.LEFT)
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(query_frame, textvariable=query_var, width=40)
+        query_entry.pack(side=tk.LEFT, padx=5)
+        find_button = ttk.Button(query_frame, text="Find")
+        find_button.pack(side=tk.LEFT)
+        compare_button = ttk.Button(query_frame, text="Compare 2 Selected Devices")
+        compare_button.pack(side=tk.LEFT, padx=5)
+        status_label = ttk.Label(window, text=f"Loading snapshots from {SNAPSHOT_DIR}...")
+        status_label.grid(row=2, column=0, sticky="w", padx=10, pady=5)
+
+        results_tree = ttk.Treeview(window, columns=("Package", "Device", "State"), show="headings", height=10)
+        for column, width in (("Package", 380), ("Device", 260), ("State", 160)):
+            results_tree.heading(column, text=column, anchor=tk.W)
+            results_tree.column(column, width=width)
+        results_tree.grid(row=3, column=0, sticky="nsew", padx=10, pady=(0, 10))
+        fleet_holder = {}
+
+        def show_results(rows, message):
+            results_tree.delete(*results_tree.get_children())
+            for row in rows:
+                results_tree.insert("", "end", values=row)
+            status_label.config(text=message)
+
+        def on_find(event=None):
+            fleet = fleet_holder.get("fleet")
+            pattern = query_var.get().strip()
+            if fleet is None or not pattern:
+                return
+            found = fleet.devices_with(pattern)
+            rows = [(package, serial, state.capitalize()) for package, holders in found.items() for serial, state in holders.items()]
+            devices = {serial for holders in found.values() for serial in holders}
+            show_results(rows, f"{len(found)} package(s) matching {pattern!r} installed on {len(devices)} of {len(fleet)} device(s).")
+
+        def on_compare():
+            fleet = fleet_holder.get("fleet")
+            selected = devices_tree.selection()
+            if fleet is None or len(selected) != 2:
+                status_label.config(text="Select exactly two devices to compare (Ctrl+click).")
+                return
+            diff = fleet.diff(*selected)
+            rows = [(package, f"only on {diff['a']}", "") for package in diff["only_a"]]
+            rows += [(package, f"only on {diff['b']}", "") for package in diff["only_b"]]
+            rows += [(package, f"{diff['a']} / {diff['b']}", f"{state_a.capitalize()} / {state_b.capitalize()}") for package, (state_a, state_b) in diff["state_differs"].items()]
+            show_results(rows, f"{diff['a']} vs {diff['b']}: {len(diff['only_a'])} app(s) only on the first, {len(diff['only_b'])} only on the second, {len(diff['state_differs'])} in different states.")
+
+        def on_device_double_click(event):
+            fleet = fleet_holder.get("fleet")
+            serial = devices_tree.identify_row(event.y)
+            changes = fleet.drift([serial]).get(serial) if fleet is not None and serial else None
+            if not changes:
+                return
+            rows = [(package, serial, "Enabled again") for package in changes.get("reappeared", [])]
+            rows += [(package, serial, "New") for package in changes.get("added", []) if package not in changes.get("reappeared", [])]
+            rows += [(package, serial, "Removed") for package in changes.get("removed", [])]
+            rows += [(package, serial, f"{old.capitalize()} -> {new.capitalize()}") for package, (old, new) in changes.get("state_changed", {}).items()
+                     if package not in changes.get("reappeared", [])]
+            show_results(rows, f"{serial}: changes since the scan of {time.strftime('%Y-%m-%d %H:%M', time.localtime(changes['since']))}"
+                               + (f"; build changed from {changes['build'][0]}" if "build" in changes else "") + ".")
+
+        def fill(fleet, unreadable):
+            if not window.winfo_exists():
+                return
+            fleet_holder["fleet"] = fleet
+            drift = fleet.drift()
+            for row in fleet.summary():
+                changes = drift.get(row["serial"], {})
+                notes = []
+                if changes.get("reappeared"):
+                    notes.append(f"{len(changes['reappeared'])} catalog app(s) back")
+                if "build" in changes:
+                    notes.append("new build")
+                other = len((set(changes.get("added", [])) | set(changes.get("state_changed", {}))) - set(changes.get("reappeared", []))) + len(changes.get("removed", []))
+                if other:
+                    notes.append(f"{other} other change(s)")
+                devices_tree.insert("", "end", iid=row["serial"], tags=('drift_tag',) if changes.get("reappeared") or "build" in changes else (),
+                                    values=(row["serial"], time.strftime("%Y-%m-%d %H:%M", time.localtime(row["taken_at"])), row["fingerprint"],
+                                            row["packages"], row["bloatware_enabled"], ", ".join(notes) or "-"))
+            message = f"{len(fleet)} device(s) in {SNAPSHOT_DIR}; {len(drift)} changed since their previous scan (double-click for details)."
+            if unreadable:
+                message += f" {len(unreadable)} unreadable snapshot file(s) skipped."
+            status_label.config(text=message)
+
+        def load():
+            from hyperos_fleet import FleetIndex, load_snapshots
+            snapshots, unreadable = load_snapshots(SNAPSHOT_DIR)
+            fleet = FleetIndex(snapshots)
+            self.master.after(0, fill, fleet, unreadable)
+
+        find_button.config(command=on_find)
+        compare_button.config(command=on_compare)
+        query_entry.bind("<Return>", on_find)
+        devices_tree.bind("<Double-1>", on_device_double_click)
+        ttk.Button(window, text="Close", command=window.destroy).grid(row=4, column=0, sticky="e", padx=10, pady=(0, 10))
+        # Hundreds of snapshot files are read and indexed off the GUI thread
+        threading.Thread(target=load, daemon=True).start()
 
 
     def set_buttons_state(self, state):
@@ -852,35 +1504,67 @@ class HyperOSAppManagerGUI:
         self.scan_button.config(state=state)
         # Process button state is managed separately after scan
         self.select_all_button.config(state=state)
-        print(f"--- set_buttons_state: select_all_button state set to {state} ---") # Added print
         self.select_none_button.config(state=state)
-        print(f"--- set_buttons_state: select_none_button state set to {state} ---") # Added print
         self.select_safe_button.config(state=state)
-        print(f"--- set_buttons_state: select_safe_button state set to {state} ---") # Added print
         self.select_caution_button.config(state=state)
-        print(f"--- set_buttons_state: select_caution_button state set to {state} ---") # Added print
         self.select_risky_button.config(state=state)
-        print(f"--- set_buttons_state: select_risky_button state set to {state} ---") # Added print
+        self.export_selection_button.config(state=state)
+        self.import_selection_button.config(state=state)
+        self.restore_button.config(state=state)
+        self.apply_profile_button.config(state=state)
+        self.save_profile_button.config(state=state)
         # Add other selection buttons here
+        log.debug("Main buttons set to %s", state)
 
 
 # --- Run the GUI ---
-# Add print to confirm we are about to enter the main guard
-print("--- About to enter __main__ guard ---")
-if __name__ == "__main__":
-    # Add print to confirm we entered the main guard
-    print("--- Entered __main__ guard ---")
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="HyperOS App Manager (GUI)")
+    parser.add_argument("--log-level", default=os.environ.get("HYPEROS_LOG_LEVEL", "WARNING"),
+                        help="Console log level: DEBUG, INFO, WARNING (default) or ERROR. Also HYPEROS_LOG_LEVEL.")
+    parser.add_argument("--startup-check", action="store_true",
+                        help=f"Open the window, print the startup time as JSON and exit; exit code 1 when over the budget ({STARTUP_BUDGET_MS} ms).")
+    parser.add_argument("--record", metavar="TRANSCRIPT", help="Also write every ADB command and its output to this transcript file (.jsonl or .jsonl.gz).")
+    parser.add_argument("--replay", metavar="TRANSCRIPT", help="Run offline: answer every ADB command from this transcript instead of from the phones.")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="With --replay: multiply the recorded timings by this (default 1: as recorded, 0: no waiting).")
+    parser.add_argument("--report", metavar="FILE", help="Write the run report (one record per device and package of every run) to this .jsonl or .csv file instead of the default.")
+    args, _ = parser.parse_known_args(argv) # Tolerate arguments added by launchers
+    level = logging.getLevelName(args.log_level.upper())
+    logging.basicConfig(level=level if isinstance(level, int) else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    engine_options = {}
+    if args.record:
+        engine_options["record"] = args.record
+    if args.replay:
+        # Read up front, so a bad file is reported before the window opens (see hyperos_transcript.py)
+        from hyperos_transcript import Transcript, TranscriptError
+        try:
+            engine_options["replay"] = Transcript.load(args.replay)
+        except TranscriptError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        engine_options["time_scale"] = args.time_scale
+    if args.report:
+        engine_options["report"] = args.report
+
     try:
-        print("Creating Tkinter root window...")
+        log.debug("Creating Tkinter root window")
         root = tk.Tk()
-        print("Creating App instance...")
-        app = HyperOSAppManagerGUI(root)
-        print("Starting Tkinter main loop...")
+        app = HyperOSAppManagerGUI(root, exit_after_startup=args.startup_check, engine_options=engine_options)
         root.mainloop()
-        print("Tkinter main loop exited.")
-    except Exception as e:
-        print(f"An unhandled exception occurred during GUI startup: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("An unhandled exception occurred during GUI startup")
+        return 1
 
-# Add print at the very end of the script file
-print("--- Script Finished Execution ---")
+    if args.startup_check:
+        within_budget = app.startup_ms is not None and app.startup_ms <= STARTUP_BUDGET_MS
+        print(json.dumps({"startup_ms": round(app.startup_ms) if app.startup_ms is not None else None,
+                          "budget_ms": STARTUP_BUDGET_MS, "within_budget": within_budget}))
+        return 0 if within_budget else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# --- Checks for the adb Server Protocol Client ---
+# Runs hyperos_adb_socket.AdbSocketTransport against the simulated adb server
+# (fake_adb_server.py): device listing, OKAY/FAIL handling, shell v2 framing, the legacy
+# shell's exit code marker, the v2 -> legacy fallback, and dead or aborted commands.
+# Prints one line per check and exits with 1 if any failed. Needs a POSIX 'sh'.
+#
+#   python benchmarks/check_adb_socket.py
+
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_adb_server import FakeAdbServer
+from hyperos_adb_socket import AdbSocketTransport
+from hyperos_engine import parse_adb_devices
+
+DEVICES = {"SER1": "device", "SER2": "unauthorized"}
+
+
+def _transport(server, serial="SER1"):
+    return AdbSocketTransport(serial, port=server.port, pool_size=0)
+
+
+def check_devices():
+    with FakeAdbServer(DEVICES) as server:
+        result = _transport(server, None).list_devices()
+    assert not result["error"], result
+    assert parse_adb_devices(result["stdout"]) == [("SER1", "device"), ("SER2", "unauthorized")], result["stdout"]
+
+
+def check_transport_fail():
+    with FakeAdbServer(DEVICES) as server:
+        for serial in ("SER2", "MISSING"):
+            transport = _transport(server, serial)
+            result = transport.run_adb_command(["true"])
+            assert result["error"] and result["type"] == "ADB_PROTOCOL_FAIL", result
+            assert transport._shell_v2 is None, "a transport FAIL must not decide the shell protocol"
+
+
+def check_transient_transport_fail_keeps_v2():
+    with FakeAdbServer(DEVICES) as server:
+        transport = _transport(server)
+        server.transport_failures["SER1"] = 1
+        result = transport.run_adb_command(["echo", "hi"])
+        assert result["error"] and result["type"] == "ADB_PROTOCOL_FAIL", result
+        result = transport.run_adb_command(["echo", "hi"])
+        assert not result["error"] and result["stdout"] == "hi\n", result
+        assert transport._shell_v2 is True
+        assert not any(request.startswith("shell:") for request in server.requests), server.requests
+
+
+def check_v2_framing():
+    with FakeAdbServer(DEVICES) as server:
+        transport = _transport(server)
+        result = transport.run_adb_command(["sh", "-c", "echo out; echo err >&2; printf 'no newline'; exit 3"])
+        assert not result["error"] and result["returncode"] == 3, result
+        for text in ("out\n", "err\n", "no newline"):
+            assert text in result["stdout"], result
+        lines = []
+        result = transport.run_adb_command(["sh", "-c", "seq 1 20000"], on_line=lines.append, keep_output=False)
+        assert result["returncode"] == 0 and result["stdout"] == "" and lines == [str(n) for n in range(1, 20001)], (result, len(lines))
+        result = transport.run_adb_command(["sh", "-c", "seq 1 100000"], stop_when=lambda line: line == "5")
+        assert result.get("stopped") and result["stdout"].startswith("1\n2\n3\n4\n5"), result
+
+
+def check_legacy_fallback():
+    with FakeAdbServer(DEVICES, shell_v2=False) as server:
+        transport = _transport(server)
+        result = transport.run_adb_command(["sh", "-c", "echo a; echo b >&2; exit 5"])
+        assert not result["error"] and result["returncode"] == 5 and result["stdout"] == "a\nb\n", result
+        assert transport._shell_v2 is False
+        result = transport.run_adb_command(["printf", "tail without newline"])
+        assert result["returncode"] == 0 and result["stdout"] == "tail without newline", result
+        assert [request.split(":", 1)[0] for request in server.requests if request.startswith("shell")] == ["shell,v2,raw", "shell", "shell"], server.requests
+
+
+def check_legacy_streaming():
+    with FakeAdbServer(DEVICES, shell_v2=False) as server:
+        transport = _transport(server)
+        transport._shell_v2 = False
+        lines = []
+        started = time.perf_counter()
+        result = transport.run_adb_command(["sh", "-c", "seq 1 200000"], on_line=lines.append, keep_output=False)
+        elapsed = time.perf_counter() - started
+        assert result["returncode"] == 0 and result["stdout"] == "" and len(lines) == 200000 and lines[-1] == "200000", (result, len(lines))
+        result = transport.run_adb_command(["sh", "-c", "printf 'caf\\303\\251\\n'; exit 2"])
+        assert result["returncode"] == 2 and result["stdout"] == "café\n", result
+    return f"200000 lines in {elapsed:.2f}s"
+
+
+def check_dropped_stream():
+    with FakeAdbServer(DEVICES) as server:
+        server.drop_before_exit = True
+        result = _transport(server).run_adb_command(["echo", "partial"])
+        assert result["error"] and result["type"] == "SESSION_DIED" and result["stdout_on_timeout"] == "partial\n", result
+
+
+def check_abort():
+    for shell_v2 in (True, False):
+        with FakeAdbServer(DEVICES, shell_v2=shell_v2) as server:
+            transport = _transport(server)
+            transport._shell_v2 = shell_v2 or False
+            threading.Timer(0.3, transport.abort).start()
+            started = time.monotonic()
+            result = transport.run_adb_command(["sh", "-c", "echo started; sleep 5"])
+            assert result["error"] and result["type"] == "SESSION_DIED", result
+            assert time.monotonic() - started < 3, "abort() did not end the command"
+
+
+def check_idle_timeout():
+    with FakeAdbServer(DEVICES) as server:
+        result = _transport(server).run_adb_command(["sh", "-c", "echo one; sleep 3"], idle_timeout=0.3)
+        assert result["error"] and result["type"] == "IDLE_TIMEOUT" and result["stdout_on_timeout"] == "one\n", result
+
+
+CHECKS = [check_devices, check_transport_fail, check_transient_transport_fail_keeps_v2, check_v2_framing,
+          check_legacy_fallback, check_legacy_streaming, check_dropped_stream, check_abort, check_idle_timeout]
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            note = check()
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+        else:
+            print(f"ok   {check.__name__}" + (f" ({note})" if note else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
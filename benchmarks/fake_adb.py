@@ -0,0 +1,99 @@
+# --- Simulated 'adb' Executable for the Benchmarks ---
+# Stands in for the real adb so scans and processing runs can be timed without phones.
+# run_benchmarks.py puts a small 'adb' wrapper script that runs this file first on PATH.
+# Supported: 'adb devices', 'adb [-s SERIAL] shell' (interactive, as used by the engine's
+# persistent sessions) and 'adb [-s SERIAL] shell CMD...'. Device-side commands run in a real
+# 'sh' with the fake 'pm', 'getprop', 'cmd' and 'dumpsys' from fake_device/ first on PATH.
+#
+# Configured through environment variables:
+#   FAKE_ADB_DEVICES      number of attached devices (serials BENCH0001, BENCH0002, ...)
+#   FAKE_ADB_STATE_DIR    package state directory, one sub-directory per serial (see fake_device/pm)
+#   FAKE_ADB_DEVICE_BIN   directory with the fake device-side commands
+#   FAKE_ADB_LATENCY      seconds added to every host<->device round-trip (each adb call and
+#                         each command line sent to an interactive shell)
+#   FAKE_ADB_PM_LATENCY, FAKE_ADB_HANG_SECONDS: used by fake_device/pm
+
+import os
+import subprocess
+import sys
+import time
+
+
+def device_serials():
+    """Serials of the simulated devices, in 'adb devices' order."""
+    count = int(os.environ.get("FAKE_ADB_DEVICES", "1"))
+    return [f"BENCH{index:04d}" for index in range(1, count + 1)]
+
+
+def _latency():
+    return float(os.environ.get("FAKE_ADB_LATENCY", "0") or 0)
+
+
+def _device_env(serial):
+    env = dict(os.environ)
+    env["FAKE_ADB_SERIAL"] = serial
+    env["PATH"] = os.environ["FAKE_ADB_DEVICE_BIN"] + os.pathsep + env.get("PATH", "")
+    return env
+
+
+def _relay_shell(env, latency):
+    """Interactive shell whose command lines each arrive 'latency' seconds late."""
+    process = subprocess.Popen(["sh"], stdin=subprocess.PIPE, env=env)
+    try:
+        for line in iter(sys.stdin.buffer.readline, b""):
+            time.sleep(latency)
+            process.stdin.write(line)
+            process.stdin.flush()
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+    return process.wait()
+
+
+def main(argv):
+    serial = None
+    if len(argv) >= 2 and argv[0] == "-s":
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        print("adb: usage: adb [-s SERIAL] devices|shell [COMMAND...]", file=sys.stderr)
+        return 1
+
+    latency = _latency()
+    if latency > 0:
+        time.sleep(latency)
+    serials = device_serials()
+
+    if argv[0] == "devices":
+        print("List of devices attached")
+        for device in serials:
+            print(f"{device}\tdevice")
+        print()
+        return 0
+
+    if argv[0] == "shell":
+        if serial is None:
+            if len(serials) != 1:
+                print("adb: more than one device/emulator", file=sys.stderr)
+                return 1
+            serial = serials[0]
+        if serial not in serials:
+            print(f"adb: device '{serial}' not found", file=sys.stderr)
+            return 1
+        env = _device_env(serial)
+        if len(argv) > 1:
+            return subprocess.call(["sh", "-c", " ".join(argv[1:])], env=env)
+        if latency > 0:
+            return _relay_shell(env, latency)
+        sys.stdout.flush()
+        os.execvpe("sh", ["sh"], env) # No latency: the engine talks to the device shell directly
+
+    print(f"adb: unknown command {argv[0]}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,161 @@
+# --- Simulated adb Server (smart-socket protocol) ---
+# Stands in for the adb server on localhost so hyperos_adb_socket.AdbSocketTransport can be
+# exercised without adb or phones. It speaks just enough of the protocol:
+#   host:devices                  OKAY + length-prefixed "serial<TAB>state" lines
+#   host:transport:<serial>       OKAY if the device is attached in state "device", else FAIL
+#   host:transport-any            the first attached device
+#   shell,v2,raw:<command>        shell protocol v2 packets (stdout/stderr, then the exit code),
+#                                 or FAIL when the server was created with shell_v2=False
+#   shell:<command>               legacy raw stream, closed when the command ends
+# Device-side commands run in a local 'sh', with FAKE_ADB_SERIAL set and bin_dir (e.g.
+# fake_device/) first on PATH, like fake_adb.py.
+#
+# Faults can be switched on per server to check the client's error handling:
+#   transport_failures[serial] = n   the next n transport switches to serial answer FAIL
+#   drop_before_exit = True          v2 commands end without their exit packet (device gone)
+
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import threading
+
+_SHELL_STDOUT = 1
+_SHELL_STDERR = 2
+_SHELL_EXIT = 3
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def _length_prefixed(text):
+    data = text.encode("utf-8")
+    return b"%04x" % len(data) + data
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """A fake adb server on 127.0.0.1 (port 0: any free port, see .port). Use as a context manager."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices, shell_v2=True, bin_dir=None, port=0):
+        super().__init__(("127.0.0.1", port), _Connection)
+        self.devices = dict(devices) # serial -> state ("device", "unauthorized", "offline")
+        self.shell_v2 = shell_v2
+        self.bin_dir = bin_dir
+        self.transport_failures = {}
+        self.drop_before_exit = False
+        self.requests = [] # Every request payload received, in order
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def _take_transport_failure(self, serial):
+        with self._lock:
+            if self.transport_failures.get(serial, 0) > 0:
+                self.transport_failures[serial] -= 1
+                return True
+        return False
+
+    def start_command(self, serial, command, stderr=subprocess.PIPE):
+        env = dict(os.environ, FAKE_ADB_SERIAL=serial)
+        if self.bin_dir:
+            env["PATH"] = self.bin_dir + os.pathsep + env.get("PATH", "")
+        return subprocess.Popen(["sh", "-c", command], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr, env=env)
+
+
+class _Connection(socketserver.BaseRequestHandler):
+    """One client socket: host requests, an optional transport switch, then one device service."""
+
+    def handle(self):
+        server, sock = self.server, self.request
+        serial = None
+        try:
+            while True:
+                payload = _recv_exact(sock, int(_recv_exact(sock, 4), 16)).decode("utf-8")
+                with server._lock:
+                    server.requests.append(payload)
+                if payload == "host:devices":
+                    listing = "".join(f"{device}\t{state}\n" for device, state in server.devices.items())
+                    sock.sendall(b"OKAY" + _length_prefixed(listing))
+                    return
+                if payload.startswith("host:transport"):
+                    wanted = payload[len("host:transport:"):] if payload.startswith("host:transport:") else next(iter(server.devices), "")
+                    state = server.devices.get(wanted)
+                    if state is None or server._take_transport_failure(wanted):
+                        sock.sendall(b"FAIL" + _length_prefixed(f"device '{wanted}' not found"))
+                        return
+                    if state != "device":
+                        sock.sendall(b"FAIL" + _length_prefixed(f"device {state}"))
+                        return
+                    serial = wanted
+                    sock.sendall(b"OKAY")
+                elif serial is not None and payload.startswith("shell,v2,raw:") and server.shell_v2:
+                    sock.sendall(b"OKAY")
+                    self._shell_v2(serial, payload[len("shell,v2,raw:"):])
+                    return
+                elif serial is not None and payload.startswith("shell:"):
+                    sock.sendall(b"OKAY")
+                    self._shell_legacy(serial, payload[len("shell:"):])
+                    return
+                else:
+                    sock.sendall(b"FAIL" + _length_prefixed("closed" if serial is not None else f"unknown host service '{payload}'"))
+                    return
+        except (EOFError, OSError, ValueError):
+            pass # Client went away or sent garbage
+
+    def _shell_v2(self, serial, command):
+        sock = self.request
+        _recv_exact(sock, 5) # The client's close-stdin packet; left unread, closing would reset the connection
+        process = self.server.start_command(serial, command)
+        lock = threading.Lock()
+
+        def pump(stream, packet_id):
+            for chunk in iter(lambda: stream.read1(4096), b""):
+                with lock:
+                    sock.sendall(struct.pack("<BI", packet_id, len(chunk)) + chunk)
+
+        stderr_thread = threading.Thread(target=pump, args=(process.stderr, _SHELL_STDERR), daemon=True)
+        stderr_thread.start()
+        try:
+            pump(process.stdout, _SHELL_STDOUT)
+            stderr_thread.join()
+            returncode = process.wait()
+            if not self.server.drop_before_exit:
+                sock.sendall(struct.pack("<BI", _SHELL_EXIT, 1) + bytes([returncode & 0xFF]))
+        finally:
+            if process.poll() is None:
+                process.kill() # The client closed the socket (stop_when, abort)
+
+    def _shell_legacy(self, serial, command):
+        process = self.server.start_command(serial, command, stderr=subprocess.STDOUT)
+        try:
+            for chunk in iter(lambda: process.stdout.read1(4096), b""):
+                self.request.sendall(chunk.replace(b"\n", b"\r\n")) # Legacy shell runs in a PTY
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+            try:
+                self.request.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
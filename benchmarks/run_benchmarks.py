@@ -0,0 +1,558 @@
+# --- HyperOS App Manager Benchmarks ---
+# Times scans and processing runs against simulated devices, so performance changes can be
+# measured reproducibly without a rack of phones. A fake 'adb' (fake_adb.py) is put first on
+# PATH; the devices behind it keep their packages in a temporary directory (fake_device/pm).
+#
+# For every scale (number of catalog packages installed per device) a separate worker process
+# is started with its own data dir and a synthetic catalog of that size, and measures:
+#   scan:            first scan (full package lists)               -> seconds
+#   rescan_cached:   rescan with the per-device scan cache          -> seconds
+#   catalog_match:   one device's package list matched against the catalog's exact entries and
+#                    pattern rules (as many as catalog packages, none matching) -> ms
+#   filters:         _apply_filters over several filter combinations -> ms per call (Tk only)
+#   search:          the search box, typed one character at a time  -> ms per keystroke
+#                    (with Tk: the debounced re-filter and redraw; without: SearchIndex.search)
+#   impact:          impact analysis of every found package (dumpsys package, see hyperos_dumpsys.py):
+#                    first run, cached rerun, and the parser alone on one device's dump -> seconds
+#   process_batch:   batch mode processing of every found package   -> packages/s
+#   process_single:  package by package processing                 -> packages/s
+# plus the peak RSS after each phase (optionally the tracemalloc peak) and, with Tk, how late
+# a 10 ms timer fires in the event loop while the phase runs (GUI responsiveness).
+# adb_commands holds the engine's per-command latency summary over all phases.
+#
+# With a display the real GUI is driven (start_scan -> _perform_scan_task, _apply_filters,
+# _start_processing_thread -> _perform_process_task); without one the engine is driven directly
+# and the Tk-only measurements are null. Results are written as JSON (see --output).
+# Needs a POSIX 'sh' for the simulated devices (Linux, macOS, WSL).
+#
+# Examples:
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --scales 100,1000 --devices 4 --latency 0.02
+#   python benchmarks/run_benchmarks.py --fail-rate 0.05 --timeout-rate 0.01 --command-timeout 5
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_FORMAT = 1 # Bump when the layout of the results JSON changes
+DEFAULT_SCALES = "10,100,1000,10000"
+SAFETY_CYCLE = ("SAFE", "CAUTION", "RISKY")
+CATEGORY_CYCLE = ("Android_System", "Google", "Xiaomi", "Facebook", "Other_ThirdParty", "Manufacturer_Test", "Game")
+PROBE_INTERVAL_MS = 10 # Event-loop probe timer
+# Typed into the search box one character at a time: package name, description, category, fuzzy, no match
+SEARCH_QUERIES = ("app00042", "benchmark app 7", "facebook", "fcbk", "zzzz")
+
+
+# --- Simulated Devices ---
+def catalog_package(index):
+    return f"com.bench.bloat.app{index:05d}"
+
+
+def catalog_pattern(index):
+    """Pattern rule that matches none of the simulated packages: mostly prefix rules, some suffix and infix ones."""
+    if index % 10 == 0:
+        return f"*.bench.variant{index:05d}"
+    if index % 50 == 1:
+        return f"*.bench.module{index:05d}.*"
+    return f"com.bench.region{index:05d}.*"
+
+
+def write_catalog(path, scale):
+    """Writes a synthetic CSV catalog of 'scale' packages and 'scale' pattern rules (extra layer, see hyperos_catalog.py)."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("package,description,safety,category,priority\n")
+        for index in range(scale):
+            f.write(f"{catalog_package(index)},Benchmark app {index},{SAFETY_CYCLE[index % 3]},{CATEGORY_CYCLE[index % len(CATEGORY_CYCLE)]},\n")
+        for index in range(scale):
+            f.write(f"{catalog_pattern(index)},Benchmark rule {index},{SAFETY_CYCLE[index % 3]},{CATEGORY_CYCLE[index % len(CATEGORY_CYCLE)]},{index % 3}\n")
+
+
+def write_device_states(state_dir, devices, scale, fail_rate, timeout_rate, seed):
+    """(Re)creates every device's packages: all catalog packages plus half as many unknown ones, all enabled.
+
+    fail_rate / timeout_rate of the catalog packages are marked 'fail' / 'hang' (see fake_device/pm);
+    which ones only depends on the seed, so runs are reproducible.
+    """
+    shutil.rmtree(state_dir, ignore_errors=True)
+    for device_index in range(devices):
+        serial = f"BENCH{device_index + 1:04d}"
+        device_dir = os.path.join(state_dir, serial)
+        os.makedirs(device_dir)
+        rng = random.Random(f"{seed}-{serial}")
+        for index in range(scale):
+            roll = rng.random()
+            flag = "fail" if roll < fail_rate else "hang" if roll < fail_rate + timeout_rate else ""
+            with open(os.path.join(device_dir, catalog_package(index)), "w") as f:
+                f.write(f"enabled {flag}\n")
+        for index in range(max(10, scale // 2)): # Packages the catalog does not know
+            with open(os.path.join(device_dir, f"com.bench.user.app{index:05d}"), "w") as f:
+                f.write("enabled \n")
+
+
+def write_adb_wrapper(bin_dir):
+    """Creates bin_dir/adb running fake_adb.py with this Python, and the device-side commands."""
+    os.makedirs(bin_dir, exist_ok=True)
+    adb_path = os.path.join(bin_dir, "adb")
+    with open(adb_path, "w") as f:
+        f.write(f"#!/bin/sh\nexec '{sys.executable}' '{os.path.join(BENCH_DIR, 'fake_adb.py')}' \"$@\"\n")
+    os.chmod(adb_path, 0o755)
+    device_bin = os.path.join(bin_dir, "device")
+    shutil.copytree(os.path.join(BENCH_DIR, "fake_device"), device_bin)
+    for name in os.listdir(device_bin):
+        os.chmod(os.path.join(device_bin, name), 0o755)
+    return device_bin
+
+
+# --- Measurements ---
+def _rss_peak_kb():
+    """Peak resident set size of this process so far, in KiB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # macOS reports bytes
+
+
+def _start_phase(trace_memory):
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.reset_peak()
+    return time.perf_counter()
+
+
+def _end_phase(started, trace_memory, **values):
+    """Builds a phase result: duration, memory peaks and any extra values."""
+    result = {"seconds": round(time.perf_counter() - started, 4)}
+    result.update(values)
+    result["rss_peak_kb"] = _rss_peak_kb()
+    if trace_memory:
+        import tracemalloc
+        result["python_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+    return result
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _timing_stats(timings):
+    return {"calls": len(timings), "mean_ms": round(sum(timings) / len(timings), 3),
+            "p95_ms": round(_percentile(timings, 0.95), 3), "max_ms": round(max(timings), 3)}
+
+
+def _keystrokes():
+    """Search box contents after every keystroke of SEARCH_QUERIES."""
+    for query in SEARCH_QUERIES:
+        for length in range(1, len(query) + 1):
+            yield query[:length]
+
+
+def _bench_catalog_match(config, trace):
+    """Times matching the first device's package list against the catalog (exact entries and pattern rules)."""
+    from hyperos_engine import get_catalog
+    catalog = get_catalog()[0]
+    packages = os.listdir(os.path.join(config["state_dir"], sorted(os.listdir(config["state_dir"]))[0]))
+    started = _start_phase(trace)
+    matched = catalog.match(packages)
+    match_ms = round((time.perf_counter() - started) * 1000, 3)
+    return _end_phase(started, trace, match_ms=match_ms, packages=len(packages), matched=len(matched), patterns=len(catalog.rules))
+
+
+def _bench_impact(engine, plan, trace):
+    """Times analyze_impact on a plan: cold (dumpsys + index), cached, and the parser alone."""
+    from hyperos_dumpsys import PackageIndexParser, build_impact_script
+    started = _start_phase(trace)
+    results = engine.analyze_impact(plan)
+    cold_seconds = time.perf_counter() - started
+    cached_started = time.perf_counter()
+    engine.analyze_impact(plan) # Same scan: every device's index is reused
+    cached_seconds = time.perf_counter() - cached_started
+
+    parse_seconds = lines = None
+    if plan:
+        dump = engine.get_session(sorted(plan)[0]).run_adb_command(["sh", "-c", build_impact_script()], timeout=300)
+        if not dump.get("error"):
+            dump_lines = dump["stdout"].splitlines()
+            parser = PackageIndexParser()
+            parse_started = time.perf_counter()
+            for line in dump_lines:
+                parser.feed(line)
+            parse_seconds = round(time.perf_counter() - parse_started, 4)
+            lines = len(dump_lines)
+    flagged = sum(1 for device_result in results.values() for flags in (device_result or {}).values() if any(level == "HIGH" for level, _ in flags))
+    return _end_phase(started, trace, cold_seconds=round(cold_seconds, 4), cached_seconds=round(cached_seconds, 4),
+                      parse_seconds=parse_seconds, dump_lines=lines, high_impact=flagged)
+
+
+def _status_counts(results, key="status"):
+    """Counts the per-package statuses (or another field, e.g. "verification") of an apply()/restore() result."""
+    counts = {}
+    for device_results in results.values():
+        for result in device_results.values():
+            counts[result.get(key)] = counts.get(result.get(key), 0) + 1
+    return counts
+
+
+def _throughput(phase, packages):
+    phase["packages"] = packages
+    phase["packages_per_s"] = round(packages / phase["seconds"], 2) if phase["seconds"] > 0 else None
+    return phase
+
+
+class EventLoopProbe:
+    """Measures how late a repeating Tk timer fires while work runs (main-thread stalls)."""
+
+    def __init__(self, root, interval_ms=PROBE_INTERVAL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.lags = []
+        self._generation = 0 # Timers left over from an earlier start() are ignored
+        self._running = False
+
+    def start(self):
+        self.lags = []
+        self._generation += 1
+        self._running = True
+        self._schedule(self._generation)
+
+    def _schedule(self, generation):
+        due = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self._tick, generation, due)
+
+    def _tick(self, generation, due):
+        if not self._running or generation != self._generation:
+            return
+        self.lags.append(max(0.0, time.perf_counter() - due) * 1000)
+        self._schedule(generation)
+
+    def stop(self):
+        """Stops probing and returns the lag statistics in milliseconds."""
+        self._running = False
+        if not self.lags:
+            return {"samples": 0, "mean_lag_ms": None, "p95_lag_ms": None, "max_lag_ms": None}
+        return {"samples": len(self.lags), "mean_lag_ms": round(sum(self.lags) / len(self.lags), 2),
+                "p95_lag_ms": round(_percentile(self.lags, 0.95), 2), "max_lag_ms": round(max(self.lags), 2)}
+
+
+def _pump_until(root, done, timeout):
+    """Runs the Tk event loop until done() is true."""
+    deadline = time.monotonic() + timeout
+    while not done():
+        root.update()
+        time.sleep(0.002)
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Benchmark phase did not finish within {timeout}s")
+
+
+# --- Worker (one scale per process) ---
+def _bench_engine(config, engine, reset_devices):
+    """Drives the engine directly (no display): scan, cached rescan and processing."""
+    from hyperos_engine import AppManagerEngine
+    trace = config["tracemalloc"]
+    phases = {}
+
+    started = _start_phase(trace)
+    scan_result = engine.scan(use_cache=False)
+    if scan_result.get("error"):
+        raise RuntimeError(scan_result.get("message", "scan failed").strip())
+    phases["scan"] = _end_phase(started, trace, packages=len(scan_result["bloatware"]), event_loop=None)
+
+    started = _start_phase(trace)
+    rescan_result = engine.scan(use_cache=True)
+    phases["rescan_cached"] = _end_phase(started, trace, packages=len(rescan_result.get("bloatware", {})), event_loop=None)
+    phases["catalog_match"] = _bench_catalog_match(config, trace)
+    phases["filters"] = None # Needs the GUI
+
+    from hyperos_search import SearchIndex
+    started = _start_phase(trace)
+    index = SearchIndex(scan_result["bloatware"])
+    index_ms = round((time.perf_counter() - started) * 1000, 3)
+    timings = []
+    for text in _keystrokes():
+        call_started = time.perf_counter()
+        index.search(text)
+        timings.append((time.perf_counter() - call_started) * 1000)
+    phases["search"] = _end_phase(started, trace, index_ms=index_ms, **_timing_stats(timings))
+
+    plan = AppManagerEngine.plan(scan_result)
+    packages = sum(len(device_packages) for device_packages in plan.values())
+    phases["impact"] = _bench_impact(engine, plan, trace)
+    for mode, batch in (("process_batch", True), ("process_single", False)):
+        if not batch and config["scale"] > config["single_max"]:
+            phases[mode] = {"skipped": f"more than --single-max {config['single_max']} packages"}
+            continue
+        reset_devices()
+        engine.close()
+        started = _start_phase(trace)
+        results = engine.apply(plan, batch=batch)
+        phases[mode] = _throughput(_end_phase(started, trace, statuses=_status_counts(results), verification=_status_counts(results, "verification"), event_loop=None), packages)
+    phases["adb_commands"] = engine.metrics.summary() # Per-command latency over all phases (see hyperos_metrics.py)
+    return phases
+
+
+def _bench_gui(config, gui, root, reset_devices, timeouts):
+    """Drives the real GUI: start_scan, _apply_filters and _start_processing_thread."""
+    trace = config["tracemalloc"]
+    phase_timeout = config["phase_timeout"]
+    app = gui.HyperOSAppManagerGUI(root)
+    if timeouts:
+        app.engine.timeouts = timeouts
+    probe = EventLoopProbe(root)
+    root.update()
+    phases = {}
+
+    for name, full_rescan in (("scan", True), ("rescan_cached", False)):
+        app.full_rescan_var.set(full_rescan)
+        probe.start()
+        started = _start_phase(trace)
+        app.start_scan() # -> _perform_scan_task on the job thread, _populate_tree back in the GUI thread
+        _pump_until(root, lambda: app.current_job is None, phase_timeout)
+        phases[name] = _end_phase(started, trace, packages=len(app.all_installed_bloatware), rows=len(app._item_packages), event_loop=probe.stop())
+    phases["catalog_match"] = _bench_catalog_match(config, trace)
+
+    filter_combinations = [("SAFE", "All"), ("CAUTION", "All"), ("All", CATEGORY_CYCLE[0]), ("RISKY", CATEGORY_CYCLE[1]), ("All", "All")]
+    timings = []
+    started = _start_phase(trace)
+    for _ in range(config["filter_rounds"]):
+        for safety, category in filter_combinations:
+            app.safety_filter_combobox.set(safety)
+            app.category_filter_combobox.set(category)
+            call_started = time.perf_counter()
+            app._apply_filters()
+            root.update_idletasks() # Include the redraw of the reattached rows
+            timings.append((time.perf_counter() - call_started) * 1000)
+            root.update()
+    phases["filters"] = _end_phase(started, trace, **_timing_stats(timings))
+
+    timings = []
+    started = _start_phase(trace)
+    for text in _keystrokes():
+        app.search_var.set(text) # Schedules the debounced re-filter, which _apply_search runs right away
+        call_started = time.perf_counter()
+        app._apply_search()
+        root.update_idletasks()
+        timings.append((time.perf_counter() - call_started) * 1000)
+        root.update()
+    app.search_var.set("")
+    app._apply_search() # Processing below works on every row again
+    phases["search"] = _end_phase(started, trace, index_ms=None, **_timing_stats(timings)) # The index is built by the scan job
+
+    # The review window runs the same analysis in a background thread
+    phases["impact"] = _bench_impact(app.engine, app.engine.plan({"devices": app.device_bloatware, "states": app.device_states}), trace)
+
+    # Capture what apply() returns; the GUI itself only shows it in the verification window
+    captured = {}
+    apply = app.engine.apply
+    def recording_apply(*args, **kwargs):
+        captured.clear()
+        captured.update(apply(*args, **kwargs))
+        return captured
+    app.engine.apply = recording_apply
+
+    for mode, batch in (("process_batch", True), ("process_single", False)):
+        if not batch and config["scale"] > config["single_max"]:
+            phases[mode] = {"skipped": f"more than --single-max {config['single_max']} packages"}
+            continue
+        reset_devices() # The GUI still shows the states of the last scan: everything enabled
+        app.select_all_apps()
+        app._packages_to_process_in_thread = app.get_selected_item_ids()
+        app.batch_mode_var.set(batch)
+        probe.start()
+        started = _start_phase(trace)
+        app._start_processing_thread() # -> _perform_process_task on the job thread
+        _pump_until(root, lambda: app.current_job is None, phase_timeout)
+        packages = sum(len(device_results) for device_results in captured.values())
+        phases[mode] = _throughput(_end_phase(started, trace, statuses=_status_counts(captured), verification=_status_counts(captured, "verification"), event_loop=probe.stop()), packages)
+
+    phases["adb_commands"] = app.engine.metrics.summary()
+    app.status_sink.close()
+    app.engine.close()
+    return phases
+
+
+def run_worker(config_path):
+    """Measures one scale; the environment (PATH, data dir, catalog) was set up by the parent."""
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+    if config["tracemalloc"]:
+        import tracemalloc
+        tracemalloc.start()
+    sys.path.insert(0, REPO_DIR)
+    startup = time.perf_counter()
+
+    def reset_devices():
+        write_device_states(config["state_dir"], config["devices"], config["scale"], config["fail_rate"], config["timeout_rate"], config["seed"])
+
+    root = None
+    if config["frontend"] in ("auto", "tk"):
+        try:
+            import tkinter
+            root = tkinter.Tk()
+        except Exception as e: # No display (TclError) or no Tk at all
+            if config["frontend"] == "tk":
+                raise RuntimeError(f"Tk is not available: {e}")
+
+    from hyperos_jobs import AdaptiveTimeouts, COMMAND_TIMEOUTS
+    timeouts = None
+    if config["command_timeout"]:
+        cap = config["command_timeout"]
+        timeouts = AdaptiveTimeouts({command_class: (min(low, cap), min(initial, cap), cap) for command_class, (low, initial, _) in COMMAND_TIMEOUTS.items()})
+
+    if root is not None:
+        import HyperOS_app_manager_GUI as gui
+        import_seconds = time.perf_counter() - startup
+        try:
+            phases = _bench_gui(config, gui, root, reset_devices, timeouts)
+        finally:
+            root.destroy()
+        frontend = "tk"
+    else:
+        from hyperos_engine import AppManagerEngine
+        import_seconds = time.perf_counter() - startup
+        engine = AppManagerEngine(timeouts=timeouts)
+        try:
+            phases = _bench_engine(config, engine, reset_devices)
+        finally:
+            engine.close()
+        frontend = "engine"
+
+    from hyperos_engine import get_catalog
+    result = {"scale": config["scale"], "devices": config["devices"], "frontend": frontend,
+              "catalog_entries": get_catalog()[1]["entries"], "import_seconds": round(import_seconds, 4), "phases": phases}
+    with open(config["result_path"], "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return 0
+
+
+# --- Runner ---
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_scale(args, scale):
+    """Prepares a temporary bench setup for one scale and runs a worker process on it."""
+    work_dir = tempfile.mkdtemp(prefix=f"hyperos-bench-{scale}-")
+    try:
+        bin_dir = os.path.join(work_dir, "bin")
+        device_bin = write_adb_wrapper(bin_dir)
+        catalog_path = os.path.join(work_dir, "catalog.csv")
+        write_catalog(catalog_path, scale)
+        config = {"scale": scale, "devices": args.devices, "fail_rate": args.fail_rate, "timeout_rate": args.timeout_rate,
+                  "seed": args.seed, "frontend": args.frontend, "single_max": args.single_max, "tracemalloc": args.tracemalloc,
+                  "command_timeout": args.command_timeout, "filter_rounds": args.filter_rounds, "phase_timeout": args.phase_timeout,
+                  "state_dir": os.path.join(work_dir, "devices"), "result_path": os.path.join(work_dir, "result.json")}
+        write_device_states(config["state_dir"], args.devices, scale, args.fail_rate, args.timeout_rate, args.seed)
+        config_path = os.path.join(work_dir, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+
+        env = dict(os.environ)
+        env.update({"PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+                    "HYPEROS_APP_MANAGER_HOME": os.path.join(work_dir, "home"),
+                    "HYPEROS_CATALOG_PATH": catalog_path,
+                    "FAKE_ADB_DEVICES": str(args.devices),
+                    "FAKE_ADB_STATE_DIR": config["state_dir"],
+                    "FAKE_ADB_DEVICE_BIN": device_bin,
+                    "FAKE_ADB_LATENCY": str(args.latency),
+                    "FAKE_ADB_PM_LATENCY": str(args.pm_latency),
+                    "FAKE_ADB_HANG_SECONDS": str(args.hang_seconds)})
+        # The GUI prints a lot of progress to stdout; keep it unless --verbose
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", config_path], env=env,
+                                   stdout=None if args.verbose else subprocess.DEVNULL)
+        if completed.returncode != 0 or not os.path.isfile(config["result_path"]):
+            return {"scale": scale, "devices": args.devices, "error": f"worker exited with code {completed.returncode}"}
+        with open(config["result_path"], encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        if args.keep:
+            print(f"Kept bench files in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _summary_line(result):
+    if result.get("error"):
+        return f"{result['scale']:>6} packages: ERROR {result['error']}"
+    phases = result["phases"]
+    parts = [f"{result['scale']:>6} packages x {result['devices']} device(s) [{result['frontend']}]:",
+             f"scan {phases['scan']['seconds']:.2f}s", f"rescan {phases['rescan_cached']['seconds']:.2f}s"]
+    if phases.get("catalog_match"):
+        parts.append(f"match {phases['catalog_match']['match_ms']:.1f}ms")
+    if phases.get("filters"):
+        parts.append(f"filter {phases['filters']['mean_ms']:.1f}ms")
+    if phases.get("search"):
+        parts.append(f"search p95 {phases['search']['p95_ms']:.1f}ms")
+    if phases.get("impact", {}).get("parse_seconds") is not None:
+        parts.append(f"impact {phases['impact']['cold_seconds']:.2f}s (parse {phases['impact']['parse_seconds']:.3f}s)")
+    for mode in ("process_batch", "process_single"):
+        if phases[mode].get("packages_per_s") is not None:
+            parts.append(f"{mode[8:]} {phases[mode]['packages_per_s']:.0f} pkg/s")
+    return " ".join(parts)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark scans and processing against simulated adb devices.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"Comma separated catalog packages per device (default: {DEFAULT_SCALES}).")
+    parser.add_argument("--devices", type=int, default=1, help="Number of simulated devices (default: 1).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every host<->device round-trip (default: 0).")
+    parser.add_argument("--pm-latency", type=float, default=0.0, help="Seconds added to every device-side 'pm' call (default: 0).")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of packages that can be neither uninstalled nor disabled.")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of packages whose uninstall hangs for --hang-seconds.")
+    parser.add_argument("--hang-seconds", type=float, default=10.0, help="How long a hanging uninstall blocks (default: 10).")
+    parser.add_argument("--command-timeout", type=float, help="Cap every command class timeout at this many seconds (see hyperos_jobs.py).")
+    parser.add_argument("--single-max", type=int, default=1000, help="Skip package-by-package processing above this scale (default: 1000).")
+    parser.add_argument("--filter-rounds", type=int, default=5, help="Rounds over the filter combinations (default: 5).")
+    parser.add_argument("--frontend", choices=["auto", "tk", "engine"], default="auto", help="'auto': the GUI if a display is available, else the engine.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the Python allocation peak per phase (slows everything down).")
+    parser.add_argument("--phase-timeout", type=float, default=3600, help="Give up on a GUI phase after this many seconds.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for picking failing/hanging packages (default: 1).")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON file (default: benchmark_results.json).")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary bench directories.")
+    parser.add_argument("--verbose", action="store_true", help="Show the worker's console output.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS) # Internal: config file of one scale
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.worker:
+        return run_worker(args.worker)
+    if shutil.which("sh") is None:
+        print("The simulated devices need a POSIX 'sh' (Linux, macOS or WSL).", file=sys.stderr)
+        return 2
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    report = {"format": RESULTS_FORMAT, "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_revision": _git_revision(),
+              "python": platform.python_version(), "platform": platform.platform(),
+              "config": {key: value for key, value in vars(args).items() if key not in ("worker", "output", "keep", "verbose")},
+              "results": []}
+    for scale in scales:
+        print(f"Benchmarking {scale} packages x {args.devices} device(s)...", file=sys.stderr)
+        result = run_scale(args, scale)
+        report["results"].append(result)
+        print(_summary_line(result), file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 1 if any(result.get("error") for result in report["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
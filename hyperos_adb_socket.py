@@ -0,0 +1,387 @@
+# --- Native ADB Server Protocol Client ---
+# Talks the ADB "smart socket" protocol directly to the adb server (localhost:5037)
+# instead of spawning an 'adb' process for every command.
+#
+# Protocol summary (see SERVICES.TXT / protocol.txt in the Android platform/packages/modules/adb sources):
+#   - Every request is "<4 hex digits length><payload>", e.g. "000chost:version".
+#   - The server answers "OKAY", or "FAIL" followed by "<4 hex length><message>".
+#   - "host:devices" answers OKAY + "<4 hex length><device list>".
+#   - "host:transport:<serial>" (or "host:transport-any") switches the socket to that device;
+#     the next request on the same socket is a device service such as "shell:<command>".
+#   - "shell,v2,raw:<command>" uses the shell protocol v2: packets of
+#     <1 byte id><4 bytes little-endian length><data>, with ids 1=stdout, 2=stderr, 3=exit code.
+#     Older devices only support the legacy "shell:" stream (raw output, no exit code),
+#     so there the exit code is echoed after a unique marker, like AdbShellSession does.
+#
+# A device service consumes its socket (the server closes it when the command ends), so the
+# "pool" here keeps spare sockets that are already switched to a device transport: the
+# connect + transport handshake is paid ahead of time, not on the next command's critical path.
+
+import codecs
+import socket
+import struct
+import threading
+import time
+import shlex
+import uuid
+import traceback
+
+DEFAULT_ADB_HOST = "127.0.0.1"
+DEFAULT_ADB_PORT = 5037
+POOL_SIZE = 2 # Spare pre-connected transport sockets kept per device
+POOL_MAX_IDLE = 30 # Seconds before a spare socket is considered stale and discarded
+
+# Shell protocol v2 packet ids
+_SHELL_STDIN = 0
+_SHELL_STDOUT = 1
+_SHELL_STDERR = 2
+_SHELL_EXIT = 3
+_SHELL_CLOSE_STDIN = 4
+
+
+class AdbProtocolError(Exception):
+    """The adb server answered FAIL or sent something unexpected."""
+
+
+class _ShellV2Refused(AdbProtocolError):
+    """The "shell,v2,raw:" service itself was refused (the transport switch had succeeded)."""
+
+
+class _IdleTimeout(Exception):
+    """No output arrived within the idle timeout (the total timeout raises socket.timeout)."""
+
+
+class _LineFeed:
+    """Turns streamed output chunks into lines for the on_line / stop_when callbacks."""
+
+    def __init__(self, on_line=None, stop_when=None, end_marker=None):
+        self.on_line = on_line
+        self.stop_when = stop_when
+        self.end_marker = end_marker # Legacy shell: everything from the marker on is not command output
+        self._buffer = ""
+        self._ended = False
+
+    def feed(self, text):
+        """Adds a chunk; returns True as soon as stop_when asks to stop."""
+        if self._ended or (self.on_line is None and self.stop_when is None):
+            return False
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        return any(self._emit(line.rstrip("\r")) for line in lines)
+
+    def finish(self):
+        """Emits a last line that had no newline. Returns True if stop_when asks to stop."""
+        line, self._buffer = self._buffer, ""
+        return bool(line) and self._emit(line.rstrip("\r"))
+
+    def _emit(self, line):
+        if self._ended:
+            return False
+        if self.end_marker and self.end_marker in line:
+            self._ended = True
+            line = line[:line.find(self.end_marker)]
+            if not line:
+                return False
+        if self.on_line is not None:
+            self.on_line(line)
+        return self.stop_when is not None and bool(self.stop_when(line))
+
+
+def _recv_exact(sock, size):
+    """Reads exactly size bytes, raising EOFError if the socket closes first."""
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+def _send_request(sock, payload):
+    """Sends one smart-socket request and waits for OKAY (raises AdbProtocolError on FAIL)."""
+    data = payload.encode("utf-8")
+    sock.sendall(b"%04x" % len(data) + data)
+    status = _recv_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise AdbProtocolError(_read_length_prefixed(sock))
+    raise AdbProtocolError(f"Unexpected adb server reply: {status!r}")
+
+
+def _read_length_prefixed(sock):
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode("utf-8", errors="replace")
+
+
+class AdbSocketTransport:
+    """Runs device-side commands through the adb server socket.
+
+    Drop-in replacement for AdbShellSession: run_adb_command returns the same result dicts.
+    """
+
+    def __init__(self, serial=None, host=DEFAULT_ADB_HOST, port=DEFAULT_ADB_PORT, pool_size=POOL_SIZE):
+        self.serial = serial # None = the only attached device (host:transport-any)
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._pool = [] # (created_at, socket) already switched to the device transport
+        self._pool_lock = threading.Lock()
+        self._refilling = False # True while a background thread is topping up the pool
+        self._shell_v2 = None # Unknown until the first command; False after a v2 request is refused
+        self._active = set() # Sockets of commands currently running (closed by abort())
+
+    # --- Connections ---
+    def _connect(self, timeout):
+        return socket.create_connection((self.host, self.port), timeout=timeout)
+
+    def _open_transport(self, timeout):
+        """Opens a new socket already switched to this transport's device."""
+        sock = self._connect(timeout)
+        try:
+            _send_request(sock, f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _is_usable(sock):
+        """A pooled socket is usable if the server has not closed it in the meantime."""
+        try:
+            sock.setblocking(False)
+            try:
+                return sock.recv(1, socket.MSG_PEEK) != b""
+            except (BlockingIOError, InterruptedError):
+                return True # Nothing to read and not closed: still good
+            finally:
+                sock.setblocking(True)
+        except OSError:
+            return False
+
+    def _acquire(self, timeout):
+        """Takes a warm socket from the pool, or opens a new one."""
+        now = time.monotonic()
+        with self._pool_lock:
+            while self._pool:
+                created_at, sock = self._pool.pop()
+                if now - created_at < POOL_MAX_IDLE and self._is_usable(sock):
+                    sock.settimeout(timeout)
+                    return sock
+                sock.close()
+        return self._open_transport(timeout)
+
+    def warm(self, count=None, timeout=10):
+        """Pre-opens spare transport sockets so the next commands skip the handshake."""
+        count = self.pool_size if count is None else count
+        while True:
+            with self._pool_lock:
+                if len(self._pool) >= count:
+                    return
+            try:
+                sock = self._open_transport(timeout)
+            except Exception:
+                return # Warming is best effort; the next command reports real errors
+            with self._pool_lock:
+                self._pool.append((time.monotonic(), sock))
+
+    def _schedule_refill(self):
+        """Tops the pool up in the background so the next command finds a warm socket."""
+        with self._pool_lock:
+            if self.pool_size <= 0 or self._refilling or len(self._pool) >= self.pool_size:
+                return
+            self._refilling = True
+
+        def refill():
+            try:
+                self.warm()
+            finally:
+                self._refilling = False
+
+        threading.Thread(target=refill, daemon=True).start()
+
+    def abort(self):
+        """Ends the commands in flight by shutting their sockets down (they return SESSION_DIED)."""
+        with self._pool_lock:
+            active = list(self._active)
+        for sock in active:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        """Closes all pooled sockets. Safe to call repeatedly."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for _, sock in pool:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    # --- Host services ---
+    def list_devices(self, timeout=10):
+        """Equivalent of 'adb devices', returned in the run_adb_command result shape."""
+        try:
+            sock = self._connect(timeout)
+            try:
+                _send_request(sock, "host:devices")
+                devices = _read_length_prefixed(sock)
+            finally:
+                sock.close()
+            # Same text 'adb devices' prints, so parse_adb_devices works unchanged
+            return {"error": False, "returncode": 0, "stdout": "List of devices attached\n" + devices + "\n", "stderr": ""}
+        except Exception as e:
+            return self._error_result(e, "N/A", "check connection", "")
+
+    # --- Device services ---
+    def run_adb_command(self, command, package_name="N/A", step_desc="execute command", timeout=60, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+        """Runs a device-side command (e.g. ["pm", "list", "packages"]) on the device.
+
+        Returns the same dict shape as hyperos_engine.run_adb_command and supports the same
+        streaming options (on_line, idle_timeout, stop_when, keep_output).
+        """
+        device_command = " ".join(shlex.quote(arg) for arg in command)
+        partial = []
+        self._schedule_refill()
+        stream = (time.monotonic() + timeout, idle_timeout)
+        try:
+            if self._shell_v2 is not False:
+                try:
+                    return self._run_shell_v2(device_command, stream, partial, _LineFeed(on_line, stop_when), keep_output)
+                except _ShellV2Refused:
+                    # Only a refused v2 request means an old device/server; a FAIL from the
+                    # transport switch (device offline, unauthorized) is reported like any error
+                    if self._shell_v2:
+                        raise # v2 worked before, so this is a real failure
+                    self._shell_v2 = False # Use the legacy shell service from now on
+            return self._run_shell_legacy(device_command, stream, partial, on_line, stop_when, keep_output)
+        except _IdleTimeout:
+            return {"error": True, "type": "IDLE_TIMEOUT", "message": f"  Error: ADB command stopped producing output (no output for {idle_timeout}s) while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": "".join(partial)}
+        except Exception as e:
+            return self._error_result(e, package_name, step_desc, "".join(partial))
+
+    @staticmethod
+    def _wait_for_data(sock, stream):
+        """Sets the socket timeout for the next read from (deadline, idle_timeout)."""
+        deadline, idle_timeout = stream
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("ADB command timed out")
+        sock.settimeout(remaining if idle_timeout is None else min(remaining, idle_timeout))
+
+    @staticmethod
+    def _timed_out(stream):
+        """Turns a socket timeout into _IdleTimeout unless the total deadline passed."""
+        if time.monotonic() < stream[0]:
+            raise _IdleTimeout()
+        raise socket.timeout("ADB command timed out")
+
+    def _run_shell_v2(self, device_command, stream, partial, lines, keep_output):
+        sock = self._acquire(max(stream[0] - time.monotonic(), 0.1))
+        with self._pool_lock:
+            self._active.add(sock)
+        try:
+            try:
+                _send_request(sock, f"shell,v2,raw:{device_command}")
+            except AdbProtocolError as e:
+                raise _ShellV2Refused(str(e))
+            self._shell_v2 = True
+            sock.sendall(struct.pack("<BI", _SHELL_CLOSE_STDIN, 0)) # Command gets EOF on stdin
+            while True:
+                self._wait_for_data(sock, stream)
+                try:
+                    # EOFError here (aborted, server or device gone) propagates: reported as SESSION_DIED
+                    header = _recv_exact(sock, 5)
+                except socket.timeout:
+                    self._timed_out(stream)
+                packet_id, length = struct.unpack("<BI", header)
+                data = _recv_exact(sock, length) if length else b""
+                if packet_id in (_SHELL_STDOUT, _SHELL_STDERR):
+                    text = data.decode("utf-8", errors="replace")
+                    if keep_output:
+                        partial.append(text) # stderr merged, like the subprocess runner
+                    if lines.feed(text):
+                        # Closing the socket ends the device-side command
+                        return {"error": False, "returncode": None, "stdout": "".join(partial), "stderr": "", "stopped": True}
+                elif packet_id == _SHELL_EXIT:
+                    returncode = data[0] if data else -1
+                    break
+            if lines.finish():
+                return {"error": False, "returncode": None, "stdout": "".join(partial), "stderr": "", "stopped": True}
+            return {"error": False, "returncode": returncode, "stdout": "".join(partial), "stderr": ""}
+        finally:
+            with self._pool_lock:
+                self._active.discard(sock)
+            sock.close()
+
+    def _run_shell_legacy(self, device_command, stream, partial, on_line, stop_when, keep_output):
+        marker = f"__HYPEROS_DONE_{uuid.uuid4().hex}__"
+        lines = _LineFeed(on_line, stop_when, end_marker=marker)
+        sock = self._acquire(max(stream[0] - time.monotonic(), 0.1))
+        with self._pool_lock:
+            self._active.add(sock)
+        try:
+            _send_request(sock, f"shell:{{ {device_command} ; }} </dev/null 2>&1; echo \"{marker} $?\"")
+            # Decoded as it arrives; besides the output (only with keep_output) just the current
+            # unterminated line is kept, which is where the exit code marker shows up
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            tail = ""
+            exit_text = None # Everything after the marker, once it was seen
+            while True:
+                self._wait_for_data(sock, stream)
+                try:
+                    chunk = sock.recv(65536)
+                except socket.timeout:
+                    self._timed_out(stream)
+                text = decoder.decode(chunk, final=not chunk)
+                if keep_output and text:
+                    partial.append(text)
+                if exit_text is not None:
+                    exit_text += text
+                else:
+                    window = tail + text
+                    index = window.find(marker)
+                    if index != -1:
+                        exit_text = window[index + len(marker):]
+                    else:
+                        tail = window[window.rfind("\n") + 1:]
+                if text and lines.feed(text):
+                    return {"error": False, "returncode": None, "stdout": self._legacy_output(partial, marker), "stderr": "", "stopped": True}
+                if not chunk:
+                    break
+            lines.finish()
+        finally:
+            with self._pool_lock:
+                self._active.discard(sock)
+            sock.close()
+        if exit_text is None:
+            raise EOFError("shell stream ended before the command finished")
+        try:
+            returncode = int(exit_text.strip())
+        except ValueError:
+            returncode = -1
+        return {"error": False, "returncode": returncode, "stdout": self._legacy_output(partial, marker), "stderr": ""}
+
+    @staticmethod
+    def _legacy_output(partial, marker):
+        """The collected legacy shell output up to the exit code marker, with PTY line endings undone."""
+        output = "".join(partial)
+        index = output.rfind(marker)
+        return (output if index == -1 else output[:index]).replace("\r\n", "\n")
+
+    @staticmethod
+    def _error_result(exc, package_name, step_desc, partial_output):
+        """Maps socket/protocol exceptions onto the error dicts run_adb_command returns."""
+        if isinstance(exc, socket.timeout):
+            return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": partial_output}
+        if isinstance(exc, ConnectionRefusedError):
+            return {"error": True, "type": "ADB_SERVER_UNAVAILABLE", "message": "\nError: Could not connect to the adb server. Start it with 'adb start-server'.\n"}
+        if isinstance(exc, AdbProtocolError):
+            return {"error": True, "type": "ADB_PROTOCOL_FAIL", "message": f"  Error: adb server refused to {step_desc} {package_name}: {exc}\n", "stdout_on_timeout": partial_output}
+        if isinstance(exc, (EOFError, OSError)):
+            return {"error": True, "type": "SESSION_DIED", "message": f"  Error: ADB connection ended while trying to {step_desc} {package_name}: {exc}\n", "stdout_on_timeout": partial_output}
+        return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error in the ADB socket client for {step_desc} {package_name}: {exc}\nTraceback:\n{traceback.format_exc()}\n"}
+
@@ -0,0 +1,337 @@
+# --- Bloatware Catalog Loading ---
+# The catalog maps package names to a tuple: (Description, Safety Level, Category)
+# Safety Levels:
+#   SAFE: Generally safe to remove/disable without impacting core functions.
+#   CAUTION: May affect specific features, check if you use them.
+#   RISKY: Removing can cause instability, broken core functions, or bootloops. Proceed with extreme caution.
+# Categories:
+#   Android_System: Core Android OS components (can be risky)
+#   Google: Apps/Services from Google (some are core GMS, some are optional)
+#   Xiaomi: Apps/Services from Xiaomi/MIUI/HyperOS (mix of bloat and core)
+#   Facebook: Facebook suite of apps
+#   Other_ThirdParty: Other pre-installed non-Google, non-Xiaomi apps
+#   Manufacturer_Test: Factory/Carrier test apps
+#   Game: Pre-installed games or game-related services
+#
+# Entries come from layered JSON/CSV source files; later layers override earlier ones:
+#   1. builtin:   catalog/builtin.json shipped next to this file (or inside the frozen .exe)
+#   2. community: <app data dir>/catalog/community/*.json|*.csv (alphabetical order)
+#   3. site:      <app data dir>/catalog/site/*.json|*.csv (our own overrides, alphabetical order)
+#   4. extra:     files listed in the HYPEROS_CATALOG_PATH environment variable (os.pathsep separated)
+#
+# JSON format: {"name": ..., "version": ..., "entries": [{"package", "description", "safety", "category", "note"?, "remove"?}]}
+# CSV format:  header row "package,description,safety,category[,note][,remove]"
+# An entry with "remove": true drops that package from the catalog (e.g. a site that wants to keep it).
+#
+# Pattern entries: a "package" containing *, ? or [...] is a glob rule instead of a package name
+# ("com.miui.analytics*", "*.overlay.*", "com.facebook.[ak]*"), so regional variants and module
+# families need one entry instead of one per package. Exact entries keep their meaning and
+# always win; among matching patterns the highest "priority" (default 0) wins, then the one with
+# the most literal characters (the most specific rule), then the later layer. A removed exact
+# package is not matched by patterns either. All patterns are compiled once into tries keyed by
+# their literal prefix or suffix, so matching a package walks its name once and only tests the
+# few rules on that path (see PatternRules).
+#
+# Parsing tens of thousands of entries on every start would be slow, so the merged result is
+# compiled once into a pickle under <app data dir>/cache, keyed by a hash of the raw source
+# bytes. Later starts only hash the files and unpickle the cached index.
+
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import sys
+
+SAFETY_LEVELS = ("SAFE", "CAUTION", "RISKY")
+CATALOG_CACHE_FORMAT = 2 # Bump when the compiled cache layout changes
+CATALOG_EXTENSIONS = (".json", ".csv")
+PATTERN_CHARS = "*?[" # A package name containing any of these is a glob rule
+
+# Built-in catalog location; PyInstaller unpacks bundled data files under sys._MEIPASS
+_BASE_DIR = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+BUILTIN_CATALOG_PATH = os.path.join(_BASE_DIR, "catalog", "builtin.json")
+
+
+def is_pattern(package):
+    return any(char in package for char in PATTERN_CHARS)
+
+
+_WILDCARD = re.compile(r"\*|\?|\[[^\]]*\]?") # fnmatch wildcards: *, ? and [...] character sets
+
+
+def _literal_chunks(pattern):
+    """The literal parts of a glob, in order ("com.*.overlay*" -> ["com.", ".overlay"])."""
+    return [chunk for chunk in _WILDCARD.split(pattern) if chunk]
+
+
+class _Trie:
+    """Character trie over rule anchors (a literal prefix, or a reversed literal suffix)."""
+
+    def __init__(self):
+        self.root = {} # char -> child node; "" -> rules anchored at this node, best first
+
+    def add(self, anchor, rule):
+        node = self.root
+        for char in anchor:
+            node = node.setdefault(char, {})
+        node.setdefault("", []).append(rule)
+
+    def sort(self, node=None):
+        node = self.root if node is None else node
+        for key, child in node.items():
+            if key:
+                self.sort(child)
+            else:
+                child.sort(key=lambda rule: rule[0], reverse=True)
+
+    def best(self, text, package, best):
+        """Walks text through the trie once; returns the best rule matching package (or best, if none ranks higher)."""
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            for rule in node.get("", ()):
+                if best is not None and rule[0] < best[0]:
+                    break # The rest of this node ranks lower still
+                if rule[1] is None or rule[1].match(package):
+                    best = rule
+                    break
+        return best
+
+
+class PatternRules:
+    """Glob rules [(pattern, priority, details)] (in layer order), compiled for one pass per package.
+
+    A rule is anchored on its literal prefix ("com.miui.*") in a trie walked along the package
+    name, or, when it starts with a wildcard, on its literal suffix ("*.global") in a trie walked
+    along the reversed name. The few rules with neither ("*.overlay.*") are prefiltered together
+    with one regex over their literal parts. The regex of a rule is only run for the candidates
+    found that way, and not at all for plain "prefix*", "*suffix" and "*part*" rules.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self._prefixes = _Trie()
+        self._suffixes = _Trie()
+        self._infix = [] # Rules anchored on neither end, best first
+        self._infix_filter = None # Regex matching any literal part of the infix rules
+        for order, (pattern, priority, details) in enumerate(self.rules):
+            chunks = _literal_chunks(pattern)
+            # Rank: priority, then the most literal characters (the most specific rule), then the later layer
+            rank = (priority, sum(len(chunk) for chunk in chunks), order)
+            if chunks and pattern.startswith(chunks[0]):
+                regex = None if pattern == chunks[0] + "*" else re.compile(fnmatch.translate(pattern))
+                self._prefixes.add(chunks[0], (rank, regex, pattern, details))
+            elif chunks and pattern.endswith(chunks[-1]):
+                regex = None if pattern == "*" + chunks[-1] else re.compile(fnmatch.translate(pattern))
+                self._suffixes.add(chunks[-1][::-1], (rank, regex, pattern, details))
+            else:
+                needle = max(chunks, key=len) if chunks else ""
+                regex = None if pattern == "*" + needle + "*" else re.compile(fnmatch.translate(pattern))
+                self._infix.append((rank, regex, pattern, details, needle))
+        self._prefixes.sort()
+        self._suffixes.sort()
+        self._infix.sort(key=lambda rule: rule[0], reverse=True)
+        if self._infix and all(rule[4] for rule in self._infix):
+            self._infix_filter = re.compile("|".join(re.escape(rule[4]) for rule in self._infix))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, package):
+        """Returns (pattern, details) of the best rule matching package, or None."""
+        best = self._prefixes.best(package, package, None)
+        best = self._suffixes.best(reversed(package), package, best)
+        if self._infix and (self._infix_filter is None or self._infix_filter.search(package)):
+            for rank, regex, pattern, details, needle in self._infix:
+                if best is not None and rank < best[0]:
+                    break
+                if needle in package and (regex is None or regex.match(package)):
+                    best = (rank, regex, pattern, details)
+                    break
+        return (best[2], best[3]) if best else None
+
+
+class Catalog(dict):
+    """{package: (description, safety, category)} of the exact entries, plus the pattern rules.
+
+    Use lookup()/match() to include what the patterns match; plain dict access only sees exact entries.
+    """
+
+    def __init__(self, entries=(), rules=None, excluded=()):
+        super().__init__(entries)
+        self.rules = rules if rules is not None else PatternRules()
+        self.excluded = frozenset(excluded) # Packages removed by a "remove" entry, not matched by patterns
+
+    def rule_for(self, package):
+        """What a package's details come from: the package itself (exact entry), the winning pattern, or None."""
+        if package in self:
+            return package
+        if package in self.excluded:
+            return None
+        rule = self.rules.match(package)
+        return rule[0] if rule else None
+
+    def lookup(self, package):
+        """Returns (description, safety, category) for a package, from its exact entry or the best pattern; None if unknown."""
+        details = self.get(package)
+        if details is None and self.rules and package not in self.excluded:
+            rule = self.rules.match(package)
+            if rule:
+                details = rule[1]
+        return details
+
+    def match(self, packages):
+        """Returns {package: details} for the given packages the catalog knows, in one pass."""
+        matched = {}
+        for package in packages:
+            details = self.lookup(package)
+            if details is not None:
+                matched[package] = details
+        return matched
+
+
+def catalog_sources(data_dir):
+    """Returns the ordered list of (layer, path) catalog source files that exist."""
+    sources = []
+    if os.path.isfile(BUILTIN_CATALOG_PATH):
+        sources.append(("builtin", BUILTIN_CATALOG_PATH))
+    for layer in ("community", "site"):
+        layer_dir = os.path.join(data_dir, "catalog", layer)
+        if os.path.isdir(layer_dir):
+            for name in sorted(os.listdir(layer_dir)):
+                if name.lower().endswith(CATALOG_EXTENSIONS):
+                    sources.append((layer, os.path.join(layer_dir, name)))
+    for path in os.environ.get("HYPEROS_CATALOG_PATH", "").split(os.pathsep):
+        if path and os.path.isfile(path):
+            sources.append(("extra", path))
+    return sources
+
+
+def _parse_source(path, raw):
+    """Parses one source file into (metadata dict, list of entry dicts)."""
+    text = raw.decode("utf-8-sig")
+    if path.lower().endswith(".csv"):
+        return {}, list(csv.DictReader(io.StringIO(text)))
+    document = json.loads(text)
+    if isinstance(document, list): # A bare list of entries is accepted too
+        return {}, document
+    return {key: value for key, value in document.items() if key != "entries"}, document.get("entries", [])
+
+
+def _is_true(value):
+    return value is True or str(value).strip().lower() in ("1", "true", "yes")
+
+
+def _priority(value, path, package, warnings):
+    if value is None or str(value).strip() == "":
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        warnings.append(f"{path}: {package} has a priority that is not a whole number ({value!r}), 0 used.")
+        return 0
+
+
+def compile_catalog(sources_with_bytes):
+    """Merges parsed sources into a Catalog (exact entries and pattern rules) plus metadata.
+
+    sources_with_bytes is a list of (layer, path, raw bytes), in layer order.
+    """
+    entries = {}
+    patterns = {} # pattern -> (priority, details), in the order they were last set
+    excluded = set()
+    layers = []
+    warnings = []
+    for layer, path, raw in sources_with_bytes:
+        try:
+            metadata, rows = _parse_source(path, raw)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            warnings.append(f"{path}: could not be parsed ({e}), skipped.")
+            continue
+        layers.append({"layer": layer, "path": path, "name": metadata.get("name", os.path.basename(path)), "version": str(metadata.get("version", "")), "entries": len(rows)})
+        for row in rows:
+            package = (row.get("package") or "").strip()
+            if not package:
+                warnings.append(f"{path}: entry without a package name skipped.")
+                continue
+            pattern = is_pattern(package)
+            if _is_true(row.get("remove")):
+                if pattern:
+                    patterns.pop(package, None)
+                else:
+                    entries.pop(package, None)
+                    excluded.add(package)
+                continue
+            safety = (row.get("safety") or "").strip().upper()
+            if safety not in SAFETY_LEVELS:
+                # Kept (it still shows up and can be selected by hand), but worth fixing in the source
+                warnings.append(f"{path}: {package} has unknown safety level {safety!r}.")
+            details = ((row.get("description") or "").strip(), safety, (row.get("category") or "Other_ThirdParty").strip())
+            if pattern:
+                patterns.pop(package, None) # Re-inserted last: a later layer wins ties
+                patterns[package] = (_priority(row.get("priority"), path, package, warnings), details)
+            else:
+                entries[package] = details
+                excluded.discard(package)
+    rules = PatternRules((pattern, priority, details) for pattern, (priority, details) in patterns.items())
+    return Catalog(entries, rules, excluded), layers, warnings
+
+
+def load_catalog(data_dir, use_cache=True):
+    """Loads the layered catalog, using (and refreshing) the compiled cache.
+
+    Returns (Catalog, info dict). info holds "version" (short content hash), "layers",
+    "warnings", "entries" (exact), "patterns" and "from_cache".
+    """
+    sources = catalog_sources(data_dir)
+    sources_with_bytes = []
+    digest = hashlib.sha256(b"hyperos-catalog-%d" % CATALOG_CACHE_FORMAT)
+    for layer, path in sources:
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            continue # Vanished or unreadable: treat as absent
+        sources_with_bytes.append((layer, path, raw))
+        digest.update(f"\0{layer}\0{path}\0".encode("utf-8"))
+        digest.update(raw)
+    content_hash = digest.hexdigest()
+
+    cache_dir = os.path.join(data_dir, "cache")
+    cache_path = os.path.join(cache_dir, f"catalog-{content_hash[:16]}.pickle")
+    if use_cache:
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("hash") == content_hash:
+                info = dict(cached["info"], from_cache=True)
+                return cached["catalog"], info
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+            pass # Missing or corrupt cache: rebuild below
+
+    catalog, layers, warnings = compile_catalog(sources_with_bytes)
+    info = {"version": content_hash[:12], "hash": content_hash, "layers": layers, "warnings": warnings, "entries": len(catalog), "patterns": len(catalog.rules), "from_cache": False}
+    if use_cache:
+        _write_cache(cache_dir, cache_path, {"hash": content_hash, "catalog": catalog, "info": info})
+    return catalog, info
+
+
+def _write_cache(cache_dir, cache_path, payload):
+    """Atomically writes the compiled cache and removes caches of older catalog versions."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+        for name in os.listdir(cache_dir):
+            if name.startswith("catalog-") and name.endswith(".pickle") and os.path.join(cache_dir, name) != cache_path:
+                os.remove(os.path.join(cache_dir, name))
+    except OSError:
+        pass # The cache is only an optimization; a read-only data dir just means parsing every time
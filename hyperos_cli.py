@@ -0,0 +1,247 @@
+# --- HyperOS App Manager Command-Line Tool ---
+# Headless front-end for hyperos_engine.py: no Tkinter, no display needed.
+# Results are printed to stdout as JSON; progress/status messages go to stderr.
+#
+# Examples:
+#   python hyperos_cli.py devices
+#   python hyperos_cli.py catalog --match com.miui.analytics
+#   python hyperos_cli.py scan
+#   python hyperos_cli.py apply --safety SAFE --dry-run
+#   python hyperos_cli.py apply --safety SAFE --category Facebook --category Google
+#   python hyperos_cli.py apply --package com.facebook.katana --serial ABC123
+#   python hyperos_cli.py profiles
+#   python hyperos_cli.py apply --profile kiosk-minimal --dry-run
+#   python hyperos_cli.py --record field-issue.jsonl.gz scan
+#   python hyperos_cli.py --replay field-issue.jsonl.gz --time-scale 0 scan
+#   python hyperos_cli.py --report run.csv apply --safety SAFE
+#   python hyperos_cli.py fleet --has 'com.miui.analytics*' --drift
+#   python hyperos_cli.py journal --run 20250101-120000-ab12cd
+#   python hyperos_cli.py restore --run 20250101-120000-ab12cd
+
+import argparse
+import json
+import sys
+
+from hyperos_engine import get_catalog, AppManagerEngine, APP_DATA_DIR, METRICS_DIR, SNAPSHOT_DIR, REPORT_PATH, VERIFY_RETRIES
+
+
+def _print_status(serial, message):
+    """Status callback: writes engine messages to stderr (stdout is reserved for JSON)."""
+    prefix = f"[{serial}] " if serial else ""
+    for line in message.strip("\n").split("\n"):
+        print(prefix + line, file=sys.stderr)
+
+
+def _scan_to_json(scan_result):
+    """Converts a scan result (sets, tuples) into plain JSON-friendly data."""
+    known_bloatware_db = get_catalog()[0]
+    devices = {}
+    for serial, found in sorted(scan_result["devices"].items()):
+        states = scan_result.get("states", {}).get(serial, {})
+        devices[serial] = []
+        for package in sorted(found):
+            description, safety, category = known_bloatware_db.lookup(package)
+            devices[serial].append({"package": package, "description": description, "safety": safety, "category": category, "state": states.get(package)})
+    return {"devices": devices, "skipped": scan_result.get("skipped", {}), "failed": scan_result.get("failed", []), "changes": dict(sorted(scan_result.get("changes", {}).items()))}
+
+
+def _error_to_json(result):
+    return {"error": True, "type": result.get("type"), "message": result.get("message", "").strip()}
+
+
+def _fleet(args):
+    """The 'fleet' command: queries over the saved snapshots (see hyperos_fleet.py)."""
+    from hyperos_fleet import FleetIndex, INSTALLED_STATES, load_snapshots
+    snapshots, unreadable = load_snapshots(args.snapshot_dir)
+    fleet = FleetIndex(snapshots)
+    output = {"devices": fleet.summary(), "unreadable": unreadable}
+    if args.has:
+        output["has"] = {}
+        for pattern in args.has:
+            output["has"].update(fleet.devices_with(pattern, args.state or INSTALLED_STATES))
+    if args.diff:
+        missing = [serial for serial in args.diff if serial not in fleet.latest]
+        if missing:
+            print(f"No snapshot of {', '.join(missing)} in {args.snapshot_dir}.", file=sys.stderr)
+            return 2
+        output["diff"] = fleet.diff(*args.diff)
+    if args.drift:
+        output["drift"] = fleet.drift(args.serial)
+    print(json.dumps(output, indent=2))
+    return 4 if args.drift and output["drift"] else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scan and debloat HyperOS/MIUI phones over ADB without the GUI.")
+    parser.add_argument("--adb", default="adb", help="Path to the adb executable (default: adb from PATH).")
+    parser.add_argument("--transport", choices=["subprocess", "socket"], default="subprocess", help="'socket' talks to the adb server on localhost:5037 directly instead of running adb processes.")
+    parser.add_argument("--serial", action="append", help="Only use this device serial (repeatable). Default: every ready device.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print status messages to stderr.")
+    parser.add_argument("--full-rescan", action="store_true", help="Ignore the per-device scan cache and fetch every package list in full.")
+    parser.add_argument("--record", metavar="TRANSCRIPT", help="Also write every ADB command and its output to this transcript file (.jsonl, or .jsonl.gz compressed).")
+    parser.add_argument("--replay", metavar="TRANSCRIPT", help="Answer every ADB command from this transcript instead of from the phones (offline run, nothing is changed).")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="With --replay: multiply the recorded timings by this (default 1: as recorded, 0: no waiting).")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR, help=f"Where every scan saves a snapshot per device, and where 'fleet' reads them (default: {SNAPSHOT_DIR}, or HYPEROS_SNAPSHOT_DIR).")
+    parser.add_argument("--report", default=REPORT_PATH, metavar="FILE", help=f"Append one record per device and package of every scan/apply/restore to this file (.jsonl, or .csv; default: {REPORT_PATH}).")
+    parser.add_argument("--no-report", action="store_true", help="Do not write the run report.")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help=f"Where to write the ADB command metrics (metrics.json, metrics.prom) after the run (default: {METRICS_DIR}).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("devices", help="List attached devices and their state.")
+    catalog_parser = subparsers.add_parser("catalog", help="Show the loaded catalog files, version and warnings.")
+    catalog_parser.add_argument("--match", action="append", metavar="PACKAGE", help="Also show which entry or pattern this package name matches (repeatable).")
+    subparsers.add_parser("scan", help="Scan devices for known bloatware.")
+    subparsers.add_parser("profiles", help="List the debloat profiles (built-in and in the app data folder).")
+
+    apply_parser = subparsers.add_parser("apply", help="Scan, select and uninstall/disable apps. Every given filter must match.")
+    apply_parser.add_argument("--safety", action="append", choices=["SAFE", "CAUTION", "RISKY"], help="Select apps with this safety level (repeatable).")
+    apply_parser.add_argument("--category", action="append", help="Select apps in this category (repeatable).")
+    apply_parser.add_argument("--package", action="append", help="Select this package name (repeatable).")
+    apply_parser.add_argument("--all", action="store_true", help="Select every known bloatware app found (required when no filter is given).")
+    apply_parser.add_argument("--profile", action="append", help="Select what this profile (name or .json path) selects, instead of the filters above (repeatable; the union is applied).")
+    apply_parser.add_argument("--include-handled", action="store_true", help="Also process apps that are already uninstalled or disabled for user 0 (skipped by default).")
+    apply_parser.add_argument("--no-batch", action="store_true", help="Process package by package instead of one device-side script per device.")
+    apply_parser.add_argument("--dry-run", action="store_true", help="Only print the plan (with --profile: a per-device diff), do not change any device.")
+    apply_parser.add_argument("--no-verify", action="store_true", help="Do not re-read the package states after processing to verify (and retry) the results.")
+    apply_parser.add_argument("--retries", type=int, default=VERIFY_RETRIES, metavar="N", help=f"How often apps still enabled after processing are retried (default: {VERIFY_RETRIES}).")
+
+    fleet_parser = subparsers.add_parser("fleet", help="Compare the saved device snapshots (no device needed): summary, who has a package, diffs and drift.")
+    fleet_parser.add_argument("--has", action="append", metavar="PACKAGE", help="Which devices still have this package; globs like 'com.miui.*' work (repeatable).")
+    fleet_parser.add_argument("--state", action="append", choices=["ENABLED", "DISABLED", "UNINSTALLED"], help="With --has: only count these states (default: ENABLED and DISABLED).")
+    fleet_parser.add_argument("--diff", nargs=2, metavar=("SERIAL_A", "SERIAL_B"), help="Compare the latest snapshots of two devices.")
+    fleet_parser.add_argument("--drift", action="store_true", help="Compare every device's latest snapshot with the one before; exit code 4 if any device changed.")
+
+    journal_parser = subparsers.add_parser("journal", help="Print the journal of past actions (JSON Lines records).")
+    journal_parser.add_argument("--run", help="Only show the records of this run id.")
+
+    restore_parser = subparsers.add_parser("restore", help="Undo journaled uninstalls/disables (newest first), one batched run per device.")
+    restore_parser.add_argument("--package", action="append", help="Only restore this package (repeatable). Default: everything.")
+    restore_parser.add_argument("--run", help="Only undo the actions of this run id (see 'journal').")
+    restore_parser.add_argument("--dry-run", action="store_true", help="Only print the restore plan, do not change any device.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "catalog":
+        known_bloatware_db, info = get_catalog()
+        output = dict(info)
+        if args.match:
+            output["matches"] = {}
+            for package in args.match:
+                details = known_bloatware_db.lookup(package)
+                output["matches"][package] = {"rule": known_bloatware_db.rule_for(package), "description": details[0], "safety": details[1],
+                                              "category": details[2]} if details else None
+        print(json.dumps(output, indent=2))
+        return 0
+    if args.command == "fleet":
+        return _fleet(args)
+    if args.command == "profiles":
+        from hyperos_profiles import list_profiles, load_profile, ProfileError
+        listing = []
+        for name, path in list_profiles(APP_DATA_DIR).items():
+            try:
+                profile = load_profile(path, APP_DATA_DIR)
+                listing.append({"name": name, "description": profile.description, "path": path})
+            except ProfileError as e:
+                listing.append({"name": name, "path": path, "error": str(e)})
+        print(json.dumps({"profiles": listing}, indent=2))
+        return 0
+
+    profiles = []
+    if args.command == "apply" and args.profile:
+        from hyperos_profiles import load_profile, ProfileError
+        if args.all or args.safety or args.category or args.package:
+            print("Use either --profile or the --safety/--category/--package/--all filters, not both.", file=sys.stderr)
+            return 2
+        try:
+            profiles = [load_profile(name, APP_DATA_DIR) for name in args.profile]
+        except ProfileError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+
+    if args.replay and args.command in ("journal", "restore"):
+        print(f"'{args.command}' works on the journal of real runs; it cannot be used with --replay.", file=sys.stderr)
+        return 2
+    try:
+        engine = AppManagerEngine(adb_path=args.adb, on_status=None if args.quiet else _print_status, transport=args.transport,
+                                  record=args.record, replay=args.replay, time_scale=args.time_scale,
+                                  report=None if args.no_report or (args.replay and args.report == REPORT_PATH) else args.report)
+    except ValueError as e: # TranscriptError: the --replay file is missing or not a transcript
+        print(str(e), file=sys.stderr)
+        return 2
+    try:
+        if args.command == "journal":
+            for record in engine.journal.records(args.serial, args.run):
+                print(json.dumps(record))
+            return 0
+
+        if args.command == "restore":
+            plan = engine.restore_plan(serials=args.serial, packages=set(args.package) if args.package else None, run_id=args.run)
+            output = {"plan": {serial: [{"package": package, "action": action} for package, action in steps] for serial, steps in plan.items()},
+                      "dry_run": args.dry_run, "results": {}}
+            if plan and not args.dry_run:
+                output["results"] = engine.restore(plan)
+            print(json.dumps(output, indent=2))
+            failed = any(result["status"] != "RESTORED" for device_results in output["results"].values() for result in device_results.values())
+            return 3 if failed else 0
+
+        if args.command == "devices":
+            result = engine.list_devices()
+            if result.get("error"):
+                print(json.dumps(_error_to_json(result), indent=2))
+                return 1
+            print(json.dumps({"devices": [{"serial": serial, "state": state} for serial, state in result["devices"]]}, indent=2))
+            return 0
+
+        if args.command == "apply" and not (args.all or args.safety or args.category or args.package or profiles):
+            print("Refusing to apply without a selection: use --safety, --category, --package, --profile or --all.", file=sys.stderr)
+            return 2
+
+        scan_result = engine.scan(serials=args.serial, use_cache=not args.full_rescan)
+        if scan_result.get("error"):
+            print(json.dumps(_error_to_json(scan_result), indent=2))
+            return 1
+        if engine.replay is None: # A replayed scan says nothing about the fleet today
+            try:
+                engine.export_snapshots(scan_result, args.snapshot_dir)
+            except OSError as e: # Never fail a scan over its snapshots
+                print(f"Could not save the device snapshots: {e}", file=sys.stderr)
+        if args.command == "scan":
+            print(json.dumps(_scan_to_json(scan_result), indent=2))
+            return 0
+
+        if profiles:
+            for profile in profiles:
+                profile.include_handled = profile.include_handled or args.include_handled
+            resolution = engine.plan_profiles(scan_result, profiles)
+            plan = resolution["plan"]
+            output = {"profiles": [profile.name for profile in profiles], "plan": plan, "already_handled": resolution["already_handled"],
+                      "not_installed": resolution["not_installed"], "dry_run": args.dry_run, "results": {}}
+            if args.dry_run:
+                from hyperos_profiles import plan_diff
+                output["diff"] = plan_diff(resolution, scan_result, get_catalog()[0])
+        else:
+            selection = {"packages": set(args.package) if args.package else None, "safety": args.safety, "categories": set(args.category) if args.category else None}
+            plan = engine.plan(scan_result, include_handled=args.include_handled, **selection)
+            # Matching apps left out because they are already uninstalled/disabled on that device
+            already_handled = {}
+            for serial, packages in engine.plan(scan_result, include_handled=True, **selection).items():
+                skipped_packages = [package for package in packages if package not in plan.get(serial, [])]
+                if skipped_packages:
+                    already_handled[serial] = skipped_packages
+            output = {"plan": plan, "already_handled": already_handled, "dry_run": args.dry_run, "results": {}}
+        if plan and not args.dry_run:
+            output["results"] = engine.apply(plan, batch=not args.no_batch, verify=not args.no_verify, retries=max(0, args.retries))
+        print(json.dumps(output, indent=2))
+        # Exit code 3 if any package could not be uninstalled or disabled
+        failed = any(result["status"] not in ("UNINSTALLED", "DISABLED") for device_results in output["results"].values() for result in device_results.values())
+        return 3 if failed else 0
+    finally:
+        engine.close()
+        if engine.metrics.snapshot()["series"]: # Only when ADB was actually used
+            engine.export_metrics(args.metrics_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
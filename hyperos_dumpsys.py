@@ -0,0 +1,203 @@
+# --- Impact Analysis from 'dumpsys package' ---
+# The catalog's SAFE/CAUTION/RISKY label is the same for every phone. Before processing, the
+# review window also asks each target device what the selected apps actually provide there:
+#   - default handlers (phone, SMS, launcher, browser, assistant), from 'cmd role'
+#   - shared libraries other installed apps use ("Libraries:" and each package's usesLibraries)
+#   - shared UIDs (android.uid.phone, ...) with other installed apps
+#   - content provider authorities (contacts, calendar, ...)
+#   - components other apps can start (the activity/service/receiver resolver tables)
+#
+# build_impact_script() runs only the 'dumpsys package' sections needed, one 'dumpsys package
+# <section>' each (the package service dumps just the first section it is given), then the role
+# queries, in one device-side command. PackageIndexParser reads the output line by line as it streams in
+# (nothing is kept but the index), so a phone with several hundred packages is indexed in a
+# fraction of a second. The engine keeps one index per device and scan (see
+# AppManagerEngine.analyze_impact).
+
+import re
+
+ROLE_MARKER = "__HYPEROS_ROLE__"
+# Role -> what it means for the user, in the order shown
+DEFAULT_ROLES = (
+    ("android.app.role.DIALER", "default phone app"),
+    ("android.app.role.SMS", "default SMS app"),
+    ("android.app.role.HOME", "default launcher"),
+    ("android.app.role.BROWSER", "default browser"),
+    ("android.app.role.ASSISTANT", "default assistant"),
+)
+# l: libraries, prov: providers, p: packages, s: shared users, r: resolver tables. Leaves out
+# permissions, preferred activities, dexopt and compiler state, which are most of the full dump.
+DUMPSYS_SECTIONS = ("l", "prov", "p", "s", "r")
+IMPACT_LEVELS = ("HIGH", "MEDIUM", "INFO") # HIGH: removing breaks something in use on the device
+
+_PACKAGE_HEADER = re.compile(r"^  Package \[([^\]]+)\]")
+_SHARED_USER = re.compile(r"sharedUser=SharedUserSetting\{\S+ ([^/}\s]+)/(\d+)\}")
+_SHARED_USER_HEADER = re.compile(r"^  SharedUser \[([^\]]+)\]")
+_LIBRARY = re.compile(r"^  (\S+) -> \((apk|jar)\) (\S+)")
+_PROVIDER = re.compile(r"Provider\{\S+ ([^/\s]+)/")
+_USER_LINE = re.compile(r"^    User (\d+):")
+_INSTALLED = re.compile(r"\binstalled=(true|false)")
+_STATIC_VERSION = re.compile(r"_\d+$")
+
+
+def build_impact_script():
+    """Device-side command: the needed 'dumpsys package' sections, then the holders of each default role."""
+    roles = " ".join(role for role, _ in DEFAULT_ROLES)
+    sections = "".join(f"dumpsys package {section}; " for section in DUMPSYS_SECTIONS)
+    return (sections +
+            f"for role in {roles}; do echo \"{ROLE_MARKER} $role\"; cmd role get-role-holders --user 0 $role 2>/dev/null; done")
+
+
+def _component(package, name):
+    """Expands 'com.app/.Main' style class names to the full component name."""
+    return package + "/" + (package + name if name.startswith(".") else name)
+
+
+class PackageIndex:
+    """What the packages of one device provide to each other, parsed from 'dumpsys package'."""
+
+    def __init__(self):
+        self.installed = set() # Packages installed for user 0
+        self.shared_user_of = {} # package -> shared user name (android.uid.phone, ...)
+        self.shared_users = {} # shared user name -> set of packages
+        self.library_owner = {} # library name -> package providing it (apk libraries only)
+        self.uses_libraries = {} # package -> set of library names it uses
+        self.providers = {} # package -> set of content provider authorities
+        self.components = {} # package -> set of components found in the resolver tables
+        self.disabled_components = {} # package -> set of components disabled for user 0
+        self.role_holders = {} # role -> set of packages
+        self._users_of_library = None # library name -> packages using it, built on first use
+
+    def library_users(self, package):
+        """{library: installed packages using it} for the libraries a package provides."""
+        if self._users_of_library is None:
+            self._users_of_library = {}
+            for user, libraries in self.uses_libraries.items():
+                for library in libraries:
+                    self._users_of_library.setdefault(library, set()).add(user)
+        users = {}
+        for library, owner in self.library_owner.items():
+            if owner == package:
+                using = (self._users_of_library.get(library, set()) & self.installed) - {package}
+                if using:
+                    users[library] = using
+        return users
+
+    def impact(self, package):
+        """Returns [(level, message)] describing what removing a package could affect, most severe first."""
+        flags = []
+        for role, meaning in DEFAULT_ROLES:
+            if package in self.role_holders.get(role, ()):
+                flags.append(("HIGH", f"Is the {meaning}"))
+        for library, users in sorted(self.library_users(package).items()):
+            flags.append(("HIGH", f"Provides library {library} used by {len(users)} installed app(s): {', '.join(sorted(users)[:5])}"))
+        shared_user = self.shared_user_of.get(package)
+        if shared_user:
+            others = (self.shared_users.get(shared_user, set()) & self.installed) - {package}
+            if others:
+                flags.append(("MEDIUM", f"Shares UID {shared_user} with {len(others)} other installed app(s)"))
+        authorities = self.providers.get(package)
+        if authorities:
+            flags.append(("MEDIUM", f"Provides content provider(s): {', '.join(sorted(authorities)[:5])}" + (" ..." if len(authorities) > 5 else "")))
+        enabled = self.components.get(package, set()) - self.disabled_components.get(package, set())
+        if enabled:
+            flags.append(("INFO", f"{len(enabled)} enabled component(s) other apps can start"))
+        return flags
+
+
+class PackageIndexParser:
+    """Builds a PackageIndex from 'dumpsys package' (+ role) output fed one line at a time."""
+
+    def __init__(self):
+        self.index = PackageIndex()
+        self.lines = 0
+        self._section = None # Current top-level section ("Packages:", "Libraries:", ...)
+        self._package = None # Package being read in "Packages:"
+        self._user = None # User block being read inside a package ("User 0:")
+        self._list = None # Indented list being read: (target dict, indent of its header)
+        self._authorities = [] # Authorities of the "[authority]:" entry being read
+        self._role = None
+
+    def feed(self, line):
+        self.lines += 1
+        if not line:
+            return
+        if line.startswith(ROLE_MARKER):
+            self._section = "roles"
+            self._role = line[len(ROLE_MARKER):].strip()
+            return
+        if line[0] != " ":
+            # Top-level section headers end with ':' ("Packages:", "Service Resolver Table:", ...)
+            self._section = line.rstrip() if line.rstrip().endswith(":") else self._section
+            self._package = self._user = self._list = None
+            if self._section == "roles" and self._role and " " not in line.strip(): # Role holders are plain package names
+                self.index.role_holders.setdefault(self._role, set()).add(line.strip())
+            return
+        section = self._section
+        if section == "Packages:":
+            self._feed_package_line(line)
+        elif section is not None and section.endswith("Resolver Table:"):
+            # e.g. "        3f8a9c1 com.android.settings/.Settings filter 7c2b1e0"
+            parts = line.split(None, 2)
+            if len(parts) >= 2 and "/" in parts[1]:
+                package, _, name = parts[1].partition("/")
+                self.index.components.setdefault(package, set()).add(_component(package, name))
+        elif section == "ContentProvider Authorities:":
+            stripped = line.strip()
+            if stripped.startswith("[") and stripped.endswith("]:"):
+                self._authorities = stripped[1:-2].split(";")
+            elif self._authorities and stripped.startswith("Provider{"):
+                match = _PROVIDER.search(stripped)
+                if match:
+                    self.index.providers.setdefault(match.group(1), set()).update(self._authorities)
+                self._authorities = []
+        elif section == "Libraries:":
+            match = _LIBRARY.match(line)
+            if match and match.group(2) == "apk":
+                # Static libraries are listed with their version ("name_123"); users list the bare name
+                self.index.library_owner[match.group(1)] = self.index.library_owner[_STATIC_VERSION.sub("", match.group(1))] = match.group(3)
+        elif section == "Shared users:":
+            match = _SHARED_USER_HEADER.match(line)
+            if match:
+                self.index.shared_users.setdefault(match.group(1), set())
+
+    def _feed_package_line(self, line):
+        index = self.index
+        match = _PACKAGE_HEADER.match(line)
+        if match:
+            self._package = match.group(1)
+            self._user = self._list = None
+            return
+        package = self._package
+        if package is None:
+            return
+        indent = len(line) - len(line.lstrip(" "))
+        stripped = line.strip()
+        if self._list is not None:
+            target, list_indent = self._list
+            if indent > list_indent:
+                name = stripped.split()[0]
+                if target is index.disabled_components:
+                    name = _component(package, name) if "/" not in name else name
+                target.setdefault(package, set()).add(name)
+                return
+            self._list = None
+        if indent == 4:
+            user = _USER_LINE.match(line)
+            if user:
+                self._user = user.group(1)
+                if self._user == "0":
+                    installed = _INSTALLED.search(line)
+                    if installed is None or installed.group(1) == "true":
+                        index.installed.add(package)
+                return
+            self._user = None
+            if stripped.startswith("sharedUser="):
+                shared = _SHARED_USER.search(stripped)
+                if shared:
+                    index.shared_user_of[package] = shared.group(1)
+                    index.shared_users.setdefault(shared.group(1), set()).add(package)
+            elif stripped in ("usesLibraries:", "usesOptionalLibraries:", "usesStaticLibraries:", "usesSdkLibraries:"):
+                self._list = (index.uses_libraries, indent)
+        elif self._user == "0" and stripped == "disabledComponents:":
+            self._list = (index.disabled_components, indent)
@@ -0,0 +1,1374 @@
+# --- HyperOS App Manager Engine ---
+# Everything needed to scan and debloat phones WITHOUT a GUI: the bloatware database,
+# the ADB helpers (persistent shell sessions, batched device-side processing) and the
+# AppManagerEngine class with scan / plan / apply.
+# The Tkinter GUI (HyperOS_app_manager_GUI.py) and the command-line tool (hyperos_cli.py)
+# are both thin clients of this module. Nothing here imports tkinter or prints to stdout,
+# so it can run on headless machines; progress is reported through callbacks instead.
+
+import os
+import re
+import json
+import subprocess
+import sys
+import time
+import threading
+import concurrent.futures
+import queue
+import shlex
+import uuid
+import traceback
+
+from hyperos_jobs import AdaptiveTimeouts, JobCancelled
+from hyperos_journal import ActionJournal, new_run_id, restore_plan
+from hyperos_metrics import CommandMetrics
+from hyperos_reports import RunReport, apply_records, restore_records, scan_records, verify_records
+
+# Per-user folder for logs, caches and other files the tool keeps between runs.
+# Can be moved with the HYPEROS_APP_MANAGER_HOME environment variable (e.g. on shared bench PCs).
+APP_DATA_DIR = os.environ.get("HYPEROS_APP_MANAGER_HOME") or os.path.join(os.path.expanduser("~"), ".hyperos_app_manager")
+
+# --- Known Bloatware/Removable Apps Catalog ---
+# Maps package names to a tuple: (Description, Safety Level, Category).
+# Loaded from layered JSON/CSV files (built-in, community, site overrides) through a compiled
+# on-disk cache; see hyperos_catalog.py for the file formats, layer order and safety levels.
+# Loading is deferred to the first get_catalog() call instead of happening at import, so the
+# GUI can draw its window first (importing this module does no file I/O).
+_catalog = None # (catalog dict, info dict) once loaded
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Returns (catalog dict, info dict), loading the catalog on the first call. Thread-safe."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            from hyperos_catalog import load_catalog # Only needed once, on first use
+            _catalog = load_catalog(APP_DATA_DIR)
+        return _catalog
+
+def __getattr__(name):
+    # 'known_bloatware_db' and 'catalog_info' stay importable module attributes (loading the catalog)
+    if name == "known_bloatware_db":
+        return get_catalog()[0]
+    if name == "catalog_info":
+        return get_catalog()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Helper function to run ADB commands ---
+# This function now returns a dict indicating success or failure,
+# including stdout/stderr and returncode on success, or error details on failure.
+# Passing on_line, idle_timeout or stop_when switches to streaming mode (see stream_adb_command):
+#   on_line(line) is called for every output line as it arrives (line endings stripped),
+#   idle_timeout fails the command if no output arrives for that many seconds (on top of timeout),
+#   stop_when(line) returning True stops the command early (result has "stopped": True, returncode None),
+#   keep_output=False does not collect stdout at all, for outputs that are only parsed line by line.
+def run_adb_command(command, package_name="N/A", step_desc="execute command", timeout=60, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+    """Runs an ADB command and returns a dict indicating success or failure."""
+    if on_line is not None or idle_timeout is not None or stop_when is not None or not keep_output:
+        return _run_adb_command_streaming(command, package_name, step_desc, timeout, on_line, idle_timeout, stop_when, keep_output)
+    try:
+        # print(f"  Executing: {' '.join(command)}") # Uncomment for verbose ADB commands
+        # Use Popen to manage the process. CREATE_NO_WINDOW prevents a console window from flashing.
+        # stderr is directed to stdout so we capture all command output in stdout.
+        # Added creationflags for Windows
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+
+        # Use communicate with timeout to avoid deadlocks and handle timeout
+        stdout, _ = process.communicate(timeout=timeout)
+        returncode = process.returncode
+
+        # Command completed without Python exception or timeout.
+        return {"error": False, "returncode": returncode, "stdout": stdout, "stderr": ""} # Return stderr as empty string as it's captured in stdout
+
+    except FileNotFoundError:
+        # This error happens if the 'adb' executable itself is not found
+        return {"error": True, "type": "ADB_NOT_FOUND", "message": "\nError: ADB command 'adb' not found. Ensure ADB is in your system's PATH.\n"}
+    except subprocess.TimeoutExpired:
+        # This error happens if the command times out
+        try: # Try to terminate gracefully first
+            process.terminate()
+            stdout, _ = process.communicate(timeout=5) # Read any remaining output
+        except: # If terminate fails, kill
+            process.kill()
+            stdout, _ = process.communicate(timeout=5) # Read any remaining output
+
+        return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": stdout} # Include partial output
+
+    except Exception as e:
+        # Catch any other unexpected Python-level errors during subprocess creation/communication
+        return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error during subprocess for {step_desc} {package_name}: {e}\nTraceback:\n{traceback.format_exc()}\n"}
+
+
+class AdbCommandTimeout(Exception):
+    """Raised by stream_adb_command; idle is True if it was the idle timeout that expired."""
+
+    def __init__(self, idle):
+        super().__init__("ADB command produced no output in time" if idle else "ADB command timed out")
+        self.idle = idle
+
+
+def _pump_lines(stream, lines):
+    """Reader thread body: moves every line of a text stream into a queue, then None at EOF."""
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def stream_adb_command(command, timeout=60, idle_timeout=None):
+    """Runs an ADB command and yields its output lines (line endings stripped) as they arrive.
+
+    The generator's return value (StopIteration.value) is the process return code.
+    Raises AdbCommandTimeout when timeout (total) or idle_timeout (between lines) expires.
+    Closing the generator early (e.g. breaking out of the loop) kills the process.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+    lines = queue.Queue()
+    # A reader thread is needed because a blocking readline() cannot time out on its own
+    threading.Thread(target=_pump_lines, args=(process.stdout, lines), daemon=True).start()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            wait = remaining if idle_timeout is None else min(remaining, idle_timeout)
+            try:
+                line = lines.get(timeout=max(wait, 0))
+            except queue.Empty:
+                raise AdbCommandTimeout(idle=time.monotonic() < deadline)
+            if line is None:
+                break
+            yield line.rstrip("\r\n")
+        return process.wait(timeout=max(deadline - time.monotonic(), 1))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def _run_adb_command_streaming(command, package_name, step_desc, timeout, on_line, idle_timeout, stop_when, keep_output):
+    """Streaming mode of run_adb_command, built on stream_adb_command."""
+    output = []
+    stream = stream_adb_command(command, timeout, idle_timeout)
+    try:
+        while True:
+            try:
+                line = next(stream)
+            except StopIteration as done:
+                return {"error": False, "returncode": done.value, "stdout": "".join(output), "stderr": ""}
+            if keep_output:
+                output.append(line + "\n")
+            if on_line is not None:
+                on_line(line)
+            if stop_when is not None and stop_when(line):
+                stream.close() # Kills the process: the rest of the output is not needed
+                return {"error": False, "returncode": None, "stdout": "".join(output), "stderr": "", "stopped": True}
+    except FileNotFoundError:
+        return {"error": True, "type": "ADB_NOT_FOUND", "message": "\nError: ADB command 'adb' not found. Ensure ADB is in your system's PATH.\n"}
+    except AdbCommandTimeout as e:
+        if e.idle:
+            return {"error": True, "type": "IDLE_TIMEOUT", "message": f"  Error: ADB command stopped producing output (no output for {idle_timeout}s) while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": "".join(output)}
+        return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": "".join(output)}
+    except Exception as e:
+        return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error during subprocess for {step_desc} {package_name}: {e}\nTraceback:\n{traceback.format_exc()}\n"}
+    finally:
+        stream.close()
+
+
+# --- Device Discovery ---
+# 'adb devices' prints a header line followed by one "<serial>\t<state>" line per device.
+# State is "device" when ready, or e.g. "unauthorized" / "offline" / "no permissions".
+MAX_DEVICE_WORKERS = 16 # Upper bound on devices handled in parallel (USB hubs/adb server limit)
+
+def parse_adb_devices(stdout):
+    """Parses 'adb devices' output into a list of (serial, state) tuples."""
+    devices = []
+    for line in stdout.splitlines():
+        line = line.strip()
+        if not line or line.startswith("List of devices attached") or line.startswith("*"):
+            continue # Skip header and daemon start-up messages ("* daemon started successfully")
+        parts = line.split(None, 1)
+        if len(parts) == 2:
+            devices.append((parts[0], parts[1].strip()))
+    return devices
+
+
+# --- Persistent ADB Shell Session ---
+# Spawning a new 'adb shell ...' process for every package costs a host process start,
+# an adb-server handshake and a device-side shell startup. This class keeps ONE
+# 'adb shell' open and sends commands through its stdin instead. Each command is followed
+# by an echo of a unique sentinel marker plus the exit code, so we know exactly where its
+# output ends. If the shell dies (cable unplugged, adb server restarted), the session is
+# closed and transparently restarted on the next command.
+class _SessionTimeout(Exception):
+    def __init__(self, partial_output, idle=False):
+        super().__init__("ADB shell session command timed out")
+        self.partial_output = partial_output
+        self.idle = idle # True if the idle timeout (no output) expired, not the total one
+
+
+class _SessionDied(Exception):
+    def __init__(self, partial_output):
+        super().__init__("ADB shell session ended")
+        self.partial_output = partial_output
+
+
+class AdbShellSession:
+    """Keeps a single long-lived 'adb shell' process and runs commands through it."""
+
+    def __init__(self, serial=None, adb_path="adb"):
+        self.serial = serial # None = the only attached device (no -s)
+        self.adb_path = adb_path
+        self._process = None
+        self._lines = None # Queue of output lines filled by the reader thread
+        self._lock = threading.Lock() # One command at a time per session
+
+    def _base_command(self):
+        command = [self.adb_path]
+        if self.serial:
+            command += ["-s", self.serial]
+        return command + ["shell"]
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        """Starts the 'adb shell' process and its stdout reader thread."""
+        self._process = subprocess.Popen(self._base_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+        self._lines = queue.Queue()
+        # A reader thread is needed because a blocking readline() cannot time out on its own
+        reader = threading.Thread(target=_pump_lines, args=(self._process.stdout, self._lines), daemon=True)
+        reader.start()
+
+    def close(self, kill=False):
+        """Closes the shell (kill=True: without asking it to exit first). Safe to call on an already closed session."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None and not kill:
+                process.stdin.write("exit\n")
+                process.stdin.flush()
+                process.wait(timeout=2)
+        except Exception:
+            pass
+        if process.poll() is None:
+            process.kill()
+
+    def abort(self):
+        """Kills the shell, ending a command that is in flight (it returns SESSION_DIED). Thread-safe."""
+        lines = self._lines
+        self.close(kill=True)
+        if lines is not None:
+            lines.put(None) # Wake the waiting command now; child processes may keep the pipe open a while
+
+    def run_adb_command(self, command, package_name="N/A", step_desc="execute command", timeout=60, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+        """Runs a device-side command (e.g. ["pm", "list", "packages"]) in the shell.
+
+        Returns the same dict shape as the module-level run_adb_command and supports the same
+        streaming options. Stopping early (stop_when) restarts the shell on the next command.
+        """
+        with self._lock:
+            # If the shell was already dead before we sent anything, retry once with a fresh one
+            for attempt in range(2):
+                try:
+                    if not self.is_alive():
+                        self.close()
+                        self._start()
+                    return self._run_locked(command, timeout, on_line, idle_timeout, stop_when, keep_output)
+                except FileNotFoundError:
+                    return {"error": True, "type": "ADB_NOT_FOUND", "message": "\nError: ADB command 'adb' not found. Ensure ADB is in your system's PATH.\n"}
+                except (BrokenPipeError, OSError):
+                    self.close()
+                    if attempt == 1:
+                        return {"error": True, "type": "SESSION_DIED", "message": f"  Error: ADB shell session could not be (re)started while trying to {step_desc} {package_name}.\n"}
+                except _SessionTimeout as e:
+                    self.close() # The shell is in an unknown state, start over next time
+                    if e.idle:
+                        return {"error": True, "type": "IDLE_TIMEOUT", "message": f"  Error: ADB command stopped producing output (no output for {idle_timeout}s) while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": e.partial_output}
+                    return {"error": True, "type": "TIMEOUT", "message": f"  Error: ADB command timed out while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": e.partial_output}
+                except _SessionDied as e:
+                    self.close()
+                    return {"error": True, "type": "SESSION_DIED", "message": f"  Error: ADB shell session ended while trying to {step_desc} {package_name}. It will be restarted on the next command.\n", "stdout_on_timeout": e.partial_output}
+                except Exception as e:
+                    self.close()
+                    return {"error": True, "type": "PYTHON_ERROR_SUBPROCESS", "message": f"\nAn unexpected Python error in the ADB shell session for {step_desc} {package_name}: {e}\nTraceback:\n{traceback.format_exc()}\n"}
+
+    def _run_locked(self, command, timeout, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+        marker = f"__HYPEROS_DONE_{uuid.uuid4().hex}__"
+        # stdin is redirected from /dev/null so the command cannot swallow our next command,
+        # stderr is merged so output ordering matches what 'adb shell' would print.
+        device_command = " ".join(shlex.quote(arg) for arg in command)
+        self._process.stdin.write(f"{{ {device_command} ; }} </dev/null 2>&1; echo \"{marker} $?\"\n")
+        self._process.stdin.flush()
+
+        output = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            wait = remaining if idle_timeout is None else min(remaining, idle_timeout)
+            try:
+                line = self._lines.get(timeout=max(wait, 0))
+            except queue.Empty:
+                raise _SessionTimeout("".join(output), idle=time.monotonic() < deadline)
+            if line is None:
+                raise _SessionDied("".join(output))
+            index = line.find(marker)
+            # The command output may not end with a newline, so the marker can share a line with it
+            text = line if index == -1 else line[:index]
+            if text:
+                if keep_output:
+                    output.append(text)
+                if on_line is not None:
+                    on_line(text.rstrip("\r\n"))
+                if stop_when is not None and stop_when(text.rstrip("\r\n")):
+                    # The command is still running in the shell; killing the shell is the only way to stop it
+                    self.close(kill=True)
+                    return {"error": False, "returncode": None, "stdout": "".join(output), "stderr": "", "stopped": True}
+            if index == -1:
+                continue
+            try:
+                returncode = int(line[index + len(marker):].strip())
+            except ValueError:
+                returncode = -1
+            return {"error": False, "returncode": returncode, "stdout": "".join(output), "stderr": ""}
+
+
+# --- Batched Device-Side Processing ---
+# Instead of one or two host<->device round-trips per package, the whole selection is
+# compiled into a single shell script. The uninstall -> disable fallback runs ON the device,
+# and the script prints one tab-separated record per package:
+#   <marker> TAB <package> TAB <UNINSTALLED|DISABLED|FAILED> TAB <uninstall output> TAB <disable output>
+# Outputs are flattened to one line with an unquoted $(echo $var) (globbing is off via 'set -f').
+BATCH_RESULT_MARKER = "__HYPEROS_RESULT__"
+# The script is passed as one 'sh -c' argument, and Linux (so Android too) caps a single argument
+# at 128 KiB. Large selections are therefore sent as several scripts of at most this many packages.
+BATCH_MAX_PACKAGES = 500
+
+def _chunk_count(items):
+    return max(1, -(-len(items) // BATCH_MAX_PACKAGES))
+
+# Per-package outcome statuses shared by batch and per-package processing:
+#   UNINSTALLED / DISABLED: done. FAILED: both uninstall and disable were refused by the device.
+#   ERROR: a host-side execution error (timeout, adb missing, session died) stopped this package.
+#   NO_RESULT: batch mode only, the device never reported this package (e.g. the script was cut off).
+#   CANCELLED: the job was cancelled before this package was processed.
+#   MISMATCH: the device reported success, but the verification after the run still found the package enabled.
+#   ABSENT: the command did not report success, but the verification found the package gone from the
+#           device entirely (not just for user 0), so it cannot be restored with install-existing.
+def make_package_result(status, uninstall_output="", disable_output="", message=""):
+    """Builds the structured per-package result returned by AppManagerEngine.apply."""
+    return {"status": status, "uninstall_output": uninstall_output, "disable_output": disable_output, "message": message}
+
+def build_batch_script(packages):
+    """Builds a device-side shell script that processes all packages in one run."""
+    quoted_packages = " ".join(shlex.quote(package) for package in packages)
+    return (
+        "set -f\n"
+        f"for p in {quoted_packages}; do\n"
+        "  u=$(pm uninstall -k --user 0 \"$p\" </dev/null 2>&1)\n"
+        "  case \"$u\" in\n"
+        f"    *Success*) echo \"{BATCH_RESULT_MARKER}\t$p\tUNINSTALLED\t$(echo $u)\t\" ;;\n"
+        "    *)\n"
+        "      d=$(pm disable-user --user 0 \"$p\" </dev/null 2>&1)\n"
+        "      case \"$d\" in\n"
+        f"        *\"new state: disabled\"*) echo \"{BATCH_RESULT_MARKER}\t$p\tDISABLED\t$(echo $u)\t$(echo $d)\" ;;\n"
+        f"        *) echo \"{BATCH_RESULT_MARKER}\t$p\tFAILED\t$(echo $u)\t$(echo $d)\" ;;\n"
+        "      esac ;;\n"
+        "  esac\n"
+        "done\n"
+    )
+
+
+def parse_batch_results(stdout):
+    """Parses the batch script output into {package: result dict} (see make_package_result)."""
+    results = {}
+    for line in stdout.splitlines():
+        if not line.startswith(BATCH_RESULT_MARKER + "\t"):
+            continue # Ignore anything that is not one of our records
+        fields = line.split("\t")
+        if len(fields) < 5:
+            continue # Truncated record (e.g. the session died mid-line)
+        _, package, status, uninstall_output, disable_output = fields[:5]
+        results[package] = make_package_result(status, uninstall_output, disable_output)
+    return results
+
+
+# --- Batched Restore ---
+# Undoes journaled actions (see hyperos_journal.py) in one device-side run per device:
+#   install-existing: reinstalls a package uninstalled for user 0 from the copy still on the system
+#                     ('cmd package install-existing', with 'pm install-existing' for older Android)
+#   enable:           re-enables a package disabled for user 0 ('pm enable')
+# One record per step: <marker> TAB <package> TAB <RESTORED|FAILED> TAB <action> TAB <output>
+RESTORE_RESULT_MARKER = "__HYPEROS_RESTORE__"
+
+def build_restore_script(steps):
+    """Builds a device-side shell script running [(package, "install-existing" | "enable")] in order."""
+    lines = [
+        "set -f",
+        "ie() {",
+        "  r=$(cmd package install-existing --user 0 \"$1\" </dev/null 2>&1)",
+        "  case \"$r\" in *\"installed for user\"*) ;; *) r=$(pm install-existing --user 0 \"$1\" </dev/null 2>&1) ;; esac",
+        "  case \"$r\" in *\"installed for user\"*) s=RESTORED ;; *) s=FAILED ;; esac",
+        f"  echo \"{RESTORE_RESULT_MARKER}\t$1\t$s\tinstall-existing\t$(echo $r)\"",
+        "}",
+        "en() {",
+        "  r=$(pm enable --user 0 \"$1\" </dev/null 2>&1)",
+        "  case \"$r\" in *\"new state: enabled\"*) s=RESTORED ;; *) s=FAILED ;; esac",
+        f"  echo \"{RESTORE_RESULT_MARKER}\t$1\t$s\tenable\t$(echo $r)\"",
+        "}",
+    ]
+    for package, action in steps:
+        lines.append(("ie " if action == "install-existing" else "en ") + shlex.quote(package))
+    return "\n".join(lines) + "\n"
+
+
+def parse_restore_results(stdout):
+    """Parses the restore script output into [(package, action, status, output)] in execution order."""
+    results = []
+    for line in stdout.splitlines():
+        if not line.startswith(RESTORE_RESULT_MARKER + "\t"):
+            continue
+        fields = line.split("\t")
+        if len(fields) < 5:
+            continue # Truncated record
+        _, package, status, action, output = fields[:5]
+        results.append((package, action, status, output))
+    return results
+
+
+def format_batch_result(package, result):
+    """Turns one parsed batch record into the same status lines the per-package mode prints."""
+    status = result["status"]
+    if status == "NO_RESULT":
+        return [f"  Status: No result reported by the device for {package}. It may not have been processed."]
+    if status == "CANCELLED":
+        return [f"  Status: Cancelled before {package} was processed."]
+    uninstall_output, disable_output = result["uninstall_output"], result["disable_output"]
+    if status == "UNINSTALLED":
+        return [f"  Status: Successfully UNINSTALLED {package} for user 0."]
+    lines = [f"  Uninstall failed for {package}. Trying to disable instead.",
+             "  Uninstall ADB Output (stdout):\n" + uninstall_output.strip()]
+    if status == "DISABLED":
+        lines.append(f"  Status: Successfully DISABLED {package} for user 0.")
+    else:
+        lines.append(f"  Status: Failed to UNINSTALL AND DISABLE {package}.")
+        lines.append("  Disable ADB Output (stdout):\n" + disable_output.strip())
+    return lines
+
+
+
+# --- Package States ---
+# The scan records the state of every package for user 0, so already handled apps are visible
+# and are not processed a second time:
+#   ENABLED:     installed and enabled for user 0
+#   DISABLED:    installed but disabled for user 0 (e.g. by a previous 'pm disable-user')
+#   UNINSTALLED: uninstalled for user 0 but still present on the system partition
+# They come from three bulk queries run in the same device-side script as the package list:
+# 'pm list packages -u' (everything incl. uninstalled), plain (installed) and '-d' (disabled).
+PACKAGE_STATES = ("ENABLED", "DISABLED", "UNINSTALLED")
+HANDLED_STATES = ("UNINSTALLED", "DISABLED") # Already in the state processing would put them in
+
+# --- Post-run Verification ---
+# The uninstall/disable outcome reported while processing comes from matching the pm output
+# ("Success", "new state: disabled"), which differs between Android versions and is lost when a
+# command times out or the session dies. So after a device is processed, its package states are
+# read again with the scan's bulk queries (one command, whatever the number of packages) and
+# every result is reconciled with what the device actually shows. Each result gains:
+#   "device_state": ENABLED / DISABLED / UNINSTALLED, or ABSENT (removed completely, e.g. a user app)
+#   "verification": VERIFIED (the device agrees), CORRECTED (the package was enabled before the run
+#                   and the device shows a different outcome than reported; "status" now follows the
+#                   device and "reported_status" keeps what the command reported), UNCHANGED (the
+#                   device disagrees, but the package was already in that state before the run, so
+#                   the result stays as reported), MISMATCH (still enabled although it should not be)
+#                   or UNVERIFIED (the states could not be read, or the state before the run is unknown)
+# The journal follows "reported_status" when there is one (see hyperos_journal.actions_from_result),
+# so a restore never undoes something this tool's own command did not report doing.
+# Packages still enabled after a reported success, an ERROR or a NO_RESULT are processed again,
+# up to VERIFY_RETRIES times, and verified again: two more commands per retry round.
+VERIFY_RETRIES = 1
+VERIFICATION_STATES = ("VERIFIED", "CORRECTED", "UNCHANGED", "MISMATCH", "UNVERIFIED")
+
+def reconcile_results(results, inventory, before):
+    """Checks apply results against the device's {package: state} read after the run.
+
+    before is {package: state} from the scan the plan was made from. Updates the results in
+    place (see above) and returns the packages worth processing again.
+    """
+    retry = []
+    for package, result in results.items():
+        state = inventory.get(package, "ABSENT")
+        result["device_state"] = state
+        reported = result["status"]
+        if state != "ENABLED":
+            if reported == state or (reported == "UNINSTALLED" and state == "ABSENT"):
+                result["verification"] = "VERIFIED" # Uninstalling a user app for its only user removes it
+            elif before.get(package) == "ENABLED":
+                result["verification"] = "CORRECTED"
+                result["message"] = (result.get("message", "") + f" Reported {reported}, but the device shows it {state.lower()}.").strip()
+                result["reported_status"] = reported
+                result["status"] = state
+            else:
+                result["verification"] = "UNCHANGED" if package in before else "UNVERIFIED"
+                result["message"] = (result.get("message", "") + f" The device shows it {state.lower()}, which it "
+                                     + ("already was before the run." if package in before else "may have been before the run.")).strip()
+        elif reported in ("FAILED", "CANCELLED"):
+            result["verification"] = "VERIFIED" # Still enabled, as reported
+        else: # Reported done, or nothing is known
+            result["verification"] = "MISMATCH"
+            result["message"] = (result.get("message", "") + f" Reported {reported}, but the device still shows it enabled.").strip()
+            if reported in HANDLED_STATES:
+                result["status"] = "MISMATCH"
+            retry.append(package)
+    return retry
+
+# --- Per-device Scan Cache ---
+# Listing every package on a phone and matching it against the catalog is the slow part of a scan,
+# and on a rack of already-debloated phones the answer rarely changes. So each device's last
+# package inventory is kept in <app data dir>/cache/scans/<serial>.json together with the build
+# fingerprint (ro.build.fingerprint) and an md5 of the sorted package lists.
+# A rescan runs ONE small device-side script that always reports the fingerprint and the list
+# hash, and only sends the full package lists when the hash differs from the cached one.
+# When the lists did change, only the added/removed packages are matched against the catalog.
+SCAN_CACHE_FORMAT = 2 # Bump when the cache file layout changes
+SCAN_CACHE_DIR = os.path.join(APP_DATA_DIR, "cache", "scans")
+SCAN_IDLE_TIMEOUT = 30 # Seconds without any output before a package listing is considered stuck
+_MD5_LINE = re.compile(r"^([0-9a-f]{32})\b")
+
+def build_scan_script(known_hash=None):
+    """Returns the device-side sh script that reports the fingerprint, list hash and (if changed) the package lists."""
+    known_hash = known_hash if known_hash and re.fullmatch(r"[0-9a-f]{32}", known_hash) else "none"
+    return ("getprop ro.build.fingerprint; "
+            "L=$(pm list packages --user 0 -u | sort; echo '#installed'; "
+            "pm list packages --user 0 | sort; echo '#disabled'; "
+            "pm list packages --user 0 -d | sort); "
+            "H=$(echo \"$L\" | md5sum); echo \"$H\"; "
+            f"[ \"${{H%% *}}\" = {known_hash} ] || echo \"$L\"")
+
+class ScanOutputParser:
+    """Incremental parser for build_scan_script output: feed() it one line at a time as it streams in."""
+
+    def __init__(self, known_hash=None):
+        self.known_hash = known_hash
+        self.fingerprint = None # First line of the output
+        self.list_hash = None
+        self.errors = [] # Lines that look like pm errors
+        self._sections = {"all": set(), "installed": set(), "disabled": set()}
+        self._current = self._sections["all"]
+
+    def feed(self, line):
+        line = line.strip()
+        if self.fingerprint is None:
+            self.fingerprint = line
+        elif line.startswith("package:"):
+            self._current.add(line[len("package:"):])
+        elif line in ("#installed", "#disabled"):
+            self._current = self._sections[line[1:]]
+        elif self.list_hash is None and _MD5_LINE.match(line):
+            self.list_hash = line[:32]
+        elif "Error:" in line or "Exception:" in line or "SecurityException" in line:
+            self.errors.append(line)
+
+    def result(self):
+        """Returns (fingerprint, list hash or None, {package: state} or None).
+
+        The inventory is None when the device did not send the lists (hash equal to known_hash).
+        """
+        fingerprint = self.fingerprint or ""
+        if self.known_hash and self.list_hash == self.known_hash:
+            return fingerprint, self.list_hash, None # The script skipped the lists
+        sections = self._sections
+        inventory = {}
+        for package in sections["all"] | sections["installed"]:
+            if package not in sections["installed"]:
+                inventory[package] = "UNINSTALLED"
+            elif package in sections["disabled"]:
+                inventory[package] = "DISABLED"
+            else:
+                inventory[package] = "ENABLED"
+        return fingerprint, self.list_hash, inventory
+
+def parse_scan_output(stdout, known_hash=None):
+    """Parses complete build_scan_script output (see ScanOutputParser.result)."""
+    parser = ScanOutputParser(known_hash)
+    for line in stdout.splitlines():
+        parser.feed(line)
+    return parser.result()
+
+class ScanCache:
+    """JSON file per device serial with its last fingerprint, package list hash and package inventory."""
+
+    def __init__(self, cache_dir=SCAN_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, serial):
+        # Serials of network devices look like 192.168.1.20:5555
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9._-]", "_", serial) + ".json")
+
+    def load(self, serial):
+        """Returns the cached entry for a serial, or None if missing/corrupt/outdated."""
+        try:
+            with open(self._path(serial), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("format") != SCAN_CACHE_FORMAT or entry.get("serial") != serial:
+            return None
+        entry["found"] = set(entry.get("found", []))
+        return entry
+
+    def store(self, serial, fingerprint, list_hash, inventory, found):
+        """Atomically writes a device's entry. Failures are ignored (the cache is only an optimization)."""
+        entry = {"format": SCAN_CACHE_FORMAT, "serial": serial, "fingerprint": fingerprint, "list_hash": list_hash,
+                 "catalog_version": get_catalog()[1]["version"], "scanned_at": time.time(),
+                 "inventory": dict(sorted(inventory.items())), "found": sorted(found)}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(serial)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Deletes every cached device entry."""
+        try:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+
+# --- Engine: scan / plan / apply ---
+# Status callbacks receive (serial, message); serial is None for messages that are not about one device.
+# Progress callbacks receive (done, total). Both may be called from worker threads.
+# transport selects how commands reach the phone:
+#   "subprocess": an 'adb' process per device holding a persistent shell (AdbShellSession)
+#   "socket": the adb server protocol spoken directly over localhost:5037 (hyperos_adb_socket.py)
+# record (a transcript path) also writes every command and its output to a transcript, and
+# replay (a transcript path or Transcript) answers every command from one instead of from
+# phones, with the recorded timing times time_scale (see hyperos_transcript.py). Both leave
+# the scan cache off unless one is passed, so a transcript always holds full package lists,
+# and a replayed run writes no journal and no report unless given one, since no phone was changed.
+# report (True: REPORT_PATH, a path ending in .jsonl or .csv, or False/None) receives one record per
+# device and package of every scan, apply and restore, as each device finishes (see hyperos_reports.py).
+TRANSPORTS = ("subprocess", "socket")
+JOURNAL_PATH = os.path.join(APP_DATA_DIR, "journal", "actions.jsonl")
+METRICS_DIR = os.path.join(APP_DATA_DIR, "metrics") # metrics.json / metrics.prom (see hyperos_metrics.py)
+REPORT_PATH = os.path.join(APP_DATA_DIR, "reports", "runs.jsonl")
+# Per-device scan snapshots for fleet comparisons (see hyperos_fleet.py); may point to a shared folder
+SNAPSHOT_DIR = os.environ.get("HYPEROS_SNAPSHOT_DIR") or os.path.join(APP_DATA_DIR, "snapshots")
+
+class AppManagerEngine:
+    """Headless scan/plan/apply engine shared by the GUI and the command-line tool."""
+
+    def __init__(self, adb_path="adb", max_workers=MAX_DEVICE_WORKERS, on_status=None, transport="subprocess", scan_cache=True, timeouts=None, journal=True, metrics=True,
+                 record=None, replay=None, time_scale=1.0, report=True):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport!r}, expected one of {TRANSPORTS}")
+        self.adb_path = adb_path
+        self.transport = transport
+        self.recorder = self.replay = None
+        if record is not None or replay is not None:
+            from hyperos_transcript import Transcript, TranscriptRecorder # Only needed for transcripts
+            if record is not None:
+                self.recorder = TranscriptRecorder(record, transport)
+            if replay is not None:
+                self.replay = Transcript.load(replay) if isinstance(replay, str) else replay
+                journal = journal if journal is not True else None
+                report = report if report is not True else None
+            scan_cache = scan_cache if scan_cache is not True else None
+        self.time_scale = time_scale
+        self.max_workers = max_workers
+        self.on_status = on_status or (lambda serial, message: None)
+        self.sessions = {} # Maps device serial to its persistent AdbShellSession
+        self._sessions_lock = threading.Lock()
+        # scan_cache may be True (default location), False/None (always fetch everything) or a ScanCache
+        self.scan_cache = ScanCache() if scan_cache is True else (scan_cache or None)
+        self._scan_changes = {} # Filled by scan_device: serial -> what changed since the cached scan
+        self._scan_states = {} # Filled by scan_device: serial -> {package: state}
+        self._scan_hashes = {} # Filled by scan_device: serial -> hash of the package lists seen by the last scan
+        self._scan_snapshots = {} # Filled by scan_device: serial -> snapshot of the scan (see hyperos_fleet.make_snapshot)
+        self._package_indexes = {} # serial -> (package list hash, PackageIndex), see package_index
+        # Per-command-class timeouts learned from observed latency (see hyperos_jobs.py)
+        self.timeouts = timeouts or AdaptiveTimeouts()
+        # Append-only record of every action (True: default location, False/None: no journal)
+        self.journal = ActionJournal(JOURNAL_PATH) if journal is True else (journal or None)
+        # Latency histograms and counters of every ADB command (True: new CommandMetrics, False/None: off)
+        self.metrics = CommandMetrics() if metrics is True else (metrics or None)
+        # Structured records of every run (True: default location, a path, a RunReport, or False/None: no report)
+        self.report = RunReport(REPORT_PATH) if report is True else (RunReport(report) if isinstance(report, str) else (report or None))
+
+    def _status(self, serial, message):
+        self.on_status(serial, message)
+
+    def get_session(self, serial):
+        """Returns the persistent shell session for a device serial, creating it on first use."""
+        with self._sessions_lock:
+            session = self.sessions.get(serial)
+            if session is None:
+                if self.replay is not None:
+                    from hyperos_transcript import ReplaySession
+                    session = ReplaySession(self.replay, serial, self.time_scale)
+                elif self.transport == "socket":
+                    from hyperos_adb_socket import AdbSocketTransport # Only needed for this transport
+                    session = AdbSocketTransport(serial)
+                else:
+                    session = AdbShellSession(serial, self.adb_path)
+                if self.recorder is not None:
+                    from hyperos_transcript import RecordingSession
+                    session = RecordingSession(session, self.recorder)
+                self.sessions[serial] = session
+            return session
+
+    def close(self):
+        """Closes every shell session (e.g. before a rescan, when phones may have been swapped)."""
+        with self._sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+        if self.recorder is not None:
+            self.recorder.close() # Reopened (appending) by the next command
+        if self.report:
+            self.report.close() # Reopened (appending) by the next run
+
+    def abort(self, serials=None):
+        """Kills the in-flight commands of the given devices (default: all). Used to cancel jobs."""
+        with self._sessions_lock:
+            sessions = [session for serial, session in self.sessions.items() if serials is None or serial in serials]
+        for session in sessions:
+            session.abort()
+
+    def _watch_job(self, job, serials):
+        """Makes cancelling the job abort the ADB commands running on these devices."""
+        if job is not None:
+            job.add_cancel_callback(lambda: self.abort(serials))
+
+    def _run(self, serial, command_class, command, package_name="N/A", step_desc="execute command", units=1, job=None, metric=None,
+             observed_class=None, **stream_options):
+        """Runs a device-side command with the adaptive timeout of its class and records its latency.
+
+        metric names the command in the metrics (default: the command class).
+        observed_class, if given, is called once the command has completed and returns the class its
+        latency is recorded under instead (for commands whose work depends on what the device finds).
+        Returns the usual result dict; type CANCELLED if the job was cancelled while it ran.
+        """
+        timeout = self.timeouts.timeout_for(command_class, units)
+        output_size = [0]
+        on_line = stream_options.get("on_line")
+        if on_line is not None and self.metrics:
+            def counting_on_line(line):
+                output_size[0] += len(line.encode("utf-8", "replace")) + 1
+                on_line(line)
+            stream_options["on_line"] = counting_on_line
+        started = time.monotonic()
+        result = self.get_session(serial).run_adb_command(command, package_name, step_desc, timeout=timeout, **stream_options)
+        elapsed = time.monotonic() - started
+        cancelled = job is not None and job.cancelled
+        if observed_class is not None and not result.get("error"):
+            command_class = observed_class()
+        if self.metrics:
+            if on_line is None:
+                output_size[0] = len((result.get("stdout") or result.get("stdout_on_timeout") or "").encode("utf-8", "replace"))
+            error_type = "CANCELLED" if cancelled else (result.get("type") if result.get("error") else None)
+            self.metrics.record(metric or command_class, serial, elapsed, result.get("returncode"), output_size[0], error_type)
+        if cancelled:
+            return {"error": True, "type": "CANCELLED", "message": f"  Cancelled while trying to {step_desc} {package_name}.\n", "stdout_on_timeout": result.get("stdout") or result.get("stdout_on_timeout") or ""}
+        if not result.get("error") or result.get("type") == "TIMEOUT":
+            self.timeouts.record(command_class, elapsed, units, timed_out=result.get("type") == "TIMEOUT")
+        return result
+
+    def export_metrics(self, directory=METRICS_DIR):
+        """Writes the command metrics to directory as metrics.json and metrics.prom. Returns the paths, or None."""
+        return self.metrics.export(directory) if self.metrics else None
+
+    # --- Devices ---
+    def list_devices(self):
+        """Runs 'adb devices'. Returns {"error": False, "devices": [(serial, state)], "stdout": ...} or an error dict."""
+        started = time.monotonic()
+        if self.replay is not None:
+            from hyperos_transcript import ReplaySession
+            result = ReplaySession(self.replay, None, self.time_scale).list_devices()
+        elif self.transport == "socket":
+            from hyperos_adb_socket import AdbSocketTransport
+            result = AdbSocketTransport().list_devices()
+        else:
+            result = run_adb_command([self.adb_path, "devices"], step_desc="check connection", timeout=self.timeouts.timeout_for("devices"))
+        if self.recorder is not None:
+            from hyperos_transcript import DEVICES_COMMAND
+            self.recorder.record(None, DEVICES_COMMAND, result, started, time.monotonic() - started)
+        if self.metrics:
+            self.metrics.record("devices", "", time.monotonic() - started, result.get("returncode"),
+                                len((result.get("stdout") or "").encode("utf-8", "replace")), result.get("type") if result.get("error") else None)
+        if result.get("error"):
+            return result
+        if result["returncode"] != 0:
+            return {"error": True, "type": "ADB_DEVICES_FAILED", "message": "Error: 'adb devices' failed.", "stdout": result["stdout"]}
+        return {"error": False, "devices": parse_adb_devices(result["stdout"]), "stdout": result["stdout"]}
+
+    # --- Scan ---
+    def _read_package_state(self, serial, known_hash=None, job=None, metric=None):
+        """Runs the scan script (see build_scan_script). Returns (fingerprint, hash, inventory or None) or an error dict."""
+        # The output is parsed line by line as it arrives instead of being collected first
+        parser = ScanOutputParser(known_hash)
+        # The device only sends the lists if their hash changed, so the command always gets the full
+        # listing's timeout. A run that only sent the hash is timed as "list_hash": fast unchanged
+        # rescans would otherwise shrink the timeout of the next full listing (e.g. after an update).
+        def observed_class():
+            return "list_hash" if known_hash and parser.list_hash == known_hash else "list"
+        result = self._run(serial, "list", ["sh", "-c", build_scan_script(known_hash)], "N/A", "list packages", job=job, metric=metric,
+                           observed_class=observed_class, on_line=parser.feed, idle_timeout=SCAN_IDLE_TIMEOUT, keep_output=False)
+
+        # Handle command execution errors (FileNotFoundError, Timeout, Python error)
+        if result.get("type") == "CANCELLED":
+             return {"error": True, "type": "CANCELLED", "message": "Scan cancelled."}
+        if result.get("error"):
+             self._status(serial, result["message"])
+             if result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
+                  self._status(serial, "Partial Output:\n" + result["stdout_on_timeout"].strip())
+             return {"error": True, "message": "Failed to run pm list packages command."} # Return a consistent error indicator
+
+        # Now check the result of the ADB command itself (returncode, error lines)
+        # pm list packages usually returns 0 on success, errors go to stdout
+        if result["returncode"] != 0 or parser.errors:
+            self._status(serial, "Failed to get package list from device (ADB Command Error).")
+            self._status(serial, "ADB Output (error lines):\n" + "\n".join(parser.errors))
+            return {"error": True, "message": "pm list packages returned an error."} # Return a consistent error indicator
+        return parser.result()
+
+    def get_installed_packages(self, serial):
+        """Fetches the set of installed package names for user 0, or an error dict."""
+        self._status(serial, "Fetching list of installed packages from the device for user 0...")
+        state = self._read_package_state(serial)
+        if isinstance(state, dict):
+            return state
+        return {package for package, package_state in state[2].items() if package_state != "UNINSTALLED"}
+
+    def scan_device(self, serial, use_cache=True, job=None):
+        """Scans one device. Returns the set of known bloatware found (any state), or None on error.
+
+        The state of each found package is recorded in the scan result's "states".
+        With use_cache, the device only sends its package lists if they changed since the last scan.
+        """
+        if job is not None:
+            job.checkpoint() # Waits while paused, raises JobCancelled once cancelled
+        cached = self.scan_cache.load(serial) if use_cache and self.scan_cache else None
+        if cached:
+            self._status(serial, "Checking the device's package list against the last scan...")
+        else:
+            self._status(serial, "Fetching package lists (installed, disabled, uninstalled) from the device for user 0...")
+        state = self._read_package_state(serial, cached["list_hash"] if cached else None, job)
+        if isinstance(state, dict):
+            return None
+        fingerprint, list_hash, inventory = state
+        known_bloatware_db, catalog_info = get_catalog()
+        same_catalog = bool(cached) and cached.get("catalog_version") == catalog_info["version"]
+        build_changed = bool(cached) and fingerprint != cached.get("fingerprint")
+        build_note = " (new build: " + fingerprint + ")" if build_changed else ""
+
+        if inventory is None:
+            # The device reported the same list hash: nothing was installed, removed, disabled or enabled
+            inventory = cached["inventory"]
+            if same_catalog:
+                found = cached["found"]
+            else:
+                found = known_bloatware_db.match(inventory).keys()
+            self._status(serial, f"Package list unchanged since the last scan{build_note}.")
+            self._scan_changes[serial] = {"cached": True, "added": 0, "removed": 0, "state_changed": 0, "build_changed": build_changed}
+        elif cached:
+            # Only the packages that appeared or disappeared need to be matched again
+            old_inventory = cached["inventory"]
+            added = inventory.keys() - old_inventory.keys()
+            removed = old_inventory.keys() - inventory.keys()
+            state_changed = sum(1 for package, package_state in inventory.items() if package in old_inventory and old_inventory[package] != package_state)
+            if same_catalog:
+                found = (cached["found"] - removed) | known_bloatware_db.match(added).keys()
+            else:
+                found = known_bloatware_db.match(inventory).keys()
+            self._status(serial, f"Package list changed since the last scan{build_note}: {len(added)} added, {len(removed)} removed, {state_changed} changed state.")
+            self._scan_changes[serial] = {"cached": False, "added": len(added), "removed": len(removed), "state_changed": state_changed, "build_changed": build_changed}
+        else:
+            # Compare installed packages against the known bloatware database (exact entries and patterns)
+            found = known_bloatware_db.match(inventory).keys()
+            self._scan_changes[serial] = {"cached": False, "added": len(inventory), "removed": 0, "state_changed": 0, "build_changed": False}
+
+        # Rewrite the cache entry unless nothing at all changed
+        unchanged = self._scan_changes[serial]["cached"] and same_catalog and not build_changed
+        if self.scan_cache and not unchanged:
+            self.scan_cache.store(serial, fingerprint, list_hash, inventory, found)
+        found = set(found)
+        self._scan_states[serial] = {package: inventory[package] for package in found}
+        self._scan_hashes[serial] = list_hash
+        from hyperos_fleet import make_snapshot
+        self._scan_snapshots[serial] = make_snapshot(serial, inventory, found, fingerprint, list_hash, catalog_info["version"])
+        handled = sum(1 for package in found if inventory[package] in HANDLED_STATES)
+        self._status(serial, f"Found {len(found)} known bloatware apps on this device ({handled} already uninstalled or disabled).")
+        return found
+
+    def scan(self, serials=None, on_progress=None, use_cache=True, job=None):
+        """Scans the given serials (default: every ready device) in parallel.
+
+        Returns {"error": False, "devices": {serial: set of packages}, "states": {serial: {package: state}},
+        "bloatware": {package: info}, "skipped": {serial: state}, "failed": [serial, ...],
+        "changes": {serial: change summary}} or an error dict.
+        use_cache=False ignores the per-device scan cache (full rescan).
+        job (a hyperos_jobs.Job) makes the scan pausable and cancellable; a cancelled scan returns
+        an error dict of type CANCELLED.
+        """
+        devices_result = self.list_devices()
+        if devices_result.get("error"):
+            self._status(None, devices_result["message"])
+            if devices_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
+                self._status(None, "Partial Output:\n" + devices_result["stdout_on_timeout"].strip())
+            return devices_result
+
+        # Devices that are unauthorized/offline are reported and skipped
+        skipped = {}
+        ready_serials = []
+        run_id = new_run_id()
+        for serial, state in devices_result["devices"]:
+            if serials and serial not in serials:
+                continue
+            if state == "device":
+                ready_serials.append(serial)
+            else:
+                skipped[serial] = state
+                self._status(None, f"Skipping device {serial}: state is '{state}' (check USB debugging authorization).")
+        if self.report and skipped:
+            self.report.write([{"run": run_id, "kind": "scan", "device": serial, "status": "SKIPPED", "output": state} for serial, state in skipped.items()])
+
+        if not ready_serials:
+            self._status(None, "Error: ADB device not found or unauthorized.")
+            self._status(None, "Please ensure your phone is connected, USB Debugging is ON, and authorized.")
+            self._status(None, "ADB Output (stdout):\n" + devices_result["stdout"].strip())
+            return {"error": True, "type": "NO_DEVICES", "message": "No ready ADB device found.", "skipped": skipped}
+
+        self._status(None, f"ADB connection successful. {len(ready_serials)} device(s) ready: {', '.join(ready_serials)}")
+        # Create the sessions up front so clients know how many devices are involved
+        for serial in ready_serials:
+            self.get_session(serial)
+
+        self._scan_changes = {}
+        self._scan_states = {}
+        self._scan_snapshots = {}
+        self._watch_job(job, ready_serials)
+
+        def scan_one(serial):
+            started = time.monotonic()
+            try:
+                found = self.scan_device(serial, use_cache, job)
+            except JobCancelled:
+                return None
+            if self.report and not (job is not None and job.cancelled):
+                self.report.write(scan_records(run_id, serial, found, self._scan_states.get(serial, {}), time.monotonic() - started, get_catalog()[0]))
+            return found
+
+        device_bloatware = self._map_devices(ready_serials, scan_one, on_progress)
+        if job is not None and job.cancelled:
+            self._status(None, "Scan cancelled.")
+            return {"error": True, "type": "CANCELLED", "message": "Scan cancelled.", "skipped": skipped}
+        failed = [serial for serial, found in device_bloatware.items() if found is None]
+        device_bloatware = {serial: found for serial, found in device_bloatware.items() if found is not None}
+        if not device_bloatware:
+            self._status(None, "Failed to get package list.")
+            return {"error": True, "type": "SCAN_FAILED", "message": "Failed to get package list from any device.", "skipped": skipped, "failed": failed}
+
+        # Merge the per-device results into one list (union), remembering which device has what
+        known_bloatware_db = get_catalog()[0]
+        bloatware = {}
+        for found in device_bloatware.values():
+            for package in found:
+                if package not in bloatware:
+                    bloatware[package] = known_bloatware_db.lookup(package)
+        return {"error": False, "devices": device_bloatware, "bloatware": bloatware, "skipped": skipped, "failed": failed, "changes": dict(self._scan_changes),
+                "states": {serial: self._scan_states[serial] for serial in device_bloatware},
+                "snapshots": {serial: self._scan_snapshots[serial] for serial in device_bloatware}}
+
+    @staticmethod
+    def export_snapshots(scan_result, directory=SNAPSHOT_DIR):
+        """Writes every scanned device's snapshot to directory (see hyperos_fleet.py). Returns the paths."""
+        from hyperos_fleet import write_snapshot
+        return [write_snapshot(directory, snapshot) for serial, snapshot in sorted(scan_result.get("snapshots", {}).items())]
+
+    # --- Plan ---
+    @staticmethod
+    def plan(scan_result, packages=None, safety=None, categories=None, serials=None, include_handled=False):
+        """Resolves a selection against a scan into {serial: [packages]}.
+
+        Every given criterion must match (packages, safety levels, categories); None means "any".
+        Each device only gets the packages it actually has, and (unless include_handled) only those
+        not already uninstalled or disabled there.
+        """
+        safety = {level.upper() for level in safety} if safety else None
+        known_bloatware_db = get_catalog()[0]
+        plan = {}
+        for serial, found in sorted(scan_result["devices"].items()):
+            if serials and serial not in serials:
+                continue
+            selected = []
+            states = scan_result.get("states", {}).get(serial, {})
+            for package in sorted(found):
+                if not include_handled and states.get(package) in HANDLED_STATES:
+                    continue
+                description, package_safety, category = known_bloatware_db.lookup(package)
+                if packages is not None and package not in packages:
+                    continue
+                if safety is not None and package_safety not in safety:
+                    continue
+                if categories is not None and category not in categories:
+                    continue
+                selected.append(package)
+            if selected:
+                plan[serial] = selected
+        return plan
+
+    @staticmethod
+    def plan_profiles(scan_result, profiles, serials=None):
+        """Resolves debloat profiles against a scan (see hyperos_profiles.resolve_profiles).
+
+        Returns {"plan": {serial: [packages]}, "already_handled": ..., "not_installed": ...}.
+        """
+        from hyperos_profiles import resolve_profiles
+        return resolve_profiles(profiles, scan_result, get_catalog()[0], serials=serials)
+
+    # --- Impact Analysis ---
+    def package_index(self, serial, job=None):
+        """Returns the device's PackageIndex (see hyperos_dumpsys.py), or None if dumpsys failed.
+
+        The index is built once per device and scan: it is reused until a scan sees a different package list.
+        """
+        list_hash = self._scan_hashes.get(serial)
+        cached = self._package_indexes.get(serial)
+        if cached is not None and cached[0] == list_hash:
+            return cached[1]
+        from hyperos_dumpsys import PackageIndexParser, build_impact_script
+        self._status(serial, "Reading 'dumpsys package' for the impact analysis...")
+        # Parsed line by line as the output arrives; the (large) dump itself is never kept
+        parser = PackageIndexParser()
+        started = time.monotonic()
+        result = self._run(serial, "dumpsys", ["sh", "-c", build_impact_script()], "N/A", "read dumpsys package", job=job,
+                           on_line=parser.feed, idle_timeout=SCAN_IDLE_TIMEOUT, keep_output=False)
+        if result.get("error"):
+            if result.get("type") != "CANCELLED":
+                self._status(serial, result["message"])
+            return None
+        self._status(serial, f"Indexed {parser.lines} lines of 'dumpsys package' ({len(parser.index.installed)} packages) in {time.monotonic() - started:.2f}s.")
+        self._package_indexes[serial] = (list_hash, parser.index)
+        return parser.index
+
+    def analyze_impact(self, plan, job=None):
+        """Checks what the packages of a plan provide on their device, all devices in parallel.
+
+        Returns {serial: {package: [(level, message)]}} (see PackageIndex.impact); a device whose
+        dumpsys could not be read maps to None.
+        With a job, pausing takes effect between devices and cancelling kills the running dumpsys.
+        """
+        self._watch_job(job, list(plan))
+
+        def analyze_device(serial):
+            if job is not None:
+                job.checkpoint()
+            index = self.package_index(serial, job)
+            if index is None:
+                return None
+            return {package: index.impact(package) for package in plan[serial]}
+
+        return self._map_devices(list(plan), analyze_device)
+
+    # --- Apply ---
+    def apply(self, plan, batch=True, on_progress=None, job=None, verify=True, retries=VERIFY_RETRIES):
+        """Processes a plan on every device in parallel.
+
+        Returns {serial: {package: result dict}} (see make_package_result).
+        With verify, each device's results are then checked against its package states and
+        packages that are still enabled are retried (see "Post-run Verification").
+        With a job, pausing takes effect between packages (between devices in batch mode) and
+        cancelling kills the running commands; unprocessed packages are reported as CANCELLED.
+        """
+        total = sum(len(packages) for packages in plan.values())
+        progress = _ProgressCounter(total, on_progress)
+        device_worker = self._process_device_batch if batch else self._process_device
+        self._watch_job(job, list(plan))
+        run_id = new_run_id()
+
+        def run_device(serial):
+            results = {}
+            reported = set() # Packages whose apply record is already in the report
+            catalog = get_catalog()[0]
+
+            def on_result(package, result):
+                # Written as each result arrives, so the report never waits for the whole device
+                reported.add(package)
+                if self.report:
+                    self.report.write(apply_records(run_id, serial, {package: result}, catalog))
+
+            try:
+                device_worker(serial, plan[serial], progress, job, results, on_result)
+                if verify:
+                    self._verify_device(serial, results, device_worker, job, retries, on_result)
+            except JobCancelled:
+                self._status(serial, "Processing cancelled.")
+                for package in plan[serial]:
+                    results.setdefault(package, make_package_result("CANCELLED"))
+            except Exception as e:
+                # One broken device must not stop the rest of the rack
+                self._status(serial, f"\nAn unexpected error occurred while processing this device: {e}")
+                self._status(serial, "Traceback:\n" + traceback.format_exc())
+                for package in plan[serial]:
+                    results.setdefault(package, make_package_result("ERROR", message=str(e)))
+            if self.journal:
+                self.journal.record_apply(run_id, serial, results)
+            if self.report:
+                # Packages the workers never got to (cancelled, unexpected errors), then the verification outcomes
+                self.report.write(apply_records(run_id, serial, {package: result for package, result in results.items() if package not in reported}, catalog))
+                self.report.write(verify_records(run_id, serial, {package: result for package, result in results.items() if "verification" in result}, catalog))
+            return results
+
+        return self._map_devices(list(plan), run_device)
+
+    # --- Restore ---
+    def restore_plan(self, serials=None, packages=None, run_id=None):
+        """Reads the journal and returns {serial: [(package, restore action)]}, newest first (see hyperos_journal.restore_plan)."""
+        if not self.journal:
+            return {}
+        return restore_plan(self.journal.records(serials), serials, packages, run_id)
+
+    def restore(self, plan, on_progress=None, job=None):
+        """Runs a restore plan with one device-side script per device, all devices in parallel.
+
+        Returns {serial: {package: {"status": RESTORED | FAILED | ERROR | NO_RESULT | CANCELLED, "action", "output"}}}.
+        """
+        total = sum(len(steps) for steps in plan.values())
+        progress = _ProgressCounter(total, on_progress)
+        self._watch_job(job, list(plan))
+        run_id = new_run_id()
+
+        def run_device(serial):
+            steps = plan[serial]
+            results = {}
+            done_steps = [] # (package, action, status, output) as reported by the device
+            try:
+                if job is not None:
+                    job.checkpoint()
+                self._status(serial, f"Restoring {len(steps)} packages in {_chunk_count(steps)} run(s)...")
+                for start in range(0, len(steps), BATCH_MAX_PACKAGES):
+                    if start and job is not None:
+                        job.checkpoint()
+                    chunk = steps[start:start + BATCH_MAX_PACKAGES]
+                    result = self._run(serial, "batch", ["sh", "-c", build_restore_script(chunk)], f"{len(chunk)} packages", "restore", units=len(chunk), job=job, metric="restore")
+                    if result.get("error"):
+                        self._status(serial, result["message"])
+                    output = result.get("stdout", "") if not result.get("error") else result.get("stdout_on_timeout", "")
+                    chunk_steps = parse_restore_results(output or "")
+                    done_steps.extend(chunk_steps)
+                    for package, action, status, step_output in chunk_steps:
+                        results[package] = {"status": status, "action": action, "output": step_output}
+                        self._status(serial, f"  {'Restored' if status == 'RESTORED' else 'Failed to restore'} {package} ({action}).")
+                    missing_status = "CANCELLED" if result.get("type") == "CANCELLED" else ("NO_RESULT" if not result.get("error") else "ERROR")
+                    if len(chunk_steps) < len(chunk):
+                        break # Steps run in order; stop at the first run that was cut short
+            except JobCancelled:
+                missing_status = "CANCELLED"
+            except Exception as e:
+                self._status(serial, f"\nAn unexpected error occurred while restoring this device: {e}")
+                self._status(serial, "Traceback:\n" + traceback.format_exc())
+                missing_status = "ERROR"
+            for package, action in steps[len(done_steps):]: # Steps run in order, so the missing ones are the last
+                results.setdefault(package, {"status": missing_status, "action": action, "output": ""})
+                done_steps.append((package, action, missing_status, ""))
+            progress.advance(len(steps))
+            if self.journal:
+                self.journal.append([{"run": run_id, "serial": serial, "package": package, "action": action, "result": status, "output": step_output}
+                                     for package, action, status, step_output in done_steps])
+            if self.report:
+                self.report.write(restore_records(run_id, serial, done_steps, get_catalog()[0]))
+            return results
+
+        return self._map_devices(list(plan), run_device)
+
+    def _verify_device(self, serial, results, device_worker, job=None, retries=VERIFY_RETRIES, on_result=None):
+        """Reconciles a device's results with its package states after processing, retrying what did not take effect.
+
+        on_result(package, result) is called for each retried package, like in the device workers.
+        """
+        for attempt in range(retries + 1):
+            if job is not None:
+                job.checkpoint()
+            self._status(serial, "\nVerifying the results on the device...")
+            state = self._read_package_state(serial, job=job, metric="verify")
+            if isinstance(state, dict) or not state[2]: # An empty list means the device did not answer properly
+                if isinstance(state, dict) and state.get("type") == "CANCELLED":
+                    raise JobCancelled()
+                self._status(serial, "  Could not read the package states; the results above are unverified.")
+                for result in results.values():
+                    result.setdefault("verification", "UNVERIFIED")
+                return results
+            retry = reconcile_results(results, state[2], self._scan_states.get(serial, {}))
+            if not retry or attempt == retries:
+                break
+            self._status(serial, f"  {len(retry)} app(s) are still enabled. Processing them again (retry {attempt + 1} of {retries})...")
+            def on_retried(package, result, attempt=attempt):
+                result["retries"] = attempt + 1
+                if on_result is not None:
+                    on_result(package, result)
+            results.update(device_worker(serial, retry, _ProgressCounter(len(retry)), job, None, on_retried))
+
+        counts = {verification: 0 for verification in VERIFICATION_STATES}
+        for package, result in sorted(results.items()):
+            counts[result["verification"]] += 1
+            if result["verification"] != "VERIFIED":
+                self._status(serial, f"  {package}: {result['message']}")
+        self._status(serial, f"  Verification: {counts['VERIFIED']} verified, {counts['CORRECTED']} corrected, {counts['UNCHANGED']} unchanged, "
+                             f"{counts['MISMATCH']} still enabled, {counts['UNVERIFIED']} unverified.")
+        return results
+
+    def _process_device(self, serial, packages, progress, job=None, results=None, on_result=None):
+        """Processes one device package by package. Fills and returns results.
+
+        on_result(package, result) is called as soon as each package's result is known.
+        """
+        results = {} if results is None else results
+        for package in packages:
+            if job is not None:
+                job.checkpoint()
+            self._status(serial, f"\nProcessing package: {package}")
+            started = time.monotonic()
+            results[package] = self._process_package(serial, package, job)
+            results[package]["duration"] = round(time.monotonic() - started, 4)
+            if on_result is not None:
+                on_result(package, results[package])
+            progress.advance()
+            if results[package]["status"] == "CANCELLED":
+                raise JobCancelled()
+        return results
+
+    def _process_package(self, serial, package, job=None):
+        """Uninstalls one package for user 0, falling back to disabling it."""
+        # --- Attempt 1: Uninstall for User 0 ---
+        uninstall_command = ["pm", "uninstall", "-k", "--user", "0", package]
+        uninstall_result = self._run(serial, "pm", uninstall_command, package, "uninstall", job=job, metric="uninstall")
+        if uninstall_result.get("type") == "CANCELLED":
+            return make_package_result("CANCELLED", message=uninstall_result["message"].strip())
+
+        # Handle command execution errors or ADB command failure
+        if uninstall_result.get("error"):
+             self._status(serial, uninstall_result["message"])
+             if uninstall_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
+                 self._status(serial, "Partial Output:\n" + uninstall_result["stdout_on_timeout"].strip())
+             self._status(serial, f"  Failed to process {package} due to execution error.")
+             return make_package_result("ERROR", uninstall_result.get("stdout_on_timeout") or "", message=uninstall_result["message"].strip())
+
+        # Now check the result of the ADB command itself
+        # pm uninstall usually returns 0 on success, errors go to stdout
+        if "Success" in uninstall_result["stdout"]:
+            self._status(serial, f"  Status: Successfully UNINSTALLED {package} for user 0.")
+            return make_package_result("UNINSTALLED", uninstall_result["stdout"])
+
+        # Uninstall failed, now try to disable
+        self._status(serial, f"  Uninstall failed for {package}. Trying to disable instead.")
+        self._status(serial, "  Uninstall ADB Output (stdout):\n" + uninstall_result["stdout"].strip())
+
+        # --- Attempt 2: Disable for User 0 ---
+        disable_command = ["pm", "disable-user", "--user", "0", package]
+        disable_result = self._run(serial, "pm", disable_command, package, "disable", job=job, metric="disable")
+        if disable_result.get("type") == "CANCELLED":
+            return make_package_result("CANCELLED", uninstall_result["stdout"], message=disable_result["message"].strip())
+
+        # Handle command execution errors or ADB command failure
+        if disable_result.get("error"):
+            self._status(serial, disable_result["message"])
+            if disable_result.get("stdout_on_timeout"): # Print output if available (e.g., partial output on timeout)
+                self._status(serial, "Partial Output:\n" + disable_result["stdout_on_timeout"].strip())
+            self._status(serial, f"  Failed to process {package} due to execution error.")
+            return make_package_result("ERROR", uninstall_result["stdout"], disable_result.get("stdout_on_timeout") or "", disable_result["message"].strip())
+
+        # Check the result of the ADB command itself
+        # pm disable-user usually returns 0 on success, output indicates new state
+        if "new state: disabled-user" in disable_result["stdout"] or "new state: disabled" in disable_result["stdout"]:
+            self._status(serial, f"  Status: Successfully DISABLED {package} for user 0.")
+            return make_package_result("DISABLED", uninstall_result["stdout"], disable_result["stdout"])
+        self._status(serial, f"  Status: Failed to UNINSTALL AND DISABLE {package}.")
+        self._status(serial, "  Disable ADB Output (stdout):\n" + disable_result["stdout"].strip())
+        return make_package_result("FAILED", uninstall_result["stdout"], disable_result["stdout"])
+
+    def _process_device_batch(self, serial, packages, progress, job=None, results=None, on_result=None):
+        """Processes one device with device-side scripts of up to BATCH_MAX_PACKAGES packages. Fills and returns results.
+
+        on_result(package, result) is called as soon as each package's record streams in from the device.
+        """
+        results = {} if results is None else results
+        self._status(serial, f"Batch mode: sending {len(packages)} packages to the device in {_chunk_count(packages)} run(s)...")
+        for start in range(0, len(packages), BATCH_MAX_PACKAGES):
+            if job is not None:
+                job.checkpoint()
+            chunk = packages[start:start + BATCH_MAX_PACKAGES]
+            script = build_batch_script(chunk)
+            # Records are parsed as they stream in; each package's duration is the time between its
+            # record and the one before (or the start)
+            streamed = {}
+            last = [time.monotonic()]
+            def on_line(line):
+                for package, result in parse_batch_results(line).items():
+                    now = time.monotonic()
+                    result["duration"] = round(now - last[0], 4)
+                    last[0] = now
+                    streamed[package] = result
+                    if on_result is not None:
+                        on_result(package, result)
+            # The timeout scales with the number of packages, since everything runs in one command
+            batch_result = self._run(serial, "batch", ["sh", "-c", script], f"{len(chunk)} packages", "batch process", units=len(chunk), job=job, on_line=on_line)
+
+            output = batch_result.get("stdout", "") if not batch_result.get("error") else batch_result.get("stdout_on_timeout", "")
+            if batch_result.get("error"):
+                self._status(serial, batch_result["message"])
+
+            # Even after an error, report whatever records arrived before it
+            parsed = parse_batch_results(output or "")
+            missing_status = "CANCELLED" if batch_result.get("type") == "CANCELLED" else "NO_RESULT"
+            for package in chunk:
+                results[package] = streamed.get(package) or parsed.get(package)
+                if results[package] is None:
+                    results[package] = make_package_result(missing_status, message=batch_result.get("message", "").strip())
+                if package not in streamed and on_result is not None:
+                    on_result(package, results[package])
+                self._status(serial, f"\nProcessing package: {package}")
+                for line in format_batch_result(package, results[package]):
+                    self._status(serial, line)
+            progress.advance(len(chunk))
+        return results
+
+    # --- Helpers ---
+    def _map_devices(self, serials, worker, on_progress=None):
+        """Runs worker(serial) for every serial on a bounded pool, one worker per device.
+
+        Returns {serial: worker result}. on_progress counts finished devices.
+        """
+        results = {}
+        if not serials:
+            return results
+        progress = _ProgressCounter(len(serials), on_progress)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(serials), self.max_workers)) as pool:
+            futures = {pool.submit(worker, serial): serial for serial in serials}
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]] = future.result()
+                progress.advance()
+        return results
+
+
+class _ProgressCounter:
+    """Thread-safe done/total counter that forwards every change to an optional callback."""
+
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.done = 0
+        self._callback = callback
+        self._lock = threading.Lock()
+        if callback:
+            callback(0, total)
+
+    def advance(self, step=1):
+        with self._lock:
+            self.done = min(self.done + step, self.total)
+            done = self.done
+        if self._callback:
+            self._callback(done, self.total)
@@ -0,0 +1,182 @@
+# --- Fleet Snapshots ---
+# After every scan each device's package inventory is saved as a small snapshot file, so a fleet
+# of phones can be compared and checked for drift (e.g. an OTA that reinstalled bloat) without
+# rescanning them. Snapshots live in <snapshot dir>/<serial>/<milliseconds since epoch>.json.gz:
+#   {"snapshot": 1, "serial": ..., "taken_at": ..., "fingerprint": ro.build.fingerprint,
+#    "list_hash": ..., "catalog_version": ..., "bloatware": [catalog packages found],
+#    "packages": {"ENABLED": [...], "DISABLED": [...], "UNINSTALLED": [...]}}
+# Only the newest SNAPSHOT_KEEP files per device are kept. The snapshot dir may be a shared
+# folder that several PCs write to (serials do not collide).
+#
+# FleetIndex loads the latest snapshots (plus the one before, for drift) of every device and
+# indexes them once: package -> {serial: state} over the latest snapshots, and the sorted
+# package names for prefix/glob queries. "Which devices still have X" is then a dict lookup
+# (or a bisect for "com.miui.*"), and diffs are set operations on precomputed sets.
+
+import bisect
+import fnmatch
+import gzip
+import json
+import os
+import re
+import time
+
+from hyperos_engine import PACKAGE_STATES
+
+SNAPSHOT_FORMAT = 1 # Bump when the snapshot layout changes
+SNAPSHOT_EXTENSION = ".json.gz"
+SNAPSHOT_KEEP = 50 # Snapshots kept per device
+INSTALLED_STATES = ("ENABLED", "DISABLED") # Still on the device for user 0
+
+
+def make_snapshot(serial, inventory, found, fingerprint, list_hash, catalog_version, taken_at=None):
+    """Builds a device's snapshot from a scan: inventory is {package: state}, found the catalog packages among them."""
+    packages = {state: [] for state in PACKAGE_STATES}
+    for package, state in sorted(inventory.items()):
+        packages.setdefault(state, []).append(package)
+    return {"snapshot": SNAPSHOT_FORMAT, "serial": serial, "taken_at": round(taken_at or time.time(), 3), "fingerprint": fingerprint,
+            "list_hash": list_hash, "catalog_version": catalog_version, "bloatware": sorted(found), "packages": packages}
+
+
+def _device_dir(directory, serial):
+    # Serials of network devices look like 192.168.1.20:5555
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]", "_", serial))
+
+
+def write_snapshot(directory, snapshot, keep=SNAPSHOT_KEEP):
+    """Writes a snapshot (atomically) and prunes the device's oldest ones. Returns the path."""
+    device_dir = _device_dir(directory, snapshot["serial"])
+    os.makedirs(device_dir, exist_ok=True)
+    path = os.path.join(device_dir, f"{int(snapshot['taken_at'] * 1000)}{SNAPSHOT_EXTENSION}")
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+    for old in _snapshot_files(device_dir)[:-keep]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+def _snapshot_files(device_dir):
+    """A device's snapshot files, oldest first (the file names are timestamps)."""
+    try:
+        names = [name for name in os.listdir(device_dir) if name.endswith(SNAPSHOT_EXTENSION)]
+    except OSError:
+        return []
+    return [os.path.join(device_dir, name) for name in sorted(names, key=lambda name: int(name[:-len(SNAPSHOT_EXTENSION)]) if name[:-len(SNAPSHOT_EXTENSION)].isdigit() else -1)]
+
+
+def read_snapshot(path):
+    """Reads one snapshot file and adds "states" ({package: state}). Returns None if unreadable."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError, EOFError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("snapshot") != SNAPSHOT_FORMAT:
+        return None
+    snapshot["states"] = {package: state for state, packages in snapshot.get("packages", {}).items() for package in packages}
+    return snapshot
+
+
+def load_snapshots(directory, history=2):
+    """Reads the newest 'history' snapshots of every device under directory. Returns (snapshots, unreadable paths)."""
+    snapshots, unreadable = [], []
+    try:
+        device_dirs = sorted(os.listdir(directory))
+    except OSError:
+        return snapshots, unreadable
+    for name in device_dirs:
+        for path in _snapshot_files(os.path.join(directory, name))[-history:]:
+            snapshot = read_snapshot(path)
+            if snapshot is None:
+                unreadable.append(path)
+            else:
+                snapshots.append(snapshot)
+    return snapshots, unreadable
+
+
+class FleetIndex:
+    """Indexes the snapshots of many devices for "which devices have X", device diffs and drift."""
+
+    def __init__(self, snapshots):
+        self.history = {} # serial -> [snapshot], oldest first
+        for snapshot in sorted(snapshots, key=lambda snapshot: snapshot["taken_at"]):
+            self.history.setdefault(snapshot["serial"], []).append(snapshot)
+        self.latest = {serial: snapshots[-1] for serial, snapshots in self.history.items()}
+        self._holders = {} # package -> {serial: state}, over the latest snapshots
+        self._installed = {} # serial -> frozenset of packages still installed for user 0
+        for serial, snapshot in self.latest.items():
+            for package, state in snapshot["states"].items():
+                self._holders.setdefault(package, {})[serial] = state
+            self._installed[serial] = frozenset(package for package, state in snapshot["states"].items() if state in INSTALLED_STATES)
+        self._packages = sorted(self._holders)
+
+    def __len__(self):
+        return len(self.latest)
+
+    def _matching_packages(self, pattern):
+        """Package names matching an exact name or a glob ("com.miui.*"), using the sorted names for its literal prefix."""
+        if not any(char in pattern for char in "*?["):
+            return [pattern] if pattern in self._holders else []
+        prefix = re.split(r"[*?\[]", pattern, 1)[0]
+        start = bisect.bisect_left(self._packages, prefix)
+        end = bisect.bisect_left(self._packages, prefix + "\uffff") if prefix else len(self._packages)
+        return fnmatch.filter(self._packages[start:end], pattern)
+
+    def devices_with(self, pattern, states=INSTALLED_STATES):
+        """Returns {package: {serial: state}} for the packages matching pattern that devices have in one of states."""
+        states = set(states)
+        result = {}
+        for package in self._matching_packages(pattern):
+            holders = {serial: state for serial, state in self._holders[package].items() if state in states}
+            if holders:
+                result[package] = dict(sorted(holders.items()))
+        return result
+
+    def diff(self, serial_a, serial_b):
+        """Compares two devices' latest snapshots: packages only one has installed, and different states of shared ones."""
+        a, b = self._installed[serial_a], self._installed[serial_b]
+        states_a, states_b = self.latest[serial_a]["states"], self.latest[serial_b]["states"]
+        return {"a": serial_a, "b": serial_b, "only_a": sorted(a - b), "only_b": sorted(b - a),
+                "state_differs": {package: [states_a[package], states_b[package]] for package in sorted(a & b) if states_a[package] != states_b[package]}}
+
+    def drift(self, serials=None):
+        """Compares every device's latest snapshot with the one before it.
+
+        Returns {serial: changes} for the devices that changed: "reappeared" (catalog apps enabled
+        again after being disabled/uninstalled, or newly installed), "added"/"removed" (any
+        package), "state_changed" and, after an OTA, "build" ([old, new] fingerprint).
+        """
+        drifted = {}
+        for serial, snapshots in sorted(self.history.items()):
+            if (serials and serial not in serials) or len(snapshots) < 2:
+                continue
+            previous, latest = snapshots[-2], snapshots[-1]
+            old, new = previous["states"], latest["states"]
+            changes = {}
+            reappeared = [package for package in latest["bloatware"] if new.get(package) == "ENABLED" and old.get(package) != "ENABLED"]
+            added = sorted(new.keys() - old.keys())
+            removed = sorted(old.keys() - new.keys())
+            state_changed = {package: [old[package], new[package]] for package in sorted(new.keys() & old.keys()) if old[package] != new[package]}
+            for key, value in (("reappeared", reappeared), ("added", added), ("removed", removed), ("state_changed", state_changed)):
+                if value:
+                    changes[key] = value
+            if previous["fingerprint"] != latest["fingerprint"]:
+                changes["build"] = [previous["fingerprint"], latest["fingerprint"]]
+            if changes:
+                changes["since"] = previous["taken_at"]
+                drifted[serial] = changes
+        return drifted
+
+    def summary(self):
+        """One row per device: last snapshot time, build, package counts and catalog apps still enabled."""
+        rows = []
+        for serial, snapshot in sorted(self.latest.items()):
+            states = snapshot["states"]
+            rows.append({"serial": serial, "taken_at": snapshot["taken_at"], "fingerprint": snapshot["fingerprint"],
+                         "catalog_version": snapshot["catalog_version"], "packages": len(self._installed[serial]),
+                         "bloatware_enabled": sum(1 for package in snapshot["bloatware"] if states.get(package) == "ENABLED")})
+        return rows
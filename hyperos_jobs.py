@@ -0,0 +1,214 @@
+# --- Job Control and Adaptive Timeouts ---
+# Scans and processing runs are submitted as jobs to a JobController instead of each starting
+# its own unstoppable thread. A job can be paused, resumed and cancelled at any time:
+#   - pause/resume take effect at the next checkpoint (between devices / packages),
+#   - cancel also runs the job's cancel callbacks, which the engine uses to kill the ADB
+#     commands that are in flight, so a hung device does not hold the run for a full timeout.
+# New jobs can be submitted while others run; they wait in a FIFO queue.
+#
+# AdaptiveTimeouts replaces the fixed 60 s timeout with one per command class, derived from the
+# latency actually observed (smoothed mean + 4 x mean deviation, like TCP's retransmission
+# timeout), so short 'pm' calls fail fast while slow listings or 'dumpsys' get more time.
+
+import itertools
+import queue
+import threading
+
+JOB_STATES = ("QUEUED", "RUNNING", "PAUSED", "CANCELLED", "DONE", "FAILED")
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint of a job that was cancelled."""
+
+
+class Job:
+    """One unit of work run by a JobController. func is called as func(job, *args, **kwargs)."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, func, args=(), kwargs=None, on_done=None):
+        self.id = next(self._ids)
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.on_done = on_done # Called as on_done(job) from the worker thread when the job ends
+        self.state = "QUEUED"
+        self.result = None
+        self.error = None # Exception raised by func, if any
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set() # Not paused
+        self._done_event = threading.Event()
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    def cancel(self):
+        """Requests cancellation and aborts in-flight work through the cancel callbacks."""
+        with self._lock:
+            if self._cancel_event.is_set() or self._done_event.is_set():
+                return
+            self._cancel_event.set()
+            callbacks = list(self._cancel_callbacks)
+        self._resume_event.set() # A paused job must wake up to notice the cancellation
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass # Aborting is best effort
+
+    def pause(self):
+        if not self._done_event.is_set():
+            self._resume_event.clear()
+            if self.state == "RUNNING":
+                self.state = "PAUSED"
+
+    def resume(self):
+        self._resume_event.set()
+        if self.state == "PAUSED":
+            self.state = "RUNNING"
+
+    def add_cancel_callback(self, callback):
+        """Registers callback() to run on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self._cancel_event.is_set():
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def checkpoint(self):
+        """Blocks while paused; raises JobCancelled if the job was cancelled. Call between work items."""
+        while not self._resume_event.wait(0.2):
+            pass
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout=None):
+        """Waits for the job to end. Returns True if it did."""
+        return self._done_event.wait(timeout)
+
+    def _run(self):
+        if self._cancel_event.is_set():
+            self.state = "CANCELLED" # Cancelled while still queued
+        else:
+            self.state = "PAUSED" if self.paused else "RUNNING"
+            try:
+                self.result = self.func(self, *self.args, **self.kwargs)
+                self.state = "CANCELLED" if self.cancelled else "DONE"
+            except JobCancelled:
+                self.state = "CANCELLED"
+            except Exception as e:
+                self.error = e
+                self.state = "FAILED"
+        self._done_event.set()
+        if self.on_done:
+            self.on_done(self)
+
+
+class JobController:
+    """FIFO job queue served by a fixed number of worker threads (default: one job at a time)."""
+
+    def __init__(self, workers=1):
+        self._queue = queue.Queue()
+        self._jobs = [] # Queued and running jobs, oldest first
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, name, func, *args, on_done=None, **kwargs):
+        """Queues func(job, *args, **kwargs) and returns its Job right away."""
+        job = Job(name, func, args, kwargs, on_done)
+        with self._lock:
+            self._jobs.append(job)
+        self._queue.put(job)
+        return job
+
+    def jobs(self):
+        """Returns the queued and running jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs)
+
+    def cancel_all(self):
+        for job in self.jobs():
+            job.cancel()
+
+    def pause_all(self):
+        for job in self.jobs():
+            job.pause()
+
+    def resume_all(self):
+        for job in self.jobs():
+            job.resume()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job._run()
+            finally:
+                with self._lock:
+                    if job in self._jobs:
+                        self._jobs.remove(job)
+
+
+# --- Adaptive Timeouts ---
+# (minimum, initial, maximum) timeout in seconds per command class and unit of work.
+# "batch" is per package of a batch script, the others per command.
+COMMAND_TIMEOUTS = {
+    "devices": (5, 30, 60), # adb devices
+    "pm": (5, 30, 60), # single pm uninstall / disable-user
+    "list": (10, 60, 180), # scan script: pm list packages (x3) + hash, lists sent
+    "list_hash": (5, 30, 60), # scan script answered with the unchanged hash only (timed apart; runs with the "list" timeout)
+    "batch": (5, 15, 60), # per package in a batch script (uninstall + maybe disable)
+    "dumpsys": (20, 120, 300), # dumpsys package
+}
+TIMEOUT_SAMPLES_NEEDED = 3 # Observations before the observed latency replaces the initial timeout
+
+
+class AdaptiveTimeouts:
+    """Per-command-class timeouts computed from observed latencies. Thread-safe."""
+
+    def __init__(self, limits=None):
+        self.limits = dict(COMMAND_TIMEOUTS, **(limits or {}))
+        self._stats = {} # command class -> [samples, smoothed latency, mean deviation, backoff]
+        self._lock = threading.Lock()
+
+    def timeout_for(self, command_class, units=1):
+        """Returns the timeout (seconds) for a command of this class covering the given units of work."""
+        minimum, initial, maximum = self.limits.get(command_class, COMMAND_TIMEOUTS["pm"])
+        with self._lock:
+            stats = self._stats.get(command_class)
+            if stats is None or stats[0] < TIMEOUT_SAMPLES_NEEDED:
+                per_unit = initial
+            else:
+                per_unit = min(max(stats[1] + 4 * stats[2], minimum), maximum)
+            backoff = stats[3] if stats else 1
+        return min(per_unit * backoff, maximum) * max(units, 1)
+
+    def record(self, command_class, seconds, units=1, timed_out=False):
+        """Feeds one observation. A timeout doubles the class's timeout until the next success."""
+        with self._lock:
+            stats = self._stats.setdefault(command_class, [0, 0.0, 0.0, 1])
+            if timed_out:
+                stats[3] = min(stats[3] * 2, 8)
+                return
+            sample = seconds / max(units, 1)
+            if stats[0] == 0:
+                stats[1], stats[2] = sample, sample / 2
+            else:
+                stats[2] = 0.75 * stats[2] + 0.25 * abs(stats[1] - sample)
+                stats[1] = 0.875 * stats[1] + 0.125 * sample
+            stats[0] += 1
+            stats[3] = 1
+
+    def snapshot(self):
+        """Returns {command class: current timeout for one unit}."""
+        return {command_class: round(self.timeout_for(command_class), 1) for command_class in self.limits}
@@ -0,0 +1,122 @@
+# --- Action Journal ---
+# Every uninstall/disable/restore the engine performs is appended to a JSON Lines file
+# (<app data dir>/journal/actions.jsonl), one record per action:
+#   {"time": ..., "run": <id of the apply/restore call>, "serial": ..., "package": ...,
+#    "action": "uninstall" | "disable" | "install-existing" | "enable",
+#    "result": "OK" | "FAILED" | "RESTORED" | <package status such as ERROR/CANCELLED>, "output": ...}
+# The file is only ever appended to, so it doubles as an audit log. Records written by
+# several processes (GUI and CLI on the same PC) stay intact because each is one short write.
+#
+# restore_plan() replays the journal in reverse: for every package it undoes our successful
+# actions that were not restored yet, newest first (uninstall -> 'install-existing',
+# disable -> 'enable'). The engine then runs each device's restore list as one device-side script.
+
+import json
+import os
+import threading
+import time
+import uuid
+
+JOURNAL_ACTIONS = ("uninstall", "disable", "install-existing", "enable")
+UNDO_ACTIONS = {"uninstall": "install-existing", "disable": "enable"}
+
+
+def new_run_id():
+    """Short id tying together the records of one apply/restore call."""
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+def actions_from_result(package_result):
+    """Turns one apply result (see make_package_result) into [(action, result, output)]."""
+    # What our commands reported, not what verification found afterwards: a package the device shows
+    # uninstalled/disabled although our command failed must not be undone by a restore
+    status = package_result.get("reported_status") or package_result["status"]
+    uninstall_output = package_result.get("uninstall_output", "").strip()
+    disable_output = package_result.get("disable_output", "").strip()
+    if status == "UNINSTALLED":
+        return [("uninstall", "OK", uninstall_output)]
+    if status == "DISABLED":
+        return [("uninstall", "FAILED", uninstall_output), ("disable", "OK", disable_output)]
+    if status == "FAILED":
+        return [("uninstall", "FAILED", uninstall_output), ("disable", "FAILED", disable_output)]
+    # ERROR / NO_RESULT / CANCELLED / MISMATCH: nothing is known to have changed on the device
+    return [("uninstall", status, package_result.get("message", "").strip() or uninstall_output)]
+
+
+class ActionJournal:
+    """Append-only JSON Lines journal of device actions. Thread-safe."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, records):
+        """Appends records (dicts without "time"; it is added here). Failures are ignored."""
+        if not records:
+            return
+        now = time.time()
+        lines = "".join(json.dumps(dict(record, time=now)) + "\n" for record in records)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                pass # Losing the journal must not break processing; the status log still has everything
+
+    def record_apply(self, run_id, serial, results):
+        """Journals the per-package results of one device of an apply run."""
+        self.append([{"run": run_id, "serial": serial, "package": package, "action": action, "result": result, "output": output}
+                     for package, package_result in results.items()
+                     for action, result, output in actions_from_result(package_result)])
+
+    def records(self, serials=None, run_id=None):
+        """Yields the journal records in order, optionally only for some serials / one run."""
+        try:
+            f = open(self.path, encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # A torn last line (e.g. power loss) is skipped
+                if serials and record.get("serial") not in serials:
+                    continue
+                if run_id and record.get("run") != run_id:
+                    continue
+                yield record
+
+
+def restore_plan(records, serials=None, packages=None, run_id=None):
+    """Works out what to undo. Returns {serial: [(package, restore action), ...]}, newest action first.
+
+    Only successful uninstall/disable actions that were not restored since are undone.
+    serials, packages and run_id (only undo that run's actions) narrow the plan down.
+    """
+    pending = {} # (serial, package) -> stack of (sequence number, undo action)
+    for sequence, record in enumerate(records):
+        key = (record.get("serial"), record.get("package"))
+        action, result = record.get("action"), record.get("result")
+        if action in UNDO_ACTIONS and result == "OK":
+            if run_id is None or record.get("run") == run_id:
+                pending.setdefault(key, []).append((sequence, UNDO_ACTIONS[action]))
+        elif action in UNDO_ACTIONS.values() and result == "RESTORED":
+            stack = pending.get(key, [])
+            for index in range(len(stack) - 1, -1, -1):
+                if stack[index][1] == action:
+                    del stack[index]
+                    break
+
+    steps = []
+    for (serial, package), stack in pending.items():
+        if serials and serial not in serials:
+            continue
+        if packages is not None and package not in packages:
+            continue
+        steps.extend((sequence, serial, package, action) for sequence, action in stack)
+    plan = {}
+    for _, serial, package, action in sorted(steps, reverse=True): # Reverse journal order
+        plan.setdefault(serial, []).append((package, action))
+    return plan
@@ -0,0 +1,190 @@
+# --- ADB Command Metrics ---
+# Every ADB command the engine runs is recorded with its command (devices, list, uninstall,
+# disable, batch, restore), device serial, wall time, return code (or error type) and output size.
+# Calls are aggregated on the fly into a latency histogram and counters per (command, device),
+# so memory use does not grow with the length of a run.
+#
+# The aggregate is exported to <app data dir>/metrics/ as:
+#   metrics.json: snapshot() below, for scripts and dashboards
+#   metrics.prom: Prometheus text exposition format, e.g. for node_exporter's textfile collector
+# Both files are replaced atomically. Counters start at zero when the GUI/CLI process starts.
+
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets; a final +Inf bucket is implied
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = "hyperos_adb_command"
+
+
+class _Series:
+    """Aggregated calls of one (command, device) pair."""
+
+    __slots__ = ("calls", "seconds_sum", "seconds_max", "output_bytes", "buckets", "returncodes", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds_sum = 0.0
+        self.seconds_max = 0.0
+        self.output_bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1) # Per bucket, not cumulative; last one is +Inf
+        self.returncodes = {} # Return code (as a string) -> calls
+        self.errors = {} # Error type (TIMEOUT, SESSION_DIED, ...) -> calls
+
+
+def _bucket_index(seconds):
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+
+def histogram_quantile(buckets, quantile):
+    """Estimates a quantile (0..1) from per-bucket counts by interpolating inside the bucket, like Prometheus does."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            if index == len(LATENCY_BUCKETS):
+                return LATENCY_BUCKETS[-1] # Beyond the last bound: the best we can say
+            lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+            return lower + (LATENCY_BUCKETS[index] - lower) * (rank - seen) / count
+        seen += count
+    return LATENCY_BUCKETS[-1]
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class CommandMetrics:
+    """Thread-safe latency histograms and counters of ADB commands, per command and device."""
+
+    def __init__(self):
+        self._series = {} # (command, serial) -> _Series
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, command, serial, seconds, returncode=None, output_bytes=0, error_type=None):
+        """Records one finished command. serial is "" for host-side commands such as 'adb devices'."""
+        with self._lock:
+            series = self._series.get((command, serial or ""))
+            if series is None:
+                series = self._series[(command, serial or "")] = _Series()
+            series.calls += 1
+            series.seconds_sum += seconds
+            series.seconds_max = max(series.seconds_max, seconds)
+            series.output_bytes += output_bytes
+            series.buckets[_bucket_index(seconds)] += 1
+            if error_type:
+                series.errors[error_type] = series.errors.get(error_type, 0) + 1
+            elif returncode is not None:
+                key = str(returncode)
+                series.returncodes[key] = series.returncodes.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.started = time.time()
+
+    def _copy(self):
+        """Returns a consistent list of ((command, serial), series copy), sorted."""
+        with self._lock:
+            copies = []
+            for key, series in sorted(self._series.items()):
+                copy = _Series()
+                for name in _Series.__slots__:
+                    value = getattr(series, name)
+                    setattr(copy, name, value.copy() if isinstance(value, (list, dict)) else value)
+                copies.append((key, copy))
+            return copies
+
+    def snapshot(self):
+        """Returns all series as JSON-friendly data."""
+        series_list = []
+        for (command, serial), series in self._copy():
+            series_list.append({"command": command, "device": serial, "calls": series.calls,
+                                "errors": series.errors, "returncodes": series.returncodes,
+                                "seconds_sum": round(series.seconds_sum, 6), "seconds_max": round(series.seconds_max, 6),
+                                "output_bytes": series.output_bytes,
+                                "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), series.buckets)}})
+        return {"started": self.started, "time": time.time(), "bucket_bounds": list(LATENCY_BUCKETS), "series": series_list}
+
+    def summary(self):
+        """Per-command totals over all devices (for the stats panel): list of dicts sorted by command."""
+        totals = {}
+        for (command, serial), series in self._copy():
+            total = totals.setdefault(command, {"command": command, "devices": set(), "calls": 0, "errors": 0, "failed": 0,
+                                                "seconds_sum": 0.0, "seconds_max": 0.0, "output_bytes": 0, "buckets": [0] * len(series.buckets)})
+            total["devices"].add(serial)
+            total["calls"] += series.calls
+            total["errors"] += sum(series.errors.values())
+            total["failed"] += sum(count for code, count in series.returncodes.items() if code != "0") # Non-zero exit codes
+            total["seconds_sum"] += series.seconds_sum
+            total["seconds_max"] = max(total["seconds_max"], series.seconds_max)
+            total["output_bytes"] += series.output_bytes
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], series.buckets)]
+        rows = []
+        for command, total in sorted(totals.items()):
+            rows.append({"command": command, "devices": len(total["devices"] - {""}), "calls": total["calls"],
+                         "errors": total["errors"], "failed": total["failed"],
+                         "mean_seconds": total["seconds_sum"] / total["calls"] if total["calls"] else None,
+                         # Interpolated estimates can overshoot inside a wide bucket; the max is exact
+                         "p50_seconds": min(histogram_quantile(total["buckets"], 0.5), total["seconds_max"]),
+                         "p95_seconds": min(histogram_quantile(total["buckets"], 0.95), total["seconds_max"]),
+                         "max_seconds": total["seconds_max"], "output_bytes": total["output_bytes"]})
+        return rows
+
+    def to_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format (version 0.0.4)."""
+        series_list = self._copy()
+        lines = [f"# HELP {METRIC_PREFIX}_duration_seconds Wall time of ADB commands run by the HyperOS App Manager.",
+                 f"# TYPE {METRIC_PREFIX}_duration_seconds histogram"]
+        for (command, serial), series in series_list:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), series.buckets):
+                cumulative += count
+                lines.append(f"{METRIC_PREFIX}_duration_seconds_bucket{_labels(command=command, device=serial, le=bound)} {cumulative}")
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_sum{_labels(command=command, device=serial)} {series.seconds_sum:.6f}")
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_count{_labels(command=command, device=serial)} {series.calls}")
+
+        lines += [f"# HELP {METRIC_PREFIX}_exit_total Commands that ran to completion, by exit code.",
+                  f"# TYPE {METRIC_PREFIX}_exit_total counter"]
+        for (command, serial), series in series_list:
+            for code, count in sorted(series.returncodes.items()):
+                lines.append(f"{METRIC_PREFIX}_exit_total{_labels(command=command, device=serial, code=code)} {count}")
+
+        lines += [f"# HELP {METRIC_PREFIX}_errors_total Commands that did not complete (timeout, session died, ...), by error type.",
+                  f"# TYPE {METRIC_PREFIX}_errors_total counter"]
+        for (command, serial), series in series_list:
+            for error_type, count in sorted(series.errors.items()):
+                lines.append(f"{METRIC_PREFIX}_errors_total{_labels(command=command, device=serial, type=error_type)} {count}")
+
+        lines += [f"# HELP {METRIC_PREFIX}_output_bytes_total Bytes of command output received.",
+                  f"# TYPE {METRIC_PREFIX}_output_bytes_total counter"]
+        for (command, serial), series in series_list:
+            lines.append(f"{METRIC_PREFIX}_output_bytes_total{_labels(command=command, device=serial)} {series.output_bytes}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory):
+        """Writes metrics.json and metrics.prom into directory (atomically). Returns the paths, or None on failure."""
+        paths = (os.path.join(directory, "metrics.json"), os.path.join(directory, "metrics.prom"))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for path, text in zip(paths, (json.dumps(self.snapshot(), indent=2), self.to_prometheus())):
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(temp_path, path)
+        except OSError:
+            return None # Metrics are informational; a read-only data dir must not break a run
+        return paths
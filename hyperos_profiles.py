@@ -0,0 +1,229 @@
+# --- Debloat Profiles ---
+# A profile is a named, reusable selection stored as a JSON file (e.g. "our-standard-Xiaomi",
+# "kiosk-minimal"), so the same debloat can be applied to every phone without clicking through
+# the selection buttons each time. Profiles are read from, in this order (a later file with the
+# same name replaces an earlier one):
+#   1. builtin: profiles/*.json shipped next to this file (or inside the frozen .exe)
+#   2. user:    <app data dir>/profiles/*.json
+#
+# Format:
+#   {"name": "kiosk-minimal", "description": "...",
+#    "include": [{"safety": ["SAFE"]}, {"categories": ["Facebook"]}, {"packages": ["com.example.app"]}],
+#    "exclude": [{"safety": ["RISKY"]}, {"packages": ["com.miui.gallery"]}],
+#    "include_handled": false}
+# A rule matches an app when every field it has matches (packages, safety, categories).
+# "include" and "exclude" are lists of rules (a single rule may be given without the list); an
+# app is selected when any include rule matches and no exclude rule does. Apps already
+# uninstalled or disabled on a device are left out unless "include_handled" is true.
+#
+# resolve_profiles() turns one or more profiles and a scan into the engine's plan
+# ({serial: [packages]}, each package once per device) plus what was left out and why, and
+# plan_diff() lists the result per device and package for dry runs and the GUI preview.
+
+import json
+import os
+import sys
+
+from hyperos_catalog import SAFETY_LEVELS
+from hyperos_engine import HANDLED_STATES
+
+PROFILE_EXTENSION = ".json"
+RULE_FIELDS = ("packages", "safety", "categories")
+
+# Built-in profiles location; PyInstaller unpacks bundled data files under sys._MEIPASS
+_BASE_DIR = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+BUILTIN_PROFILES_DIR = os.path.join(_BASE_DIR, "profiles")
+
+
+class ProfileError(ValueError):
+    """A profile file is missing, unreadable or invalid."""
+
+
+def _rules(value, path, key):
+    """Validates an include/exclude value and returns it as a list of {field: set} rules."""
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        raise ProfileError(f"{path}: '{key}' must be a rule or a list of rules.")
+    rules = []
+    for rule in value:
+        if not isinstance(rule, dict) or not rule:
+            raise ProfileError(f"{path}: every '{key}' rule must be a non-empty object.")
+        unknown = set(rule) - set(RULE_FIELDS)
+        if unknown:
+            raise ProfileError(f"{path}: unknown field(s) in '{key}' rule: {', '.join(sorted(unknown))} (expected {', '.join(RULE_FIELDS)}).")
+        compiled = {}
+        for field, values in rule.items():
+            if isinstance(values, str):
+                values = [values]
+            if not isinstance(values, list) or not all(isinstance(item, str) for item in values):
+                raise ProfileError(f"{path}: '{key}' rule field '{field}' must be a list of strings.")
+            if field == "safety":
+                values = [level.upper() for level in values]
+                invalid = [level for level in values if level not in SAFETY_LEVELS]
+                if invalid:
+                    raise ProfileError(f"{path}: unknown safety level(s) {', '.join(invalid)} (expected {', '.join(SAFETY_LEVELS)}).")
+            compiled[field] = set(values)
+        rules.append(compiled)
+    return rules
+
+
+def _rule_matches(rule, package, safety, category):
+    if "packages" in rule and package not in rule["packages"]:
+        return False
+    if "safety" in rule and safety not in rule["safety"]:
+        return False
+    if "categories" in rule and category not in rule["categories"]:
+        return False
+    return True
+
+
+class Profile:
+    """A named include/exclude selection, see the format above."""
+
+    def __init__(self, name, include, exclude=(), description="", include_handled=False, path=None):
+        self.name = name
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.description = description
+        self.include_handled = include_handled
+        self.path = path
+
+    @classmethod
+    def from_dict(cls, data, path="<profile>"):
+        if not isinstance(data, dict):
+            raise ProfileError(f"{path}: a profile must be a JSON object.")
+        name = data.get("name") or os.path.splitext(os.path.basename(path))[0]
+        include = _rules(data.get("include"), path, "include")
+        if not include:
+            raise ProfileError(f"{path}: the profile has no 'include' rules, so it would select nothing.")
+        return cls(str(name), include, _rules(data.get("exclude"), path, "exclude"), str(data.get("description", "")),
+                   data.get("include_handled") is True, path)
+
+    def to_dict(self):
+        """JSON-friendly form, as stored in profile files."""
+        def plain(rules):
+            return [{field: sorted(rule[field]) for field in RULE_FIELDS if field in rule} for rule in rules]
+        data = {"name": self.name, "description": self.description, "include": plain(self.include)}
+        if self.exclude:
+            data["exclude"] = plain(self.exclude)
+        if self.include_handled:
+            data["include_handled"] = True
+        return data
+
+    def matches(self, package, details):
+        """Whether the profile selects a package; details is its catalog entry (description, safety, category)."""
+        description, safety, category = details
+        return (any(_rule_matches(rule, package, safety, category) for rule in self.include)
+                and not any(_rule_matches(rule, package, safety, category) for rule in self.exclude))
+
+    def listed_packages(self):
+        """Package names the include rules name explicitly."""
+        return set().union(*(rule.get("packages", set()) for rule in self.include))
+
+
+# --- Profile Files ---
+def profile_dirs(data_dir):
+    return [BUILTIN_PROFILES_DIR, os.path.join(data_dir, "profiles")]
+
+
+def list_profiles(data_dir):
+    """Returns {profile name: path} of every profile file (file name without extension = profile name)."""
+    profiles = {}
+    for directory in profile_dirs(data_dir):
+        if os.path.isdir(directory):
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.lower().endswith(PROFILE_EXTENSION):
+                    profiles[file_name[:-len(PROFILE_EXTENSION)]] = os.path.join(directory, file_name)
+    return profiles
+
+
+def load_profile(name_or_path, data_dir):
+    """Loads a profile by name (see list_profiles) or from a file path. Raises ProfileError."""
+    path = list_profiles(data_dir).get(name_or_path)
+    if path is None:
+        if not os.path.isfile(name_or_path):
+            raise ProfileError(f"No profile named {name_or_path!r} (see 'hyperos_cli.py profiles') and no such file.")
+        path = name_or_path
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ProfileError(f"{path}: could not be read ({e}).")
+    return Profile.from_dict(data, path)
+
+
+def save_profile(profile, data_dir):
+    """Writes a profile to <app data dir>/profiles/<name>.json and returns the path."""
+    file_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in profile.name).strip(".") or "profile"
+    directory = os.path.join(data_dir, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, file_name + PROFILE_EXTENSION)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    profile.path = path
+    return path
+
+
+# --- Planner ---
+def resolve_profiles(profiles, scan_result, catalog, serials=None):
+    """Resolves profiles against a scan into a deduplicated per-device plan.
+
+    Returns {"plan": {serial: [packages]}, "already_handled": {serial: [packages]},
+    "not_installed": {serial: [packages]}}: the packages to process, the selected ones skipped
+    because they are already uninstalled/disabled there, and the ones a profile names explicitly
+    that the device does not have (or that the catalog does not know).
+    """
+    profiles = list(profiles)
+    listed = set().union(*(profile.listed_packages() for profile in profiles)) if profiles else set()
+    plan, already_handled, not_installed = {}, {}, {}
+    for serial, found in sorted(scan_result["devices"].items()):
+        if serials and serial not in serials:
+            continue
+        states = scan_result.get("states", {}).get(serial, {})
+        selected, handled = [], []
+        for package in sorted(found):
+            details = catalog.lookup(package)
+            if details is None:
+                continue
+            matching = [profile for profile in profiles if profile.matches(package, details)]
+            if not matching:
+                continue
+            if states.get(package) in HANDLED_STATES and not any(profile.include_handled for profile in matching):
+                handled.append(package)
+            else:
+                selected.append(package)
+        if selected:
+            plan[serial] = selected
+        if handled:
+            already_handled[serial] = handled
+        missing = sorted(listed - set(found))
+        if missing:
+            not_installed[serial] = missing
+    return {"plan": plan, "already_handled": already_handled, "not_installed": not_installed}
+
+
+def plan_diff(resolution, scan_result, catalog):
+    """Lists a resolution per device and package: what would change and what is left as it is.
+
+    Returns {serial: [{"package", "safety", "category", "state", "change"}]} where change is
+    "uninstall" (the engine disables the app if uninstalling fails), "already uninstalled",
+    "already disabled" or "not installed".
+    """
+    diff = {}
+    for key in ("plan", "already_handled", "not_installed"):
+        for serial, packages in resolution[key].items():
+            states = scan_result.get("states", {}).get(serial, {})
+            for package in packages:
+                description, safety, category = catalog.lookup(package) or ("", "", "")
+                state = states.get(package)
+                if key == "plan":
+                    change = "uninstall"
+                elif key == "already_handled":
+                    change = "already " + state.lower()
+                else:
+                    change = "not installed"
+                diff.setdefault(serial, []).append({"package": package, "safety": safety, "category": category, "state": state, "change": change})
+    return {serial: sorted(rows, key=lambda row: row["package"]) for serial, rows in sorted(diff.items())}
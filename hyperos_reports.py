@@ -0,0 +1,128 @@
+# --- Run Reports ---
+# Machine-readable outcome of every scan, apply and restore run, for audit and ticketing
+# pipelines (the status log is meant for people). One record per device and package and step:
+#   {"time": ..., "run": <run id>, "kind": "scan" | "apply" | "verify" | "restore", "device": serial,
+#    "package": ..., "safety": ..., "category": ...,
+#    "action": what was attempted ("uninstall", "uninstall,disable", "install-existing", "enable", "" for scans),
+#    "status": FOUND / SKIPPED / SCAN_FAILED (scan), an apply status as the command reported it (apply;
+#              see make_package_result in hyperos_engine.py), the status after verification (verify)
+#              or RESTORED / FAILED / ... (restore),
+#    "final_state": ENABLED / DISABLED / UNINSTALLED / ABSENT as last seen on the device ("" if unknown),
+#    "verification": see "Post-run Verification" in hyperos_engine.py (verify records only),
+#    "duration_s": seconds spent on this package (scans: on the whole device),
+#    "output": the device's output, cut to REPORT_OUTPUT_CHARS}
+# Apply records are written the moment each package's result arrives (in batch mode, as its line
+# streams in from the device script); a retried package gets a second apply record. Once a device
+# is processed, its package states are read back and one verify record per package follows.
+# Scan and restore records are written as each device finishes. Nothing is kept in memory and the
+# file is flushed after every write, so a crash loses at most the packages in flight.
+# The file is JSON Lines, or CSV (REPORT_FIELDS as columns, header written once) when its name
+# ends with .csv.
+
+import csv
+import json
+import os
+import threading
+import time
+
+REPORT_FIELDS = ("time", "run", "kind", "device", "package", "safety", "category", "action", "status", "final_state", "verification", "duration_s", "output")
+REPORT_OUTPUT_CHARS = 300 # Longer outputs are cut; the status log and the journal have them in full
+
+
+def _excerpt(*outputs):
+    text = " | ".join(output.strip() for output in outputs if output and output.strip())
+    return text if len(text) <= REPORT_OUTPUT_CHARS else text[:REPORT_OUTPUT_CHARS - 3] + "..."
+
+
+def _details(catalog, package):
+    details = catalog.lookup(package) if catalog is not None and package else None
+    return details or ("", "", "")
+
+
+def scan_records(run_id, serial, found, states, duration, catalog):
+    """Records of one device's scan: the catalog apps found and their state. found None: the scan failed."""
+    if found is None:
+        return [{"run": run_id, "kind": "scan", "device": serial, "package": "", "status": "SCAN_FAILED", "duration_s": round(duration, 4)}]
+    records = []
+    for package in sorted(found):
+        _, safety, category = _details(catalog, package)
+        records.append({"run": run_id, "kind": "scan", "device": serial, "package": package, "safety": safety, "category": category,
+                        "status": "FOUND", "final_state": states.get(package, ""), "duration_s": round(duration, 4)})
+    return records
+
+
+def apply_records(run_id, serial, results, catalog):
+    """Records of one device's apply results (see make_package_result in hyperos_engine.py)."""
+    records = []
+    for package, result in results.items():
+        _, safety, category = _details(catalog, package)
+        status = result["status"]
+        action = "" if status == "CANCELLED" else ("uninstall,disable" if result.get("disable_output") else "uninstall")
+        final_state = status if status in ("UNINSTALLED", "DISABLED") else ""
+        records.append({"run": run_id, "kind": "apply", "device": serial, "package": package, "safety": safety, "category": category,
+                        "action": action, "status": status, "final_state": final_state, "duration_s": result.get("duration", ""),
+                        "output": _excerpt(result.get("uninstall_output"), result.get("disable_output"), result.get("message"))})
+    return records
+
+
+def verify_records(run_id, serial, results, catalog):
+    """Records of one device's verification: the state read back and how it compares (see reconcile_results)."""
+    records = []
+    for package, result in results.items():
+        _, safety, category = _details(catalog, package)
+        records.append({"run": run_id, "kind": "verify", "device": serial, "package": package, "safety": safety, "category": category,
+                        "status": result["status"], "final_state": result.get("device_state", ""), "verification": result["verification"],
+                        "output": _excerpt(result.get("message")) if result["verification"] != "VERIFIED" else ""})
+    return records
+
+
+def restore_records(run_id, serial, steps, catalog):
+    """Records of one device's restore: steps are (package, action, status, output) in execution order."""
+    records = []
+    for package, action, status, output in steps:
+        _, safety, category = _details(catalog, package)
+        records.append({"run": run_id, "kind": "restore", "device": serial, "package": package, "safety": safety, "category": category,
+                        "action": action, "status": status, "final_state": "ENABLED" if status == "RESTORED" else "", "output": _excerpt(output)})
+    return records
+
+
+class RunReport:
+    """Appends run records to a JSON Lines or CSV file. Thread-safe; every write is flushed at once."""
+
+    def __init__(self, path):
+        self.path = path
+        self.csv = path.lower().endswith(".csv")
+        self.records = 0
+        self._file = None # Opened on the first write, and again after close()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def write(self, records):
+        """Appends records (dicts with some of REPORT_FIELDS; "time" is added here). Failures are ignored."""
+        if not records:
+            return
+        now = round(time.time(), 3)
+        rows = [dict({field: "" for field in REPORT_FIELDS}, **record, time=now) for record in records]
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8", newline="")
+                    if self.csv:
+                        self._writer = csv.DictWriter(self._file, REPORT_FIELDS, extrasaction="ignore")
+                        if self._file.tell() == 0: # New or empty file
+                            self._writer.writeheader()
+                if self.csv:
+                    self._writer.writerows(rows)
+                else:
+                    self._file.write("".join(json.dumps(row) + "\n" for row in rows))
+                self._file.flush()
+                self.records += len(rows)
+            except OSError:
+                pass # Losing the report must not break a run; the status log and the journal still have everything
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = self._writer = None
@@ -0,0 +1,121 @@
+# --- Incremental Package Search ---
+# The search box above the app list matches what is typed against the package name, the
+# description and the category of every scanned app. A SearchIndex is built once per scan
+# (in the scan worker thread), so a keystroke only touches precomputed lowercase tokens:
+#   - text is split into tokens at everything that is not a letter or digit
+#     ("com.facebook.katana" -> com, facebook, katana), the query the same way;
+#   - every query term must match (AND). A term matches a token exactly, as a prefix, as a
+#     substring, or fuzzily (its letters appear in order, e.g. "fbk" -> "facebook");
+#   - results are ranked by how well and where the terms matched (package name above
+#     category above description), then alphabetically.
+# Typing narrows incrementally: the tokens matched for "face" are the only candidates for
+# "faceb", so each keystroke scans fewer tokens than the one before.
+
+import re
+
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+
+# Score of a term per kind of match, and bonus per field the matching token came from
+MATCH_SCORES = {"exact": 100, "prefix": 60, "substring": 30, "fuzzy": 10}
+FIELD_BONUS = {"package": 20, "category": 10, "description": 0}
+FUZZY_MIN_LENGTH = 3 # Shorter terms match too much when their letters may be spread out
+TERM_CACHE_SIZE = 256
+LOOKUP_PACKAGES_FACTOR = 10 # Match later terms against the remaining packages' tokens below 1/10 of the vocabulary
+
+
+def tokenize(text):
+    """Lowercase tokens of text, in order, without empty strings."""
+    return [token for token in _TOKEN_SPLIT.split(text.lower()) if token]
+
+
+def _is_subsequence(term, token):
+    letters = iter(token)
+    return all(letter in letters for letter in term)
+
+
+def _match_kind(term, token, fuzzy):
+    """How term matches token: "exact", "prefix", "substring", "fuzzy" or None."""
+    if token.startswith(term):
+        return "exact" if token == term else "prefix"
+    if term in token:
+        return "substring"
+    if fuzzy and len(token) > len(term) and _is_subsequence(term, token):
+        return "fuzzy"
+    return None
+
+
+class SearchIndex:
+    """Token index over {package: (description, safety, category)} for ranked incremental search."""
+
+    def __init__(self, entries):
+        self._postings = {} # token -> {package: best field bonus}
+        self._package_tokens = {} # package -> {token: best field bonus}, the same data the other way round
+        for package, (description, safety, category) in entries.items():
+            tokens = self._package_tokens[package] = {}
+            for field, text in (("package", package), ("category", category), ("description", description)):
+                bonus = FIELD_BONUS[field]
+                for token in tokenize(text):
+                    if tokens.get(token, -1) < bonus:
+                        tokens[token] = bonus
+                        self._postings.setdefault(token, {})[package] = bonus
+        self._tokens = list(self._postings)
+        self._term_cache = {} # term -> {token: match kind}, see _match_tokens
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _match_tokens(self, term):
+        """Returns {token: match kind} for every indexed token the term matches."""
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+        # Narrow from the longest cached prefix of the term: every token matching "faceb" also matched "face"
+        # (not from a prefix too short for fuzzy matching when this term is long enough for it)
+        fuzzy = len(term) >= FUZZY_MIN_LENGTH
+        candidates = None
+        for length in range(len(term) - 1, FUZZY_MIN_LENGTH - 1 if fuzzy else 0, -1):
+            previous = self._term_cache.get(term[:length])
+            if previous is not None:
+                candidates = previous
+                break
+        if candidates is None:
+            candidates = self._tokens
+        matches = {}
+        for token in candidates:
+            kind = _match_kind(term, token, fuzzy)
+            if kind:
+                matches[token] = kind
+        if len(self._term_cache) >= TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        self._term_cache[term] = matches
+        return matches
+
+    def search(self, query):
+        """Returns the packages matching every term of query, best first; None if the query has no terms."""
+        terms = tokenize(query)
+        if not terms:
+            return None
+        scores = None
+        for term in dict.fromkeys(terms): # Each distinct term once, in order
+            term_scores = {}
+            if scores is not None and len(scores) * LOOKUP_PACKAGES_FACTOR < len(self._tokens):
+                # Few packages left: checking their own tokens is cheaper than matching the whole vocabulary
+                fuzzy = len(term) >= FUZZY_MIN_LENGTH
+                for package in scores:
+                    for token, bonus in self._package_tokens[package].items():
+                        kind = _match_kind(term, token, fuzzy)
+                        if kind and term_scores.get(package, -1) < MATCH_SCORES[kind] + bonus:
+                            term_scores[package] = MATCH_SCORES[kind] + bonus
+            else:
+                for token, kind in self._match_tokens(term).items():
+                    score = MATCH_SCORES[kind]
+                    for package, bonus in self._postings[token].items():
+                        if term_scores.get(package, -1) < score + bonus:
+                            term_scores[package] = score + bonus
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {package: score + term_scores[package] for package, score in scores.items() if package in term_scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda package: (-scores[package], package))
@@ -0,0 +1,249 @@
+# --- ADB Transcripts: Record and Replay ---
+# A transcript is every ADB command of a run and what it answered, so the engine, the CLI and
+# the GUI can later run against the captured phones without any phone attached: to reproduce a
+# field issue, to profile scans and processing, or as a regression corpus of HyperOS/MIUI builds.
+#
+# Format: JSON Lines (gzip-compressed when the file name ends with .gz), one header line
+#   {"transcript": 1, "recorded_at": ..., "transport": "subprocess"}
+# then one record per command, in the order they finished:
+#   {"serial": "ABC123" | null (adb devices), "command": ["sh", "-c", "..."],
+#    "at": seconds since the recording started, "elapsed": seconds,
+#    "returncode": 0, "output": "...", "times": [ms after the start of the command, per output line],
+#    "stopped": true (stop_when ended it early), "error": {"type", "message"} (failed commands)}
+# "times" is only recorded for streamed commands; other commands replay their output at once.
+# Appending to an existing transcript adds a new header and its records (several runs in one file).
+#
+# Replay looks up each command by device serial and exact command line, in recorded order (a
+# command issued again after its last recording gets that last answer again), and plays its
+# output back with the recorded timing multiplied by time_scale (1: as recorded, 0: at once).
+# Commands the transcript does not have fail with type REPLAY_MISMATCH.
+
+import gzip
+import json
+import threading
+import time
+
+TRANSCRIPT_FORMAT = 1 # Bump when the record layout changes
+DEVICES_COMMAND = ["devices"] # How 'adb devices' (serial null) is stored
+
+
+def _open(path, mode):
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TranscriptError(ValueError):
+    """A transcript file is missing, unreadable or not a transcript."""
+
+
+# --- Recording ---
+class TranscriptRecorder:
+    """Appends command records to a transcript file. Thread-safe; every record is flushed at once."""
+
+    def __init__(self, path, transport="subprocess"):
+        self.path = path
+        self.transport = transport
+        self.records = 0
+        self._file = None # Opened on the first record, and again after close()
+        self._header_written = False
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def record(self, serial, command, result, started, elapsed, times=None, lines=None):
+        """Writes one command's record. lines: the output lines seen by on_line when the command was streamed."""
+        if result.get("error"):
+            output = result.get("stdout_on_timeout") or ""
+        else:
+            output = result.get("stdout") or ""
+        if lines is not None and not output:
+            output = "".join(line + "\n" for line in lines) # keep_output=False: only the streamed lines exist
+        entry = {"serial": serial, "command": list(command), "at": round(started - self._started, 4), "elapsed": round(elapsed, 4),
+                 "returncode": result.get("returncode"), "output": output}
+        if times is not None:
+            entry["times"] = times
+        if result.get("stopped"):
+            entry["stopped"] = True
+        if result.get("error"):
+            entry["error"] = {"type": result.get("type"), "message": result.get("message", "")}
+        text = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = _open(self.path, "a")
+            if not self._header_written:
+                self._file.write(json.dumps({"transcript": TRANSCRIPT_FORMAT, "recorded_at": time.time(), "transport": self.transport}) + "\n")
+                self._header_written = True
+            self._file.write(text)
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingSession:
+    """Wraps a device session (AdbShellSession, AdbSocketTransport) and records every command it runs."""
+
+    def __init__(self, session, recorder):
+        self.session = session
+        self.serial = session.serial
+        self.recorder = recorder
+
+    def run_adb_command(self, command, package_name="N/A", step_desc="execute command", timeout=60, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+        started = time.monotonic()
+        times = lines = None
+        streamed = on_line is not None or idle_timeout is not None or stop_when is not None or not keep_output
+        if streamed:
+            times, lines = [], []
+            caller_on_line = on_line
+            def on_line(line):
+                times.append(round((time.monotonic() - started) * 1000))
+                lines.append(line)
+                if caller_on_line is not None:
+                    caller_on_line(line)
+        result = self.session.run_adb_command(command, package_name, step_desc, timeout=timeout, on_line=on_line,
+                                              idle_timeout=idle_timeout, stop_when=stop_when, keep_output=keep_output)
+        self.recorder.record(self.serial, command, result, started, time.monotonic() - started, times, lines)
+        return result
+
+    def close(self, *args, **kwargs):
+        return self.session.close(*args, **kwargs)
+
+    def abort(self):
+        return self.session.abort()
+
+
+# --- Replay ---
+class Transcript:
+    """The records of a transcript file, looked up per device serial and command line."""
+
+    def __init__(self, records, path=None):
+        self.path = path
+        self._records = {} # serial -> [record], in recorded order
+        self._positions = {} # serial -> index of the next record to consider
+        self._lock = threading.Lock()
+        for record in records:
+            self._records.setdefault(record.get("serial"), []).append(record)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a transcript file (see the format above). Raises TranscriptError."""
+        records = []
+        headers = 0
+        try:
+            with _open(path, "r") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "transcript" in entry:
+                        if entry["transcript"] != TRANSCRIPT_FORMAT:
+                            raise TranscriptError(f"{path}: line {number} is transcript format {entry['transcript']}, expected {TRANSCRIPT_FORMAT}.")
+                        headers += 1
+                    elif "command" in entry:
+                        records.append(entry)
+        except (OSError, ValueError, EOFError) as e:
+            if isinstance(e, TranscriptError):
+                raise
+            raise TranscriptError(f"{path}: could not be read ({e}).")
+        if not headers:
+            raise TranscriptError(f"{path}: not an ADB transcript (no header line).")
+        return cls(records, path)
+
+    @property
+    def serials(self):
+        return sorted(serial for serial in self._records if serial is not None)
+
+    def next_record(self, serial, command):
+        """Returns the record answering command on serial, or None (see the lookup rules above)."""
+        command = list(command)
+        with self._lock:
+            records = self._records.get(serial, [])
+            position = self._positions.get(serial, 0)
+            for index in range(position, len(records)):
+                if records[index]["command"] == command:
+                    self._positions[serial] = index + 1
+                    return records[index]
+            for index in range(position - 1, -1, -1):
+                if records[index]["command"] == command:
+                    return records[index]
+        return None
+
+    def rewind(self):
+        """Starts every device over at its first record."""
+        with self._lock:
+            self._positions.clear()
+
+
+def _mismatch(serial, step_desc, package_name):
+    return {"error": True, "type": "REPLAY_MISMATCH", "message": f"  Error: the transcript has no recorded answer for this command on {serial or 'adb'} while trying to {step_desc} {package_name}.\n"}
+
+
+class ReplaySession:
+    """Stands in for a device session, answering commands from a Transcript with the recorded timing."""
+
+    def __init__(self, transcript, serial=None, time_scale=1.0):
+        self.transcript = transcript
+        self.serial = serial
+        self.time_scale = time_scale
+        self._aborted = threading.Event()
+
+    def _wait_until(self, moment):
+        """Sleeps until a monotonic moment; returns False if aborted in between."""
+        remaining = moment - time.monotonic()
+        if remaining > 0:
+            return not self._aborted.wait(remaining)
+        return not self._aborted.is_set()
+
+    def run_adb_command(self, command, package_name="N/A", step_desc="execute command", timeout=60, on_line=None, idle_timeout=None, stop_when=None, keep_output=True):
+        """Same arguments and result dict as AdbShellSession.run_adb_command."""
+        self._aborted.clear()
+        record = self.transcript.next_record(self.serial, command)
+        if record is None:
+            return _mismatch(self.serial, step_desc, package_name)
+        started = time.monotonic()
+        deadline = started + timeout
+        scale = self.time_scale
+        lines = record["output"].splitlines(True)
+        times = record.get("times") or [record["elapsed"] * 1000] * len(lines)
+        output = []
+        last = started
+        for line, offset in zip(lines, times):
+            due = started + offset / 1000 * scale
+            if due > deadline or (idle_timeout is not None and due - last > idle_timeout):
+                idle = due <= deadline
+                self._wait_until(min(deadline, last + idle_timeout) if idle else deadline)
+                return {"error": True, "type": "IDLE_TIMEOUT" if idle else "TIMEOUT",
+                        "message": f"  Error: ADB command {'stopped producing output' if idle else 'timed out'} while trying to {step_desc} {package_name} (replayed).\n",
+                        "stdout_on_timeout": "".join(output)}
+            if not self._wait_until(due):
+                return {"error": True, "type": "SESSION_DIED", "message": f"  Error: ADB shell session ended while trying to {step_desc} {package_name} (replay aborted).\n", "stdout_on_timeout": "".join(output)}
+            last = due
+            if keep_output:
+                output.append(line)
+            text = line.rstrip("\r\n")
+            if on_line is not None:
+                on_line(text)
+            if stop_when is not None and stop_when(text):
+                return {"error": False, "returncode": None, "stdout": "".join(output), "stderr": "", "stopped": True}
+        if not self._wait_until(min(deadline, started + record["elapsed"] * scale)):
+            return {"error": True, "type": "SESSION_DIED", "message": f"  Error: ADB shell session ended while trying to {step_desc} {package_name} (replay aborted).\n", "stdout_on_timeout": "".join(output)}
+        if record.get("error"):
+            return {"error": True, "type": record["error"]["type"], "message": record["error"]["message"], "stdout_on_timeout": "".join(output)}
+        return {"error": False, "returncode": record.get("returncode"), "stdout": "".join(output), "stderr": ""}
+
+    def list_devices(self):
+        """Replays 'adb devices' (the session of serial None)."""
+        result = self.run_adb_command(DEVICES_COMMAND, step_desc="check connection")
+        if not result.get("error"):
+            result["stdout"] = result["stdout"] or "List of devices attached\n"
+        return result
+
+    def close(self, kill=False):
+        pass
+
+    def abort(self):
+        self._aborted.set()